@@ -9,17 +9,16 @@ export async function GET(request: Request) {
   const city = searchParams.get('city');
 
   try {
-    // Get popular dishes based on frequency in menus
+    // Popularity per (city, slug) is precomputed by the scraper (DishPopularity);
+    // only the cheapest dish of each selected row is loaded for display.
+    const popular = await prisma.dishPopularity.findMany({
+      where: city ? { city: { contains: city, mode: 'insensitive' } } : undefined,
+      orderBy: [{ menuCount: 'desc' }, { minPriceCents: 'asc' }],
+      take: limit * 3, // the same slug can rank in several matching cities
+    });
+
     const dishes = await prisma.dish.findMany({
-      where: {
-        menu: {
-          status: 'APPROVED',
-          restaurant: city ? { 
-            city: { contains: city, mode: 'insensitive' } 
-          } : undefined,
-        },
-        priceCents: { not: null }, // Only include dishes with prices
-      },
+      where: { id: { in: popular.map((p) => p.cheapestDishId) } },
       include: {
         menu: {
           include: {
@@ -29,40 +28,34 @@ export async function GET(request: Request) {
           },
         },
       },
-      orderBy: [
-        { name: 'asc' }, // Secondary sort by name for consistency
-      ],
-      take: limit,
     });
+    const dishById = new Map(dishes.map((d) => [d.id, d]));
 
-    // Group by dish name and get the cheapest variant of each
-    const dishMap = new Map();
-    
-    dishes.forEach(dish => {
-      const key = dish.name.toLowerCase();
-      if (!dishMap.has(key) || (dish.priceCents && dishMap.get(key).priceCents > dish.priceCents)) {
-        dishMap.set(key, {
-          id: dish.id,
-          name: dish.name,
-          slug: dish.slug,
-          description: dish.description,
-          price_cents: dish.priceCents,
-          section: dish.section,
-          tags: dish.tags,
-          restaurant: {
-            id: dish.menu.restaurant.id,
-            name: dish.menu.restaurant.name,
-            slug: dish.menu.restaurant.slug,
-            city: dish.menu.restaurant.city,
-            address: dish.menu.restaurant.address,
-          },
-        });
-      }
-    });
-
-    const result = Array.from(dishMap.values())
-      .sort((a, b) => (a.price_cents || 0) - (b.price_cents || 0))
-      .slice(0, limit);
+    // Keep the best-ranked row per slug
+    const seen = new Set<string>();
+    const result = [];
+    for (const p of popular) {
+      const dish = dishById.get(p.cheapestDishId);
+      if (!dish || seen.has(p.slug)) continue;
+      seen.add(p.slug);
+      result.push({
+        id: dish.id,
+        name: dish.name,
+        slug: dish.slug,
+        description: dish.description,
+        price_cents: dish.priceCents,
+        section: dish.section,
+        tags: dish.tags,
+        restaurant: {
+          id: dish.menu.restaurant.id,
+          name: dish.menu.restaurant.name,
+          slug: dish.menu.restaurant.slug,
+          city: dish.menu.restaurant.city,
+          address: dish.menu.restaurant.address,
+        },
+      });
+      if (result.length >= limit) break;
+    }
 
     return NextResponse.json(result);
   } catch (error) {
@@ -5,33 +5,23 @@ export const dynamic = 'force-dynamic';
 
 export async function GET() {
   try {
-    const [
-      totalRestaurants,
-      totalDishes,
-      totalCities,
-      avgPrice
-    ] = await Promise.all([
-      prisma.restaurant.count({
-        where: { verified: true }
-      }),
-      prisma.dish.count({
-        where: {
-          menu: { status: 'APPROVED' }
-        }
-      }),
-      prisma.restaurant.findMany({
-        where: { verified: true },
-        select: { city: true },
-        distinct: ['city']
-      }).then(cities => cities.length),
-      prisma.dish.aggregate({
-        where: {
-          menu: { status: 'APPROVED' },
-          priceCents: { not: null }
-        },
-        _avg: { priceCents: true }
-      }).then(result => result._avg.priceCents || 0)
-    ]);
+    // Per-city totals are precomputed by the scraper (CityStats), so this reads
+    // one row per city instead of counting Restaurant/Dish on every request.
+    const rows = await prisma.cityStats.findMany();
+
+    let totalRestaurants = 0;
+    let totalDishes = 0;
+    let totalCities = 0;
+    let pricedDishes = 0;
+    let priceSumCents = 0;
+    for (const row of rows) {
+      totalRestaurants += row.verifiedRestaurants;
+      totalDishes += row.approvedDishes;
+      if (row.verifiedRestaurants > 0) totalCities += 1;
+      pricedDishes += row.pricedDishes;
+      priceSumCents += Number(row.priceSumCents);
+    }
+    const avgPrice = pricedDishes > 0 ? priceSumCents / pricedDishes : 0;
 
     return NextResponse.json({
       restaurants: totalRestaurants,
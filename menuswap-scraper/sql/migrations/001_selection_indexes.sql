@@ -0,0 +1,146 @@
+-- Indexes backing the scraper's selection and upsert queries.
+--
+-- Index names follow Prisma's conventions and prisma/schema.prisma declares
+-- the non-partial ones. Prisma cannot express the partial indexes, so
+-- `prisma db push` would drop them (see README-SCRAPE.md).
+-- Each statement runs on its own (see src/migrate.py) because CREATE INDEX
+-- CONCURRENTLY cannot run inside a transaction block.
+
+-- Collapse duplicate (menuId, slug) dishes so the unique index can be built.
+-- Favorites pointing at a duplicate are moved to the surviving row first,
+-- except those that would give a user the same dish twice.
+with ranked as (
+  select id, first_value(id) over (partition by "menuId", slug order by "createdAt", id) as keep_id
+  from "Dish"
+),
+moved as (
+  select f.id,
+         row_number() over (partition by f."userId", r.keep_id order by f."createdAt", f.id) as rn,
+         exists (
+           select 1 from "Favorite" k where k."userId" = f."userId" and k."dishId" = r.keep_id
+         ) as kept
+  from "Favorite" f
+  join ranked r on r.id = f."dishId" and r.id <> r.keep_id
+)
+delete from "Favorite" f
+using moved m
+where f.id = m.id and (m.kept or m.rn > 1);
+
+with ranked as (
+  select id, first_value(id) over (partition by "menuId", slug order by "createdAt", id) as keep_id
+  from "Dish"
+)
+update "Favorite" f
+set "dishId" = r.keep_id
+from ranked r
+where f."dishId" = r.id and r.id <> r.keep_id;
+
+with ranked as (
+  select id, row_number() over (partition by "menuId", slug order by "createdAt", id) as rn
+  from "Dish"
+)
+delete from "Dish" d
+using ranked r
+where d.id = r.id and r.rn > 1;
+
+-- Collapse duplicate (restaurantId, sourceUrl) menus. Dishes of a duplicate
+-- menu move to the surviving menu unless it already has the slug (one dish per
+-- slug when several duplicates carry it); then
+-- their favorites move to the surviving dish, dropping repeats as above.
+with ranked as (
+  select id, first_value(id) over (partition by "restaurantId", "sourceUrl" order by "uploadedAt", id) as keep_id
+  from "Menu"
+  where "sourceUrl" is not null
+),
+movable as (
+  select d.id, r.keep_id,
+         row_number() over (partition by r.keep_id, d.slug order by d."createdAt", d.id) as rn
+  from "Dish" d
+  join ranked r on r.id = d."menuId" and r.id <> r.keep_id
+  where not exists (
+    select 1 from "Dish" k where k."menuId" = r.keep_id and k.slug = d.slug
+  )
+)
+update "Dish" d
+set "menuId" = m.keep_id
+from movable m
+where d.id = m.id and m.rn = 1;
+
+with ranked as (
+  select id, first_value(id) over (partition by "restaurantId", "sourceUrl" order by "uploadedAt", id) as keep_id
+  from "Menu"
+  where "sourceUrl" is not null
+),
+moved as (
+  select f.id,
+         row_number() over (partition by f."userId", k.id order by f."createdAt", f.id) as rn,
+         exists (
+           select 1 from "Favorite" o where o."userId" = f."userId" and o."dishId" = k.id
+         ) as kept
+  from "Favorite" f
+  join "Dish" d on d.id = f."dishId"
+  join ranked r on r.id = d."menuId" and r.id <> r.keep_id
+  join "Dish" k on k."menuId" = r.keep_id and k.slug = d.slug
+)
+delete from "Favorite" f
+using moved m
+where f.id = m.id and (m.kept or m.rn > 1);
+
+with ranked as (
+  select id, first_value(id) over (partition by "restaurantId", "sourceUrl" order by "uploadedAt", id) as keep_id
+  from "Menu"
+  where "sourceUrl" is not null
+)
+update "Favorite" f
+set "dishId" = k.id
+from "Dish" d, ranked r, "Dish" k
+where f."dishId" = d.id
+  and d."menuId" = r.id
+  and r.id <> r.keep_id
+  and k."menuId" = r.keep_id
+  and k.slug = d.slug;
+
+with ranked as (
+  select id, row_number() over (partition by "restaurantId", "sourceUrl" order by "uploadedAt", id) as rn
+  from "Menu"
+  where "sourceUrl" is not null
+)
+delete from "Dish" d
+using ranked r
+where d."menuId" = r.id and r.rn > 1;
+
+with ranked as (
+  select id, row_number() over (partition by "restaurantId", "sourceUrl" order by "uploadedAt", id) as rn
+  from "Menu"
+  where "sourceUrl" is not null
+)
+delete from "Menu" m
+using ranked r
+where m.id = r.id and r.rn > 1;
+
+-- upsert_dish: lookup by (menuId, slug); also serves the NOT EXISTS probe in
+-- select_menus_without_dishes through its leading "menuId" column.
+create unique index concurrently if not exists "Dish_menuId_slug_key"
+  on "Dish" ("menuId", slug);
+
+-- ensure_menu_for_source: lookup by (restaurantId, sourceUrl).
+create unique index concurrently if not exists "Menu_restaurantId_sourceUrl_key"
+  on "Menu" ("restaurantId", "sourceUrl");
+
+-- select_menus_needing_download: menus with a source but no checksum yet,
+-- already in "uploadedAt" order.
+create index concurrently if not exists "Menu_pending_download_idx"
+  on "Menu" ("uploadedAt")
+  where "sourceUrl" is not null and ("checksum" is null or "checksum" = '');
+
+-- select_menus_without_dishes: a partial index cannot express NOT EXISTS, so it
+-- covers the candidate HTML menus in "uploadedAt" order and the anti-join
+-- probes "Dish_menuId_slug_key" per candidate.
+create index concurrently if not exists "Menu_html_source_idx"
+  on "Menu" ("uploadedAt", id)
+  where "sourceUrl" is not null and "sourceType" = 'URL';
+
+-- select_restaurants_needing_crawl / select_restaurants_with_websites.
+create index concurrently if not exists "Restaurant_with_website_idx"
+  on "Restaurant" (id)
+  where "websiteUrl" is not null and "websiteUrl" <> '';
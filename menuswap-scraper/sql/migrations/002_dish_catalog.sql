@@ -0,0 +1,30 @@
+-- Global dish catalog: clusters spelling variants of the same dish across menus
+-- ("Biefstuk met friet", "Biefstukje + friet", "BIEFSTUK friet").
+-- Filled incrementally by src/dish_catalog.py.
+
+create table if not exists "CanonicalDish" (
+  id uuid primary key default gen_random_uuid(),
+  name text not null,
+  slug text not null,
+  "normName" text not null,
+  "blockKey" text not null,
+  "dishCount" integer not null default 0,
+  "createdAt" timestamp(3) not null default now(),
+  "updatedAt" timestamp(3) not null default now()
+);
+
+create unique index if not exists "CanonicalDish_slug_key"
+  on "CanonicalDish" (slug);
+
+create index if not exists "CanonicalDish_blockKey_idx"
+  on "CanonicalDish" ("blockKey");
+
+create table if not exists "DishCanonical" (
+  "dishId" uuid primary key references "Dish"(id) on delete cascade,
+  "canonicalId" uuid not null references "CanonicalDish"(id) on delete cascade,
+  score real not null,
+  "createdAt" timestamp(3) not null default now()
+);
+
+create index if not exists "DishCanonical_canonicalId_idx"
+  on "DishCanonical" ("canonicalId");
@@ -0,0 +1,51 @@
+-- Precomputed aggregates read by app/api/stats and app/api/dishes/popular.
+-- Refreshed by src/aggregates.py for the cities, slugs and sections touched by
+-- a scrape run. Figures cover verified restaurants and APPROVED menus, matching
+-- what the endpoints expose.
+
+create table if not exists "CityStats" (
+  city text primary key,
+  "verifiedRestaurants" integer not null default 0,
+  "approvedMenus" integer not null default 0,
+  "approvedDishes" integer not null default 0,
+  "pricedDishes" integer not null default 0,
+  "priceSumCents" bigint not null default 0,
+  "updatedAt" timestamp(3) not null default now()
+);
+
+create table if not exists "DishPopularity" (
+  city text not null,
+  slug text not null,
+  name text not null,
+  "menuCount" integer not null,
+  "restaurantCount" integer not null,
+  "minPriceCents" integer not null,
+  "medianPriceCents" integer not null,
+  "cheapestDishId" uuid not null,
+  "updatedAt" timestamp(3) not null default now(),
+  primary key (city, slug)
+);
+
+create index if not exists "DishPopularity_city_menuCount_idx"
+  on "DishPopularity" (city, "menuCount" desc);
+
+create index if not exists "DishPopularity_menuCount_idx"
+  on "DishPopularity" ("menuCount" desc);
+
+create table if not exists "SectionPriceStats" (
+  section text primary key,
+  "dishCount" integer not null,
+  "p25PriceCents" integer not null,
+  "p50PriceCents" integer not null,
+  "p75PriceCents" integer not null,
+  "p90PriceCents" integer not null,
+  "updatedAt" timestamp(3) not null default now()
+);
+
+-- Incremental popularity refresh looks dishes up by slug across all menus.
+create index concurrently if not exists "Dish_slug_idx"
+  on "Dish" (slug);
+
+-- Per-city recomputation.
+create index concurrently if not exists "Restaurant_city_idx"
+  on "Restaurant" (city);
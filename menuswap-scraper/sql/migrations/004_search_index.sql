@@ -0,0 +1,62 @@
+-- Denormalized search tables maintained by src/search_index.py.
+-- Text columns hold lowercase, accent-folded text ("kipsaté" -> "kipsate") so
+-- substring search can use trigram GIN indexes and word search the tsvector.
+
+create extension if not exists pg_trgm;
+
+create table if not exists "DishSearch" (
+  "dishId" uuid primary key references "Dish"(id) on delete cascade,
+  "menuId" uuid not null references "Menu"(id) on delete cascade,
+  "restaurantId" uuid not null references "Restaurant"(id) on delete cascade,
+  name text not null,
+  slug text not null,
+  section text not null,
+  "priceCents" integer,
+  city text not null,
+  "cityNorm" text not null,
+  "restaurantName" text not null,
+  "nameNorm" text not null,
+  "searchText" text not null,
+  tokens text[] not null,
+  document tsvector generated always as (
+    setweight(to_tsvector('dutch', "nameNorm"), 'A') ||
+    setweight(to_tsvector('dutch', "searchText"), 'B')
+  ) stored,
+  "updatedAt" timestamp(3) not null default now()
+);
+
+create index if not exists "DishSearch_menuId_idx"
+  on "DishSearch" ("menuId");
+
+create index if not exists "DishSearch_nameNorm_trgm_idx"
+  on "DishSearch" using gin ("nameNorm" gin_trgm_ops);
+
+create index if not exists "DishSearch_searchText_trgm_idx"
+  on "DishSearch" using gin ("searchText" gin_trgm_ops);
+
+create index if not exists "DishSearch_document_idx"
+  on "DishSearch" using gin (document);
+
+create index if not exists "DishSearch_tokens_idx"
+  on "DishSearch" using gin (tokens);
+
+create index if not exists "DishSearch_cityNorm_priceCents_idx"
+  on "DishSearch" ("cityNorm", "priceCents");
+
+create table if not exists "RestaurantSearch" (
+  "restaurantId" uuid primary key references "Restaurant"(id) on delete cascade,
+  name text not null,
+  slug text not null,
+  city text not null,
+  "cityNorm" text not null,
+  "nameNorm" text not null,
+  verified boolean not null,
+  "dishCount" integer not null default 0,
+  "updatedAt" timestamp(3) not null default now()
+);
+
+create index if not exists "RestaurantSearch_nameNorm_trgm_idx"
+  on "RestaurantSearch" using gin ("nameNorm" gin_trgm_ops);
+
+create index if not exists "RestaurantSearch_cityNorm_idx"
+  on "RestaurantSearch" ("cityNorm");
@@ -0,0 +1,7 @@
+-- Resume points for the streaming pipeline (src/pipeline.py), one row per stage.
+
+create table if not exists "ScraperCheckpoint" (
+  stage text primary key,
+  cursor text not null,
+  "updatedAt" timestamp(3) not null default now()
+);
@@ -0,0 +1,21 @@
+-- Change timestamps for the incremental columnar export (src/export.py).
+--
+-- "Restaurant" already has "updatedAt". "Menu" and "Dish" get one so that
+-- re-downloaded menus and re-extracted dishes are exported again, not only new
+-- rows. Prisma maintains the column through @updatedAt and the scraper's own
+-- UPDATEs set it to now(). A constant default is stored in the catalog, so
+-- adding the column does not rewrite the tables; existing rows get the time of
+-- the migration.
+alter table "Menu" add column if not exists "updatedAt" timestamp(3) not null default current_timestamp;
+
+alter table "Dish" add column if not exists "updatedAt" timestamp(3) not null default current_timestamp;
+
+-- Each export scans the rows changed since its watermark.
+create index concurrently if not exists "Restaurant_updatedAt_idx"
+  on "Restaurant" ("updatedAt");
+
+create index concurrently if not exists "Menu_updatedAt_idx"
+  on "Menu" ("updatedAt");
+
+create index concurrently if not exists "Dish_updatedAt_idx"
+  on "Dish" ("updatedAt");
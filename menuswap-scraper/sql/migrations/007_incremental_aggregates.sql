@@ -0,0 +1,57 @@
+-- Incremental maintenance of "CityStats" and "SectionPriceStats" (src/aggregates.py).
+--
+-- "MenuAggregate" and "MenuSectionPrice" record what each APPROVED menu last
+-- contributed, so a refresh subtracts a menu's old contribution and adds its
+-- new one instead of re-aggregating whole cities or sections.
+-- "SectionPriceHistogram" counts priced dishes per (section, price); section
+-- percentiles are computed from it, which costs one row per distinct price.
+-- There are no foreign keys to "Menu": a deleted menu keeps its contribution
+-- until the next full rebuild (`python -m src.aggregates`).
+
+create table if not exists "MenuAggregate" (
+  "menuId" uuid primary key,
+  city text not null,
+  dishes integer not null,
+  "pricedDishes" integer not null,
+  "priceSumCents" bigint not null
+);
+
+create table if not exists "MenuSectionPrice" (
+  "menuId" uuid not null,
+  section text not null,
+  "priceCents" integer not null,
+  n integer not null,
+  primary key ("menuId", section, "priceCents")
+);
+
+create table if not exists "SectionPriceHistogram" (
+  section text not null,
+  "priceCents" integer not null,
+  n integer not null,
+  primary key (section, "priceCents")
+);
+
+-- Seed the contributions from the current data; run `python -m src.aggregates`
+-- afterwards so the stats tables are derived from the same snapshot.
+insert into "MenuAggregate" ("menuId", city, dishes, "pricedDishes", "priceSumCents")
+select m.id, r.city, count(d.id), count(d."priceCents"), coalesce(sum(d."priceCents"), 0)
+from "Menu" m
+join "Restaurant" r on r.id = m."restaurantId"
+left join "Dish" d on d."menuId" = m.id
+where m.status = 'APPROVED'
+group by m.id, r.city
+on conflict ("menuId") do nothing;
+
+insert into "MenuSectionPrice" ("menuId", section, "priceCents", n)
+select d."menuId", d.section, d."priceCents", count(*)
+from "Dish" d
+join "Menu" m on m.id = d."menuId" and m.status = 'APPROVED'
+where d."priceCents" is not null
+group by d."menuId", d.section, d."priceCents"
+on conflict ("menuId", section, "priceCents") do nothing;
+
+insert into "SectionPriceHistogram" (section, "priceCents", n)
+select section, "priceCents", sum(n)
+from "MenuSectionPrice"
+group by section, "priceCents"
+on conflict (section, "priceCents") do nothing;
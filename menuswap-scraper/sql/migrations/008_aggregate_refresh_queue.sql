@@ -0,0 +1,43 @@
+-- Queue aggregate refreshes for changes made outside the scraper (src/aggregates.py).
+--
+-- Menus are approved and restaurants verified in the app, so the extractor
+-- never sees those changes. These triggers record the menus whose status
+-- changed and the cities whose verified count changed; `refresh_pending`
+-- (`python -m src.aggregates --pending`, and the end of every extraction)
+-- applies them and empties the queue.
+
+create table if not exists "StaleMenuAggregate" (
+  "menuId" uuid primary key
+);
+
+create table if not exists "StaleCityStats" (
+  city text primary key
+);
+
+create or replace function "queueMenuAggregate"() returns trigger as $$
+begin
+  insert into "StaleMenuAggregate" ("menuId") values (new.id) on conflict do nothing;
+  return null;
+end
+$$ language plpgsql;
+
+create or replace function "queueCityStats"() returns trigger as $$
+begin
+  insert into "StaleCityStats" (city) values (new.city) on conflict do nothing;
+  return null;
+end
+$$ language plpgsql;
+
+drop trigger if exists "Menu_status_aggregates" on "Menu";
+
+create trigger "Menu_status_aggregates"
+after update of status on "Menu"
+for each row when (old.status is distinct from new.status)
+execute function "queueMenuAggregate"();
+
+drop trigger if exists "Restaurant_verified_aggregates" on "Restaurant";
+
+create trigger "Restaurant_verified_aggregates"
+after update of verified on "Restaurant"
+for each row when (old.verified is distinct from new.verified)
+execute function "queueCityStats"();
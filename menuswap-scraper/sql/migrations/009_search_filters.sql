@@ -0,0 +1,63 @@
+-- Columns the search endpoints filter on (app/api/search/*), so those filters
+-- can run against the search tables (src/search_index.py).
+--
+-- "DishSearch" gets the menu status, the dish tags and whether the restaurant
+-- is verified; "RestaurantSearch" gets accent-folded name, city and address.
+-- Menus are approved and restaurants verified in the app, so triggers copy
+-- those changes into the index. Run `python -m src.search_index` afterwards
+-- to add tags and addresses to "searchText".
+
+alter table "DishSearch"
+  add column if not exists status "MenuStatus" not null default 'PENDING',
+  add column if not exists tags text[] not null default '{}',
+  add column if not exists "restaurantVerified" boolean not null default false;
+
+alter table "RestaurantSearch"
+  add column if not exists "searchText" text not null default '';
+
+update "DishSearch" s
+set status = m.status, tags = coalesce(d.tags, '{}'), "restaurantVerified" = r.verified
+from "Dish" d
+join "Menu" m on m.id = d."menuId"
+join "Restaurant" r on r.id = m."restaurantId"
+where d.id = s."dishId";
+
+update "RestaurantSearch" set "searchText" = "nameNorm" || ' ' || "cityNorm" where "searchText" = '';
+
+create index if not exists "DishSearch_restaurantId_idx"
+  on "DishSearch" ("restaurantId");
+
+create index if not exists "DishSearch_tags_idx"
+  on "DishSearch" using gin (tags);
+
+create index if not exists "RestaurantSearch_searchText_trgm_idx"
+  on "RestaurantSearch" using gin ("searchText" gin_trgm_ops);
+
+create or replace function "syncSearchStatus"() returns trigger as $$
+begin
+  update "DishSearch" set status = new.status where "menuId" = new.id;
+  return null;
+end
+$$ language plpgsql;
+
+create or replace function "syncSearchVerified"() returns trigger as $$
+begin
+  update "DishSearch" set "restaurantVerified" = new.verified where "restaurantId" = new.id;
+  update "RestaurantSearch" set verified = new.verified where "restaurantId" = new.id;
+  return null;
+end
+$$ language plpgsql;
+
+drop trigger if exists "Menu_status_search" on "Menu";
+
+create trigger "Menu_status_search"
+after update of status on "Menu"
+for each row when (old.status is distinct from new.status)
+execute function "syncSearchStatus"();
+
+drop trigger if exists "Restaurant_verified_search" on "Restaurant";
+
+create trigger "Restaurant_verified_search"
+after update of verified on "Restaurant"
+for each row when (old.verified is distinct from new.verified)
+execute function "syncSearchVerified"();
@@ -0,0 +1,386 @@
+"""Refresh the aggregate tables behind the stats and popular-dishes endpoints.
+
+`refresh_for_menus` runs at the end of every extraction. It replaces what the
+given menus contributed to "CityStats" and to the section price histogram
+(sql/migrations/007_incremental_aggregates.sql) with what they contribute now,
+and recomputes the (city, slug) pairs they touch. `refresh_for_restaurants`
+does the same for a seed run. Approvals and verifications happen in the app;
+triggers queue them (sql/migrations/008_aggregate_refresh_queue.sql) and
+`refresh_pending` applies the queue. Running this module directly rebuilds
+everything; `--pending` only drains the queue and is meant to run from cron.
+"""
+import argparse
+import math
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from itertools import accumulate, groupby
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .db import get_conn
+from .log import get_logger
+from .profiling import profile
+
+# pg_advisory_xact_lock key serializing refreshes, which read and replace menu contributions
+AGGREGATES_LOCK = 290003
+PERCENTILES = (0.25, 0.5, 0.75, 0.9)
+
+# What each APPROVED menu contributes to "CityStats" and to the section price histogram
+_MENU_CONTRIBUTION_SQL = """
+select m.id, r.city, count(d.id), count(d."priceCents"), coalesce(sum(d."priceCents"), 0)
+from "Menu" m
+join "Restaurant" r on r.id = m."restaurantId"
+left join "Dish" d on d."menuId" = m.id
+where m.status = 'APPROVED' {where}
+group by m.id, r.city
+"""
+
+_MENU_SECTION_PRICES_SQL = """
+select d."menuId", d.section, d."priceCents", count(*)
+from "Dish" d
+join "Menu" m on m.id = d."menuId" and m.status = 'APPROVED'
+where d."priceCents" is not null {where}
+group by d."menuId", d.section, d."priceCents"
+"""
+
+_CITY_STATS_SQL = """
+insert into "CityStats" (city, "verifiedRestaurants", "approvedMenus", "approvedDishes", "pricedDishes", "priceSumCents", "updatedAt")
+select r.city, r.verified, coalesce(a.menus, 0), coalesce(a.dishes, 0), coalesce(a.priced, 0), coalesce(a.price_sum, 0), now()
+from (select city, count(*) filter (where verified) as verified from "Restaurant" group by city) r
+left join (
+  select city, count(*) as menus, sum(dishes) as dishes, sum("pricedDishes") as priced, sum("priceSumCents") as price_sum
+  from "MenuAggregate"
+  group by city
+) a on a.city = r.city
+"""
+
+_DISH_POPULARITY_SQL = """
+insert into "DishPopularity" (city, slug, name, "menuCount", "restaurantCount", "minPriceCents", "medianPriceCents", "cheapestDishId", "updatedAt")
+select r.city,
+       d.slug,
+       mode() within group (order by d.name),
+       count(distinct m.id),
+       count(distinct r.id),
+       min(d."priceCents"),
+       round(percentile_cont(0.5) within group (order by d."priceCents"))::int,
+       (array_agg(d.id order by d."priceCents", d.id))[1],
+       now()
+from "Dish" d
+join "Menu" m on m.id = d."menuId" and m.status = 'APPROVED'
+join "Restaurant" r on r.id = m."restaurantId"
+where d."priceCents" is not null and d.slug <> ''
+{where}
+group by r.city, d.slug
+"""
+
+
+def touched_keys(cur, menu_ids: List[str]) -> Tuple[List[str], List[str], List[str]]:
+    """Return the (cities, slugs, sections) affected by the given menus."""
+    cur.execute(
+        """
+        select array_agg(distinct r.city),
+               array_agg(distinct d.slug) filter (where d.slug is not null),
+               array_agg(distinct d.section) filter (where d.section is not null)
+        from "Menu" m
+        join "Restaurant" r on r.id = m."restaurantId"
+        left join "Dish" d on d."menuId" = m.id
+        where m.id = any(%s::uuid[])
+        """,
+        (menu_ids,),
+    )
+    cities, slugs, sections = cur.fetchone()
+    return cities or [], slugs or [], sections or []
+
+
+def add_city_deltas(cur, deltas: Dict[str, List[int]]) -> None:
+    """Add [verifiedRestaurants, approvedMenus, approvedDishes, pricedDishes, priceSumCents] per city."""
+    if not deltas:
+        return
+    cities = list(deltas)
+    columns = list(zip(*(deltas[c] for c in cities)))
+    cur.execute(
+        """
+        insert into "CityStats" (city, "verifiedRestaurants", "approvedMenus", "approvedDishes", "pricedDishes", "priceSumCents", "updatedAt")
+        select v.*, now()
+        from unnest(%s::text[], %s::int[], %s::int[], %s::int[], %s::int[], %s::bigint[])
+          as v(city, verified, menus, dishes, priced, price_sum)
+        on conflict (city) do update set
+          "verifiedRestaurants" = "CityStats"."verifiedRestaurants" + excluded."verifiedRestaurants",
+          "approvedMenus" = "CityStats"."approvedMenus" + excluded."approvedMenus",
+          "approvedDishes" = "CityStats"."approvedDishes" + excluded."approvedDishes",
+          "pricedDishes" = "CityStats"."pricedDishes" + excluded."pricedDishes",
+          "priceSumCents" = "CityStats"."priceSumCents" + excluded."priceSumCents",
+          "updatedAt" = now()
+        """,
+        (cities, *map(list, columns)),
+    )
+
+
+def apply_menu_contributions(cur, menu_ids: List[str]) -> Tuple[Set[str], Set[str]]:
+    """Replace the recorded contributions of the given menus with their current ones.
+
+    The difference is added to "CityStats" and "SectionPriceHistogram", so the
+    work is proportional to the menus, not to the cities or sections they are
+    in. Returns the (cities, sections) whose figures may have changed.
+    """
+    cur.execute(
+        "select \"menuId\", city, dishes, \"pricedDishes\", \"priceSumCents\" from \"MenuAggregate\" where \"menuId\" = any(%s::uuid[])",
+        (menu_ids,),
+    )
+    old = cur.fetchall()
+    cur.execute(_MENU_CONTRIBUTION_SQL.format(where="and m.id = any(%(ids)s::uuid[])"), {"ids": menu_ids})
+    new = cur.fetchall()
+    city_deltas: Dict[str, List[int]] = defaultdict(lambda: [0, 0, 0, 0, 0])
+    for sign, rows in ((-1, old), (1, new)):
+        for _menu_id, city, dishes, priced, price_sum in rows:
+            d = city_deltas[city]
+            d[1] += sign
+            d[2] += sign * dishes
+            d[3] += sign * priced
+            d[4] += sign * price_sum
+    add_city_deltas(cur, {c: d for c, d in city_deltas.items() if any(d)})
+    cur.execute("delete from \"MenuAggregate\" where \"menuId\" = any(%s::uuid[])", (menu_ids,))
+    if new:
+        cur.executemany(
+            "insert into \"MenuAggregate\" (\"menuId\", city, dishes, \"pricedDishes\", \"priceSumCents\") values (%s,%s,%s,%s,%s)",
+            new,
+        )
+
+    cur.execute(
+        "select \"menuId\", section, \"priceCents\", n from \"MenuSectionPrice\" where \"menuId\" = any(%s::uuid[])",
+        (menu_ids,),
+    )
+    old_prices = cur.fetchall()
+    cur.execute(_MENU_SECTION_PRICES_SQL.format(where="and d.\"menuId\" = any(%(ids)s::uuid[])"), {"ids": menu_ids})
+    new_prices = cur.fetchall()
+    price_deltas: Counter = Counter()
+    for sign, rows in ((-1, old_prices), (1, new_prices)):
+        for _menu_id, section, price, n in rows:
+            price_deltas[(section, price)] += sign * n
+    price_deltas = Counter({k: n for k, n in price_deltas.items() if n})
+    sections = sorted({section for section, _price in price_deltas})
+    if price_deltas:
+        keys = list(price_deltas)
+        cur.execute(
+            """
+            insert into "SectionPriceHistogram" (section, "priceCents", n)
+            select * from unnest(%s::text[], %s::int[], %s::int[])
+            on conflict (section, "priceCents") do update set n = "SectionPriceHistogram".n + excluded.n
+            """,
+            ([k[0] for k in keys], [k[1] for k in keys], [price_deltas[k] for k in keys]),
+        )
+        cur.execute("delete from \"SectionPriceHistogram\" where section = any(%s) and n <= 0", (sections,))
+    cur.execute("delete from \"MenuSectionPrice\" where \"menuId\" = any(%s::uuid[])", (menu_ids,))
+    if new_prices:
+        cur.executemany(
+            "insert into \"MenuSectionPrice\" (\"menuId\", section, \"priceCents\", n) values (%s,%s,%s,%s)",
+            new_prices,
+        )
+    return set(city_deltas), set(sections)
+
+
+def rebuild_contributions(cur) -> None:
+    """Recompute every menu contribution and "CityStats" from scratch."""
+    cur.execute("delete from \"MenuAggregate\"")
+    cur.execute(
+        "insert into \"MenuAggregate\" (\"menuId\", city, dishes, \"pricedDishes\", \"priceSumCents\") "
+        + _MENU_CONTRIBUTION_SQL.format(where="")
+    )
+    cur.execute("delete from \"MenuSectionPrice\"")
+    cur.execute(
+        "insert into \"MenuSectionPrice\" (\"menuId\", section, \"priceCents\", n) "
+        + _MENU_SECTION_PRICES_SQL.format(where="")
+    )
+    cur.execute("delete from \"SectionPriceHistogram\"")
+    cur.execute(
+        """
+        insert into "SectionPriceHistogram" (section, "priceCents", n)
+        select section, "priceCents", sum(n) from "MenuSectionPrice" group by section, "priceCents"
+        """
+    )
+    cur.execute("delete from \"CityStats\"")
+    cur.execute(_CITY_STATS_SQL)
+
+
+def refresh_dish_popularity(cur, cities: Optional[List[str]] = None, slugs: Optional[List[str]] = None) -> None:
+    if cities is None:
+        cur.execute("delete from \"DishPopularity\"")
+        cur.execute(_DISH_POPULARITY_SQL.format(where=""))
+        return
+    # Dishes sharing a touched slug in a touched city; the slug index keeps
+    # this proportional to the touched menus rather than the Dish table.
+    cur.execute(
+        "delete from \"DishPopularity\" where city = any(%s) and slug = any(%s)",
+        (cities, slugs),
+    )
+    cur.execute(
+        _DISH_POPULARITY_SQL.format(where="and d.slug = any(%(slugs)s) and r.city = any(%(cities)s)"),
+        {"cities": cities, "slugs": slugs},
+    )
+
+
+def histogram_percentiles(histogram: List[Tuple[int, int]], fractions: Sequence[float] = PERCENTILES) -> List[int]:
+    """`percentile_cont` over a (price, count) histogram sorted by price, rounded to cents."""
+    ends = list(accumulate(n for _price, n in histogram))
+    total = ends[-1]
+
+    def at(rank: int) -> int:
+        return histogram[bisect_right(ends, rank)][0]
+
+    values = []
+    for f in fractions:
+        k = f * (total - 1)
+        lo = math.floor(k)
+        values.append(round(at(lo) + (k - lo) * (at(math.ceil(k)) - at(lo))))
+    return values
+
+
+def refresh_section_stats(cur, sections: Optional[List[str]] = None) -> None:
+    """Recompute "SectionPriceStats" from the price histogram, for all sections when sections is None."""
+    if sections is None:
+        cur.execute("select section, \"priceCents\", n from \"SectionPriceHistogram\" order by section, \"priceCents\"")
+    else:
+        cur.execute(
+            "select section, \"priceCents\", n from \"SectionPriceHistogram\" where section = any(%s) order by section, \"priceCents\"",
+            (sections,),
+        )
+    rows = []
+    for section, group in groupby(cur.fetchall(), key=lambda r: r[0]):
+        histogram = [(price, n) for _section, price, n in group]
+        rows.append((section, sum(n for _price, n in histogram), *histogram_percentiles(histogram)))
+    if sections is None:
+        cur.execute("delete from \"SectionPriceStats\"")
+    else:
+        cur.execute("delete from \"SectionPriceStats\" where section = any(%s)", (sections,))
+    if rows:
+        cur.executemany(
+            """
+            insert into "SectionPriceStats" (section, "dishCount", "p25PriceCents", "p50PriceCents", "p75PriceCents", "p90PriceCents", "updatedAt")
+            values (%s,%s,%s,%s,%s,%s, now())
+            """,
+            rows,
+        )
+
+
+def _refresh_menus(cur, menu_ids: List[str]) -> Tuple[List[str], List[str], List[str]]:
+    cities, slugs, _sections = touched_keys(cur, menu_ids)
+    changed_cities, sections = apply_menu_contributions(cur, menu_ids)
+    # A menu whose restaurant moved also leaves popular dishes in its old city
+    cities = sorted(set(cities) | changed_cities)
+    if slugs:
+        refresh_dish_popularity(cur, cities, slugs)
+    if sections:
+        refresh_section_stats(cur, sorted(sections))
+    return cities, slugs, sorted(sections)
+
+
+def refresh_city_verified(cur, cities: List[str]) -> None:
+    """Recount "verifiedRestaurants" for the given cities."""
+    cur.execute(
+        """
+        insert into "CityStats" (city, "verifiedRestaurants", "approvedMenus", "approvedDishes", "pricedDishes", "priceSumCents", "updatedAt")
+        select c.city, count(r.id) filter (where r.verified), 0, 0, 0, 0, now()
+        from unnest(%s::text[]) as c(city)
+        left join "Restaurant" r on r.city = c.city
+        group by c.city
+        on conflict (city) do update set
+          "verifiedRestaurants" = excluded."verifiedRestaurants",
+          "updatedAt" = now()
+        """,
+        (cities,),
+    )
+
+
+def refresh_pending(conn) -> None:
+    """Apply the menu status and restaurant verification changes queued by the triggers."""
+    log = get_logger("aggregates")
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute("select pg_advisory_xact_lock(%s)", (AGGREGATES_LOCK,))
+        cur.execute("delete from \"StaleMenuAggregate\" returning \"menuId\"")
+        menu_ids = [r[0] for r in cur.fetchall()]
+        cur.execute("delete from \"StaleCityStats\" returning city")
+        cities = [r[0] for r in cur.fetchall()]
+        if menu_ids:
+            _refresh_menus(cur, menu_ids)
+        if cities:
+            refresh_city_verified(cur, cities)
+    if menu_ids or cities:
+        log.info(f"Applied {len(menu_ids)} queued menu and {len(cities)} queued city changes.")
+
+
+def refresh_for_menus(conn, menu_ids: Iterable[str]) -> None:
+    """Incrementally refresh all aggregates for the menus touched in a run."""
+    log = get_logger("aggregates")
+    menu_ids = list(menu_ids)
+    if not menu_ids:
+        return
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute("select pg_advisory_xact_lock(%s)", (AGGREGATES_LOCK,))
+        cities, slugs, sections = _refresh_menus(cur, menu_ids)
+    log.info(
+        f"Refreshed aggregates for {len(menu_ids)} menus "
+        f"({len(cities)} cities, {len(slugs)} slugs, {len(sections)} sections)."
+    )
+
+
+def refresh_for_restaurants(conn, restaurants) -> None:
+    """Apply a seed run to "CityStats".
+
+    restaurants holds (id, city, previous_city, changed, verified) as returned
+    by upsert_restaurants_bulk. New cities get a row, a verified restaurant
+    that moved is counted in its new city, and the menus of moved restaurants
+    carry their dishes along.
+    """
+    log = get_logger("aggregates")
+    deltas: Dict[str, List[int]] = {}
+    moved = []
+    for rid, city, previous_city, _changed, verified in restaurants:
+        if previous_city is None:
+            deltas.setdefault(city, [0, 0, 0, 0, 0])
+        elif previous_city != city:
+            moved.append(rid)
+            if verified:
+                deltas.setdefault(previous_city, [0, 0, 0, 0, 0])[0] -= 1
+                deltas.setdefault(city, [0, 0, 0, 0, 0])[0] += 1
+    if not deltas and not moved:
+        return
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute("select pg_advisory_xact_lock(%s)", (AGGREGATES_LOCK,))
+        add_city_deltas(cur, deltas)
+        menu_ids = []
+        if moved:
+            cur.execute("select id from \"Menu\" where \"restaurantId\" = any(%s::uuid[])", (moved,))
+            menu_ids = [r[0] for r in cur.fetchall()]
+        if menu_ids:
+            _refresh_menus(cur, menu_ids)
+    log.info(f"Refreshed city stats for {len(deltas)} cities and {len(moved)} moved restaurants.")
+
+
+def refresh_all(conn) -> None:
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute("select pg_advisory_xact_lock(%s)", (AGGREGATES_LOCK,))
+        # The rebuild covers everything that was queued
+        cur.execute("delete from \"StaleMenuAggregate\"")
+        cur.execute("delete from \"StaleCityStats\"")
+        rebuild_contributions(cur)
+        refresh_dish_popularity(cur)
+        refresh_section_stats(cur)
+
+
+def main(pending: bool = False):
+    log = get_logger("aggregates")
+    if pending:
+        with get_conn() as conn:
+            refresh_pending(conn)
+        return
+    log.info("Rebuilding aggregate tables…")
+    with get_conn() as conn:
+        refresh_all(conn)
+    log.info("Aggregates rebuilt.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pending", action="store_true", help="only apply queued approvals and verifications")
+    args = parser.parse_args()
+    with profile("aggregates"):
+        main(pending=args.pending)
@@ -0,0 +1,150 @@
+"""Deterministic synthetic Dutch menu pages for offline benchmarks.
+
+Pages mimic what the crawler meets on restaurant sites: page chrome
+(navigation, scripts, footer), sections with nested sub-sections, and dishes
+laid out as definition lists, tables or list items, with the usual spread of
+Dutch price notations ("€ 12,50", "€12,50", "€ 9,-", "€ 7", "12,50").
+Same seed, same corpus.
+"""
+import math
+import random
+from dataclasses import dataclass
+from html import escape
+from typing import List, Tuple
+
+LAYOUTS = ("dl", "table", "list", "mixed")
+
+SECTIONS = [
+    "Voorgerechten", "Soepen", "Salades", "Hoofdgerechten", "Vis", "Vegetarisch",
+    "Kindermenu", "Nagerechten", "Lunch", "Borrelhapjes", "Bijgerechten", "Dranken",
+]
+SUBSECTIONS = ["Warm", "Koud", "Van de grill", "Uit de wok", "Klassiekers", "Specials", "Huisgemaakt"]
+DISHES = [
+    "Bitterballen", "Kipsaté", "Erwtensoep", "Stamppot boerenkool", "Kaassoufflé", "Frikandel speciaal",
+    "Pannenkoek spek", "Poffertjes", "Uitsmijter ham kaas", "Tosti ham kaas", "Broodje kroket",
+    "Hollandse nieuwe", "Kibbeling", "Saté van de haas", "Vegan burger", "Caesar salade", "Crème brûlée",
+    "Appeltaart", "Biefstuk", "Spareribs", "Risotto paddenstoelen", "Carpaccio", "Tomatensoep",
+    "Dame blanche", "Lasagne", "Zalm", "Mosselen", "Nasi goreng", "Bami goreng", "Kroketten",
+    "Gamba's", "Ossenhaas", "Runderstoofpot", "Geitenkaas salade", "Tonijn tataki", "Huisgemaakte soep",
+]
+MODIFIERS = ["", "", "", "van het huis", "met friet", "met salade", "met truffelmayonaise",
+             "op brioche", "vegetarisch", "(2 stuks)", "groot", "klein"]
+DESCRIPTIONS = [
+    "Geserveerd met frites en salade", "Met huisgemaakte saus", "Op Italiaanse wijze",
+    "Keuze uit rood of wit", "Met seizoensgroenten en aardappelgratin", "Vraag naar de allergenen",
+    "Langzaam gegaard, met jus", "Met knoflookbrood", "",
+]
+
+
+@dataclass
+class MenuPage:
+    html: str
+    layout: str
+    items: int
+
+
+def _price(rng: random.Random) -> str:
+    euros = rng.randint(2, 45)
+    cents = rng.choice([0, 0, 50, 50, 25, 75, 95])
+    style = rng.random()
+    if style < 0.45:
+        return f"€ {euros},{cents:02d}"
+    if style < 0.7:
+        return f"€{euros},{cents:02d}"
+    if style < 0.8:
+        return f"€ {euros},-"
+    if style < 0.9:
+        return f"€ {euros}"
+    if style < 0.95:
+        return f"€ {euros}.{cents:02d}"
+    # Bare price without the euro sign, common in tables
+    return f"{euros},{cents:02d}"
+
+
+def _dish(rng: random.Random) -> Tuple[str, str, str]:
+    name = " ".join(p for p in (rng.choice(DISHES), rng.choice(MODIFIERS)) if p)
+    return name, rng.choice(DESCRIPTIONS), _price(rng)
+
+
+def _render_items(rng: random.Random, layout: str, n: int) -> str:
+    dishes = [_dish(rng) for _ in range(n)]
+    if layout == "dl":
+        rows = "".join(
+            f"<dt>{escape(name)}</dt><dd>{escape(desc)} <span class=\"price\">{price}</span></dd>"
+            for name, desc, price in dishes
+        )
+        return f"<dl class=\"menu\">{rows}</dl>"
+    if layout == "table":
+        rows = "".join(
+            f"<tr><td class=\"name\">{escape(name)}</td><td class=\"desc\">{escape(desc)}</td>"
+            f"<td class=\"price\">{price}</td></tr>"
+            for name, desc, price in dishes
+        )
+        return f"<table class=\"menu\"><tbody>{rows}</tbody></table>"
+    sep = rng.choice([" – ", " - ", " : "])
+    rows = "".join(
+        f"<li><span>{escape(name)}</span>{sep}<em>{price}</em><small>{escape(desc)}</small></li>"
+        for name, desc, price in dishes
+    )
+    return f"<ul class=\"menu\">{rows}</ul>"
+
+
+def _chrome(rng: random.Random, body: str, title: str) -> str:
+    nav = "".join(
+        f"<li><a href=\"/{p.lower()}\">{p}</a></li>"
+        for p in ("Home", "Menukaart", "Lunch", "Reserveren", "Contact", "Over ons")
+    )
+    script = "<script>window.dataLayer=window.dataLayer||[];function gtag(){dataLayer.push(arguments)}</script>" * rng.randint(1, 4)
+    return (
+        f"<!DOCTYPE html><html lang=\"nl\"><head><meta charset=\"utf-8\"><title>{escape(title)}</title>"
+        f"<style>body{{font-family:sans-serif}}.price{{float:right}}</style>{script}</head>"
+        f"<body><header><nav><ul>{nav}</ul></nav></header><main>{body}</main>"
+        f"<footer><p>Openingstijden: di t/m zo 12:00 - 22:00</p><p>KvK 12345678</p></footer></body></html>"
+    )
+
+
+def menu_page(rng: random.Random, items: int, layout: str = "mixed") -> MenuPage:
+    """One menu page with `items` dishes spread over sections and sub-sections."""
+    sections = max(1, min(len(SECTIONS), items // 12))
+    names = rng.sample(SECTIONS, sections)
+    per_section = [items // sections + (1 if i < items % sections else 0) for i in range(sections)]
+    parts: List[str] = []
+    for section, n in zip(names, per_section):
+        parts.append(f"<section><h2>{section}</h2>")
+        # Larger sections get nested sub-sections with their own headings
+        groups = [n] if n < 20 else [n // 2, n - n // 2]
+        for g in groups:
+            if len(groups) > 1:
+                parts.append(f"<h3>{rng.choice(SUBSECTIONS)}</h3>")
+            chosen = rng.choice(LAYOUTS[:3]) if layout == "mixed" else layout
+            parts.append(_render_items(rng, chosen, g))
+        parts.append("</section>")
+    return MenuPage(_chrome(rng, "".join(parts), "Menukaart"), layout, items)
+
+
+def home_page(rng: random.Random, links: int = 40) -> str:
+    """A restaurant homepage with menu links hidden among ordinary navigation."""
+    anchors = []
+    for i in range(links):
+        r = rng.random()
+        if r < 0.08:
+            anchors.append(f"<a href=\"/menukaart{i}\">Bekijk onze menukaart</a>")
+        elif r < 0.12:
+            anchors.append(f"<a href=\"/files/kaart-{i}.pdf\">Download kaart (PDF)</a>")
+        elif r < 0.3:
+            anchors.append(f"<a href=\"https://www.instagram.com/p/{i}\">Instagram</a>")
+        else:
+            anchors.append(f"<a href=\"/nieuws/{i}\">Nieuws item {i}</a>")
+    body = "<p>Welkom bij ons restaurant in het centrum.</p>" + "".join(f"<p>{a}</p>" for a in anchors)
+    return _chrome(rng, body, "Welkom")
+
+
+def item_counts(rng: random.Random, pages: int, low: int = 10, high: int = 5000) -> List[int]:
+    """Log-uniform menu sizes: mostly small cards, a few very long ones."""
+    lo, hi = math.log(low), math.log(high)
+    return [int(round(math.exp(rng.uniform(lo, hi)))) for _ in range(pages)]
+
+
+def corpus(pages: int, seed: int = 42, layout: str = "mixed") -> List[MenuPage]:
+    rng = random.Random(seed)
+    return [menu_page(rng, n, layout) for n in item_counts(rng, pages)]
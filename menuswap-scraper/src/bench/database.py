@@ -0,0 +1,22 @@
+"""Scratch database for the benchmarks that create and drop schemas; shared by the query, search and farm benchmarks."""
+import os
+from typing import Optional
+
+import psycopg
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL") or None
+
+
+def check_local(url: Optional[str]) -> None:
+    info = psycopg.conninfo.conninfo_to_dict(url or "")
+    host = info.get("host") or "localhost"
+    if host not in ("localhost", "127.0.0.1", "::1") and not host.startswith("/"):
+        raise SystemExit(f"Refusing to benchmark against non-local database host {host!r}")
+
+
+def bench_database_url() -> str:
+    """BENCH_DATABASE_URL, which must be set and point at a local Postgres."""
+    if not BENCH_DATABASE_URL:
+        raise SystemExit("Set BENCH_DATABASE_URL to a scratch local Postgres; the benchmark creates and drops schemas")
+    check_local(BENCH_DATABASE_URL)
+    return BENCH_DATABASE_URL
@@ -0,0 +1,255 @@
+"""Offline micro-benchmarks for extraction and text utilities.
+
+Runs on the synthetic corpus from src/bench/corpus.py, so it needs neither a
+network nor a database:
+
+- `extract_<layout>`: heuristically_extract_dishes_from_html on dl / table /
+  list / mixed pages of 10-5000 dishes (pages/s, dishes/s, recall)
+- `parse_links`: the streaming link/text parser used by menu discovery
+- `find_links`: find_menu_links over synthetic sites served from memory
+- `slugify`, `price_to_cents`, `price_re`: the text helpers on dish names and price strings
+
+Each suite reports its best-of-N throughput and its peak traced memory, and
+is compared with a stored baseline. Any slowdown or memory growth beyond
+--tolerance is flagged and the run exits non-zero, as does a run without a
+baseline. Baselines depend on the machine, so they live in the git-ignored
+data/bench and a fresh checkout records its own first:
+
+    python -m src.bench.extraction --update-baseline  # bootstrap, or accept the current numbers
+    python -m src.bench.extraction                    # compare with the baseline
+"""
+import argparse
+import asyncio
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..dish_extractor import heuristically_extract_dishes_from_html
+from ..log import get_logger
+from ..menu_link_finder import find_menu_links, parse_links_and_text
+from ..utils import PRICE_RE, price_string_to_cents, slugify
+from . import corpus
+from .output import OUTPUT_DIR
+
+BASELINE_PATH = OUTPUT_DIR / "extraction-baseline.json"
+DEFAULT_PAGES = 40
+DEFAULT_SITES = 200
+DEFAULT_REPEATS = 3
+DEFAULT_TOLERANCE = 0.15
+# Memory regressions below this size are noise from the allocator
+MEMORY_FLOOR_MB = 1.0
+
+
+class _Response:
+    def __init__(self, body: Optional[str]):
+        self.status = 200 if body is not None else 404
+        self.headers = {"content-type": "text/html; charset=utf-8"}
+        self._body = body or ""
+        self.content = self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def text(self, errors: str = "strict") -> str:
+        return self._body
+
+    async def iter_chunked(self, _size: int):
+        yield self._body.encode()
+
+
+class _CorpusSession:
+    """Just enough of aiohttp.ClientSession to serve pages from a dict."""
+
+    def __init__(self, pages: Dict[str, str]):
+        self.pages = pages
+
+    def get(self, url: str, **_kwargs) -> _Response:
+        return _Response(self.pages.get(url))
+
+
+def _sites(n: int, seed: int) -> Tuple[List[str], Dict[str, str]]:
+    rng = random.Random(seed)
+    bases: List[str] = []
+    pages: Dict[str, str] = {}
+    for i in range(n):
+        base = f"https://restaurant{i}.example.nl/"
+        home = corpus.home_page(rng)
+        bases.append(base)
+        pages[base] = home
+        links, _text = parse_links_and_text(home)
+        for href, _anchor in links:
+            if href.startswith("/menukaart"):
+                pages[base + href.lstrip("/")] = corpus.menu_page(rng, rng.randint(10, 200)).html
+    return bases, pages
+
+
+def _best_of(fn: Callable[[], int], repeats: int) -> Tuple[float, int]:
+    """Fastest wall time over `repeats` runs and the work count fn returned."""
+    best = float("inf")
+    count = 0
+    for _ in range(repeats):
+        gc.collect()
+        t0 = time.perf_counter()
+        count = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, count
+
+
+def _peak_mb(fn: Callable[[], int]) -> float:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1e6, 2)
+
+
+def build_suites(pages: int, sites: int, seed: int) -> Dict[str, Tuple[Callable[[], int], str, Dict]]:
+    """name -> (fn returning units of work, unit name, extra fields)."""
+    suites: Dict[str, Tuple[Callable[[], int], str, Dict]] = {}
+
+    for layout in corpus.LAYOUTS:
+        docs = corpus.corpus(pages, seed=seed, layout=layout)
+        items = sum(d.items for d in docs)
+        found = {"dishes": 0}
+
+        def run(docs=docs, found=found):
+            found["dishes"] = sum(len(heuristically_extract_dishes_from_html(d.html)) for d in docs)
+            return len(docs)
+
+        suites[f"extract_{layout}"] = (run, "pages", {"items": items, "found": found, "bytes": sum(len(d.html) for d in docs)})
+
+    docs = corpus.corpus(pages, seed=seed)
+    suites["parse_links"] = (
+        lambda docs=docs: sum(1 for d in docs if parse_links_and_text(d.html)),
+        "pages",
+        {"bytes": sum(len(d.html) for d in docs)},
+    )
+
+    bases, site_pages = _sites(sites, seed)
+    session = _CorpusSession(site_pages)
+
+    async def discover():
+        for base in bases:
+            await find_menu_links(base, session=session)
+        return len(bases)
+
+    suites["find_links"] = (lambda: asyncio.run(discover()), "sites", {})
+
+    rng = random.Random(seed)
+    names = [corpus._dish(rng)[0] for _ in range(50000)]
+    prices = [corpus._price(rng) for _ in range(50000)]
+    lines = [f"{name} {desc} {price}" for name, desc, price in (corpus._dish(rng) for _ in range(50000))]
+    suites["slugify"] = (lambda: sum(1 for n in names if slugify(n)), "calls", {})
+    suites["price_to_cents"] = (lambda: sum(1 for p in prices if price_string_to_cents(p) >= 0), "calls", {})
+
+    def scan_prices():
+        for line in lines:
+            PRICE_RE.search(line)
+        return len(lines)
+
+    suites["price_re"] = (scan_prices, "lines", {})
+    return suites
+
+
+def run(pages: int, sites: int, seed: int, repeats: int, only: Optional[List[str]] = None) -> Dict:
+    log = get_logger("bench")
+    results: Dict[str, Dict] = {}
+    for name, (fn, unit, extra) in build_suites(pages, sites, seed).items():
+        if only and name not in only:
+            continue
+        seconds, count = _best_of(fn, repeats)
+        result = {
+            "unit": unit,
+            "count": count,
+            "seconds": round(seconds, 4),
+            "per_second": round(count / seconds, 1),
+            "peak_mb": _peak_mb(fn),
+        }
+        if "found" in extra:
+            result["dishes_per_second"] = round(extra["found"]["dishes"] / seconds, 1)
+            result["recall"] = round(extra["found"]["dishes"] / extra["items"], 3)
+        if "bytes" in extra:
+            result["mb_per_second"] = round(extra["bytes"] / 1e6 / seconds, 2)
+        results[name] = result
+        log.info(
+            f"{name}: {result['per_second']} {unit}/s"
+            + (f", {result['dishes_per_second']} dishes/s, recall {result['recall']}" if "recall" in result else "")
+            + f", peak {result['peak_mb']}MB"
+        )
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Human-readable regressions of `results` against `baseline`."""
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if not b:
+            continue
+        if r["per_second"] < b["per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {r['per_second']} {r['unit']}/s vs {b['per_second']} baseline "
+                f"({(r['per_second'] / b['per_second'] - 1) * 100:+.0f}%)"
+            )
+        if r["peak_mb"] > max(b["peak_mb"] * (1 + tolerance), b["peak_mb"] + MEMORY_FLOOR_MB):
+            regressions.append(f"{name}: peak {r['peak_mb']}MB vs {b['peak_mb']}MB baseline")
+        if "recall" in r and r["recall"] < b.get("recall", 0) - 0.01:
+            regressions.append(f"{name}: recall {r['recall']} vs {b['recall']} baseline")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES, help="menu pages per layout")
+    parser.add_argument("--sites", type=int, default=DEFAULT_SITES, help="synthetic sites for find_links")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--suite", action="append", help="run only this suite (repeatable)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown, e.g. 0.15")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args(argv)
+    log = get_logger("bench")
+
+    results = run(args.pages, args.sites, args.seed, args.repeats, args.suite)
+    params = {"pages": args.pages, "sites": args.sites, "seed": args.seed, "python": sys.version.split()[0]}
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    out = OUTPUT_DIR / f"extraction-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.write_text(json.dumps({"params": params, "results": results}, indent=2))
+    log.info(f"Wrote {out}")
+
+    if args.update_baseline:
+        stored = json.loads(args.baseline.read_text())["results"] if args.baseline.exists() else {}
+        stored.update(results)
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({"params": params, "results": stored}, indent=2))
+        log.info(f"Baseline updated: {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        # Passing without anything to compare against would hide every regression
+        log.error(f"No baseline at {args.baseline}; run with --update-baseline on a quiet machine to store one.")
+        return 1
+    baseline = json.loads(args.baseline.read_text())
+    if {k: baseline["params"].get(k) for k in ("pages", "sites", "seed")} != {k: params[k] for k in ("pages", "sites", "seed")}:
+        log.warning(f"Baseline was recorded with {baseline['params']}; numbers may not be comparable.")
+    regressions = compare(results, baseline["results"], args.tolerance)
+    for r in regressions:
+        log.warning(f"REGRESSION {r}")
+    if not regressions:
+        log.info(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
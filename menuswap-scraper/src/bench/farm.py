@@ -0,0 +1,463 @@
+"""End-to-end load test of crawl, extraction and downloads against a local website farm.
+
+Starts aiohttp server processes on 127.0.0.1 that play tens of thousands of
+restaurant sites. Sites are virtual hosts `r<n>.farm.test`, and each one gets
+a deterministic homepage, menu pages, robots.txt/sitemap, PDFs and images. The
+scraper's sessions are pointed at the farm through a resolver override
+(src/sessions.configure_sessions); any other hostname fails to resolve, so
+nothing leaves the machine. The farm injects:
+
+- per-request latency from a distribution (`--latency lognormal:80:0.6`,
+  `uniform:20:200`, `pareto:40:1.5` or `fixed:50`, all in ms)
+- 5xx errors (`--error-rate`) and 429s with Retry-After (`--rate-limit-rate`)
+- slow-drip bodies written in small chunks (`--slow-rate`)
+- homepage redirects (`--redirect-rate`)
+
+For each concurrency setting the harness loads `--sites` restaurants into a
+fresh scratch schema of a local Postgres, then runs the real stages: the
+streaming pipeline, or with `--mode stages` crawl_queue, extractor and
+downloader one after another. It reports throughput, client-side latency
+percentiles per stage, the status mix and DB write rates.
+
+    DATABASE_URL=postgresql://localhost/menuswap_farm python -m src.bench.farm --sites 5000 --concurrency 4,16,64
+
+Only run this against a scratch database: it creates and drops the
+`--schema` schema (default bench_farm).
+"""
+import argparse
+import asyncio
+import functools
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import socket
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+import psycopg
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
+
+from .. import fetcher, page_store
+from ..config import DATABASE_URL
+from ..crawl_queue import main as crawl_main
+from ..db import close_pool
+from ..downloader import main as download_main
+from ..extractor import main as extract_main
+from ..log import get_logger
+from ..metrics import REGISTRY
+from ..migrate import MIGRATIONS_DIR, apply_migration
+from ..pipeline import Pipeline
+from ..sessions import configure_sessions
+from . import corpus
+from .database import check_local
+from .output import OUTPUT_DIR
+from .queries import SCHEMA_DDL
+
+FARM_DOMAIN = "farm.test"
+HOST_RE = re.compile(r"^r(\d+)\." + re.escape(FARM_DOMAIN) + r"$")
+DRIP_CHUNK_BYTES = 512
+STAGE_LIMIT = 10_000_000
+CITIES = ["Amsterdam", "Rotterdam", "Utrecht", "Den Haag", "Eindhoven", "Groningen", "Tilburg", "Almere", "Breda", "Nijmegen"]
+
+
+@dataclass
+class FarmConfig:
+    seed: int = 42
+    latency: str = "lognormal:80:0.6"
+    error_rate: float = 0.02
+    rate_limit_rate: float = 0.01
+    slow_rate: float = 0.01
+    slow_chunk_delay_ms: float = 100
+    redirect_rate: float = 0.1
+    pdf_kb: int = 200
+    image_kb: int = 300
+
+
+def latency_sampler(spec: str) -> Callable[[random.Random], float]:
+    """Parse a latency spec (milliseconds) into a sampler returning seconds."""
+    kind, *args = spec.split(":")
+    a = [float(x) for x in args]
+    if kind == "fixed":
+        return lambda rng: a[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(a[0], a[1]) / 1000
+    if kind == "lognormal":
+        # a[0] is the median, a[1] sigma of the underlying normal
+        return lambda rng: a[0] * math.exp(rng.gauss(0, a[1])) / 1000
+    if kind == "pareto":
+        # a[0] is the minimum, a[1] the shape; small shapes mean heavy tails
+        return lambda rng: a[0] * rng.paretovariate(a[1]) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _filler(header: bytes, size: int) -> bytes:
+    return header + bytes(max(0, size - len(header)))
+
+
+class Farm:
+    """Request handler serving every virtual host of the farm."""
+
+    def __init__(self, config: FarmConfig, port: int):
+        self.config = config
+        self.port = port
+        self.latency = latency_sampler(config.latency)
+        self.rng = random.Random(config.seed * 7919 + os.getpid())
+
+    def _site_rng(self, site: int, salt: str = "") -> random.Random:
+        return random.Random(f"{self.config.seed}:{site}:{salt}")
+
+    def redirects(self, site: int) -> bool:
+        return self._site_rng(site, "redirect").random() < self.config.redirect_rate
+
+    @functools.lru_cache(maxsize=8192)
+    def resource(self, site: int, path: str) -> Optional[Tuple[bytes, str]]:
+        rng = self._site_rng(site)
+        has_menu_page = rng.random() < 0.85
+        pdf = rng.random() < 0.4
+        image = rng.random() < 0.25
+        has_sitemap = rng.random() < 0.5
+        drinks_page = rng.random() < 0.3
+        home_prices = rng.random() < 0.1
+        html = "text/html"
+        if path in ("/", "/home"):
+            links = ['<a href="/over-ons">Over ons</a>', '<a href="/contact">Contact</a>']
+            links += [f'<a href="/nieuws/{k}">Nieuws {k}</a>' for k in range(rng.randint(2, 8))]
+            if has_menu_page:
+                links.append('<a href="/menukaart">Menukaart</a>')
+            if pdf:
+                links.append('<a href="/files/lunchkaart.pdf">Lunchkaart (PDF)</a>')
+            if image:
+                links.append('<a href="/img/menukaart.jpg">Bekijk de kaart</a>')
+            links.append(f'<a href="https://www.instagram.com/r{site}">Instagram</a>')
+            body = "".join(f"<p>{a}</p>" for a in links)
+            if home_prices:
+                body += f"<p>Dagmenu drie gangen {corpus._price(rng)}</p>"
+            return f"<html><head><title>Restaurant {site}</title></head><body>{body}</body></html>".encode(), html
+        if path == "/menukaart" and has_menu_page:
+            page = corpus.menu_page(rng, corpus.item_counts(rng, 1, 10, 300)[0]).html
+            if drinks_page:
+                page = page.replace("</main>", '<a href="/menukaart/dranken">Drankenkaart</a></main>')
+            return page.encode(), html
+        if path == "/menukaart/dranken" and has_menu_page and drinks_page:
+            return corpus.menu_page(rng, rng.randint(10, 60), "list").html.encode(), html
+        if path in ("/over-ons", "/contact") or path.startswith("/nieuws/"):
+            return f"<html><body><h1>{path.strip('/')}</h1><p>{'Lorem ipsum. ' * 50}</p></body></html>".encode(), html
+        if path == "/robots.txt":
+            sitemap = f"Sitemap: http://r{site}.{FARM_DOMAIN}:{self.port}/sitemap.xml\n" if has_sitemap else ""
+            text = "User-agent: *\nDisallow: /admin\n" + sitemap
+            return text.encode(), "text/plain"
+        if path == "/sitemap.xml" and has_sitemap:
+            urls = ["/", "/over-ons", "/contact"] + (["/menukaart"] if has_menu_page else [])
+            entries = "".join(f"<url><loc>http://r{site}.{FARM_DOMAIN}:{self.port}{u}</loc></url>" for u in urls)
+            xml = f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+            return xml.encode(), "application/xml"
+        if path == "/files/lunchkaart.pdf" and pdf:
+            return _filler(b"%PDF-1.4\n", int(self.config.pdf_kb * 1024 * rng.uniform(0.5, 1.5))), "application/pdf"
+        if path == "/img/menukaart.jpg" and image:
+            return _filler(b"\xff\xd8\xff\xe0", int(self.config.image_kb * 1024 * rng.uniform(0.5, 1.5))), "image/jpeg"
+        return None
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        m = HOST_RE.match(request.host.split(":")[0])
+        if not m:
+            return web.Response(status=404)
+        site = int(m.group(1))
+        await asyncio.sleep(self.latency(self.rng))
+        roll = self.rng.random()
+        if roll < self.config.error_rate:
+            return web.Response(status=self.rng.choice([500, 502, 503]))
+        if roll < self.config.error_rate + self.config.rate_limit_rate:
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        if request.path == "/" and self.redirects(site):
+            raise web.HTTPMovedPermanently("/home")
+        found = self.resource(site, request.path)
+        if found is None:
+            return web.Response(status=404)
+        body, ctype = found
+        if self.rng.random() < self.config.slow_rate:
+            return await self.drip(request, body, ctype)
+        return web.Response(body=body, content_type=ctype, charset="utf-8" if ctype.startswith("text") else None)
+
+    async def drip(self, request: web.Request, body: bytes, ctype: str) -> web.StreamResponse:
+        resp = web.StreamResponse(headers={"Content-Type": ctype, "Content-Length": str(len(body))})
+        await resp.prepare(request)
+        delay = self.config.slow_chunk_delay_ms / 1000
+        for i in range(0, len(body), DRIP_CHUNK_BYTES):
+            await resp.write(body[i:i + DRIP_CHUNK_BYTES])
+            await asyncio.sleep(delay)
+        await resp.write_eof()
+        return resp
+
+
+def _serve(port: int, config: FarmConfig) -> None:
+    farm = Farm(config, port)
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", farm.handle)
+
+    async def run():
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port, reuse_port=True, backlog=4096).start()
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+def start_farm(port: int, config: FarmConfig, workers: int) -> List[multiprocessing.Process]:
+    """Start `workers` server processes sharing `port` and wait until it accepts connections."""
+    procs = [multiprocessing.Process(target=_serve, args=(port, config), daemon=True) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    deadline = time.monotonic() + 15
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return procs
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Farm did not start on port {port}")
+            time.sleep(0.1)
+
+
+class FarmResolver(AbstractResolver):
+    """Resolve every *.farm.test host to the local farm; refuse everything else."""
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET):
+        if not host.endswith("." + FARM_DOMAIN):
+            raise OSError(f"{host} is outside the farm")
+        return [{
+            "hostname": host, "host": "127.0.0.1", "port": port,
+            "family": socket.AF_INET, "proto": 0, "flags": socket.AI_NUMERICHOST,
+        }]
+
+    async def close(self) -> None:
+        pass
+
+
+class LatencyRecorder:
+    """Raw client-side latencies per stage, for exact percentiles."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    def reset(self) -> None:
+        self.samples.clear()
+        self.statuses.clear()
+
+    def trace_config(self, stage: str) -> aiohttp.TraceConfig:
+        samples = self.samples[stage]
+        statuses = self.statuses[stage]
+
+        async def on_start(_session, ctx, _params):
+            ctx.farm_t0 = time.perf_counter()
+
+        async def on_end(_session, ctx, params):
+            samples.append(time.perf_counter() - ctx.farm_t0)
+            statuses[str(params.response.status)] += 1
+
+        async def on_exception(_session, ctx, params):
+            samples.append(time.perf_counter() - ctx.farm_t0)
+            statuses[type(params.exception).__name__] += 1
+
+        tc = aiohttp.TraceConfig()
+        tc.on_request_start.append(on_start)
+        tc.on_request_end.append(on_end)
+        tc.on_request_exception.append(on_exception)
+        return tc
+
+    def report(self) -> Dict:
+        out = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            s = sorted(samples)
+            pct = lambda q: round(s[min(len(s) - 1, int(q * len(s)))] * 1000, 1)
+            out[stage] = {
+                "requests": len(s),
+                "p50_ms": pct(0.5),
+                "p95_ms": pct(0.95),
+                "p99_ms": pct(0.99),
+                "max_ms": round(s[-1] * 1000, 1),
+                "mean_ms": round(statistics.fmean(s) * 1000, 1),
+                "statuses": dict(self.statuses[stage]),
+            }
+        return out
+
+
+def prepare_schema(schema: str, sites: int, port: int) -> None:
+    """Fresh scratch schema with all scraper migrations and `sites` farm restaurants."""
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn, conn.cursor() as cur:
+        # Keep pg_trgm outside the scratch schema so dropping it leaves the extension intact
+        cur.execute("create extension if not exists pg_trgm schema public")
+        cur.execute(f"drop schema if exists {schema} cascade")
+        cur.execute(f"create schema {schema}")
+        cur.execute(f"set search_path to {schema}, public")
+        for stmt in SCHEMA_DDL.split(";"):
+            cur.execute(stmt)
+        for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+            apply_migration(cur, path)
+        cur.execute(
+            """
+            insert into "Restaurant" (name, slug, city, "websiteUrl", verified)
+            select 'Farm restaurant ' || g, 'farm-' || g, (%(cities)s::text[])[1 + g %% %(ncities)s],
+                   'http://r' || g || %(suffix)s, true
+            from generate_series(0, %(sites)s - 1) g
+            """,
+            {"cities": CITIES, "ncities": len(CITIES), "suffix": f".{FARM_DOMAIN}:{port}/", "sites": sites},
+        )
+        cur.execute('analyze "Restaurant"')
+
+
+def db_counts(schema: str) -> Dict[str, int]:
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn, conn.cursor() as cur:
+        cur.execute(f"set search_path to {schema}, public")
+        counts = {}
+        for table in ("Menu", "Dish", "DishSearch"):
+            cur.execute(f'select count(*) from "{table}"')
+            counts[table] = cur.fetchone()[0]
+        # HTML menus carry the checksum of their archived page too
+        cur.execute("""select count(*) from "Menu" where checksum is not null and "sourceType" in ('PDF', 'IMAGE')""")
+        counts["downloaded"] = cur.fetchone()[0]
+        cur.execute("select xact_commit from pg_stat_database where datname = current_database()")
+        counts["commits"] = cur.fetchone()[0]
+        return counts
+
+
+async def run_stages(mode: str, concurrency: int, sites: int) -> Dict[str, float]:
+    """Run the real stages; return wall seconds per stage."""
+    timings = {}
+    if mode == "pipeline":
+        t0 = time.perf_counter()
+        await Pipeline(
+            crawl_limit=sites,
+            extract_backlog_limit=0,
+            download_backlog_limit=0,
+            crawl_concurrency=concurrency,
+            extract_concurrency=concurrency,
+            download_concurrency=concurrency,
+        ).run()
+        timings["pipeline"] = time.perf_counter() - t0
+        return timings
+    for name, stage in (
+        ("crawl", lambda: crawl_main(limit=sites, concurrency=concurrency)),
+        ("extract", lambda: extract_main(concurrency=concurrency, limit=STAGE_LIMIT)),
+        ("download", lambda: download_main(concurrency=concurrency, limit=STAGE_LIMIT)),
+    ):
+        t0 = time.perf_counter()
+        await stage()
+        timings[name] = time.perf_counter() - t0
+    return timings
+
+
+def run_once(args, concurrency: int, recorder: LatencyRecorder) -> Dict:
+    log = get_logger("farm")
+    prepare_schema(args.schema, args.sites, args.port)
+    # Stage connections opened from here on use the scratch schema
+    close_pool()
+    REGISTRY.reset()
+    recorder.reset()
+    before = db_counts(args.schema)
+    t0 = time.perf_counter()
+    timings = asyncio.run(run_stages(args.mode, concurrency, args.sites))
+    seconds = time.perf_counter() - t0
+    after = db_counts(args.schema)
+    close_pool()
+
+    rows_written = sum(after[t] - before[t] for t in ("Menu", "Dish", "DishSearch"))
+    result = {
+        "concurrency": concurrency,
+        "seconds": round(seconds, 1),
+        "stage_seconds": {k: round(v, 1) for k, v in timings.items()},
+        "sites_per_second": round(args.sites / seconds, 1),
+        "menus": after["Menu"],
+        "dishes": after["Dish"],
+        "dishes_per_second": round(after["Dish"] / seconds, 1),
+        "downloads": after["downloaded"],
+        "db_rows_per_second": round(rows_written / seconds, 1),
+        "db_commits_per_second": round((after["commits"] - before["commits"]) / seconds, 1),
+        "http": recorder.report(),
+        "db_pool": REGISTRY.summary().get("db_pool_acquire_seconds", {}),
+    }
+    log.info(
+        f"concurrency={concurrency}: {result['seconds']}s, {result['sites_per_second']} sites/s, "
+        f"{result['dishes_per_second']} dishes/s, {result['db_rows_per_second']} rows/s, "
+        + ", ".join(f"{s} p95={h['p95_ms']}ms p99={h['p99_ms']}ms" for s, h in result["http"].items())
+    )
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    defaults = FarmConfig()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sites", type=int, default=2000)
+    parser.add_argument("--concurrency", default="4,16,64", help="comma-separated settings to compare")
+    parser.add_argument("--mode", choices=("pipeline", "stages"), default="pipeline")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--workers", type=int, default=max(1, min(4, (os.cpu_count() or 2) // 2)))
+    parser.add_argument("--schema", default="bench_farm")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--latency", default=defaults.latency)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate)
+    parser.add_argument("--slow-rate", type=float, default=defaults.slow_rate)
+    parser.add_argument("--slow-chunk-delay-ms", type=float, default=defaults.slow_chunk_delay_ms)
+    parser.add_argument("--redirect-rate", type=float, default=defaults.redirect_rate)
+    parser.add_argument("--pdf-kb", type=int, default=defaults.pdf_kb)
+    parser.add_argument("--image-kb", type=int, default=defaults.image_kb)
+    args = parser.parse_args(argv)
+    log = get_logger("farm")
+
+    check_local(DATABASE_URL)
+    if fetcher.R2_ACCESS_KEY_ID and fetcher.R2_BUCKET:
+        raise SystemExit("Unset the R2_* variables: the farm must not upload to the real bucket")
+    latency_sampler(args.latency)  # fail fast on a bad spec
+
+    config = FarmConfig(
+        seed=args.seed, latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        slow_rate=args.slow_rate, slow_chunk_delay_ms=args.slow_chunk_delay_ms, redirect_rate=args.redirect_rate,
+        pdf_kb=args.pdf_kb, image_kb=args.image_kb,
+    )
+    os.environ["PGOPTIONS"] = f"-c search_path={args.schema},public"
+    recorder = LatencyRecorder()
+    configure_sessions(
+        connector_factory=lambda: aiohttp.TCPConnector(resolver=FarmResolver(), limit=0),
+        trace_config_factory=recorder.trace_config,
+    )
+    procs = start_farm(args.port, config, args.workers)
+    log.info(f"Farm of {args.sites} sites on 127.0.0.1:{args.port} ({args.workers} workers)")
+    runs = []
+    try:
+        # Keep farm downloads and archived pages out of the real data/ directory
+        with tempfile.TemporaryDirectory(prefix="farm-") as tmp:
+            fetcher.DOWNLOAD_DIR = Path(tmp) / "downloads"
+            page_store.PAGE_ARCHIVE_DIR = Path(tmp) / "pages"
+            for c in [int(x) for x in args.concurrency.split(",")]:
+                runs.append(run_once(args, c, recorder))
+    finally:
+        configure_sessions()
+        for p in procs:
+            p.terminate()
+        with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+            conn.execute(f"drop schema if exists {args.schema} cascade")
+
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    out = OUTPUT_DIR / f"farm-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.write_text(json.dumps({
+        "sites": args.sites, "mode": args.mode, "workers": args.workers, "farm": asdict(config), "runs": runs,
+    }, indent=2))
+    log.info(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Where benchmark results and baselines are written; shared by the offline and database benchmarks."""
+import os
+from pathlib import Path
+
+OUTPUT_DIR = Path(os.getenv("BENCH_OUTPUT_DIR", "data/bench"))
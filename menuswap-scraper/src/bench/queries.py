@@ -0,0 +1,227 @@
+"""Query-plan benchmark for the scraper's selection queries.
+
+Loads synthetic Restaurant/Menu/Dish data into a scratch schema of a local
+Postgres at several sizes and records `EXPLAIN ANALYZE` timings for each
+selector in src/db.py, before and after applying the index migration.
+
+    BENCH_DATABASE_URL=postgresql://localhost/menuswap_bench python -m src.bench.queries
+
+Never point this at production: it creates and drops `bench_<rows>` schemas.
+BENCH_DATABASE_URL is required and must name a local host.
+"""
+import json
+import os
+import time
+from typing import Callable, Dict, List
+
+import psycopg
+
+from ..db import (
+    select_menus_needing_download,
+    select_menus_without_dishes,
+    select_restaurants_needing_crawl,
+    select_restaurants_with_websites,
+)
+from ..log import get_logger
+from ..migrate import MIGRATIONS_DIR, apply_migration
+from .database import bench_database_url
+from .output import OUTPUT_DIR
+
+SIZES = [int(s) for s in os.getenv("BENCH_SIZES", "10000,100000,1000000").split(",")]
+SELECT_LIMIT = 2000
+INDEX_MIGRATION = MIGRATIONS_DIR / "001_selection_indexes.sql"
+
+# Minimal mirror of the Prisma tables touched by the selectors.
+SCHEMA_DDL = """
+create type "SourceType" as enum ('PDF', 'IMAGE', 'URL');
+create type "MenuStatus" as enum ('PENDING', 'APPROVED', 'REJECTED');
+create table "Restaurant" (
+  id uuid primary key default gen_random_uuid(),
+  name text not null,
+  slug text not null unique,
+  city text not null,
+  address text,
+  "websiteUrl" text,
+  lat numeric,
+  lon numeric,
+  verified boolean not null default false,
+  "createdAt" timestamp(3) not null default now(),
+  "updatedAt" timestamp(3) not null default now()
+);
+create table "Menu" (
+  id uuid primary key default gen_random_uuid(),
+  "restaurantId" uuid not null references "Restaurant"(id),
+  "sourceType" "SourceType" not null,
+  "sourceUrl" text,
+  "rawText" text,
+  status "MenuStatus" not null default 'PENDING',
+  checksum text,
+  "uploadedAt" timestamp(3) not null default now()
+);
+create index "Menu_restaurantId_idx" on "Menu" ("restaurantId");
+create index "Menu_status_idx" on "Menu" (status);
+create table "Dish" (
+  id uuid primary key default gen_random_uuid(),
+  "menuId" uuid not null references "Menu"(id),
+  name text not null,
+  slug text not null,
+  description text,
+  "priceCents" integer,
+  section text not null default 'Overig',
+  tags text[],
+  "imageUrl" text,
+  "createdAt" timestamp(3) not null default now()
+);
+create index "Dish_name_idx" on "Dish" (name);
+create index "Dish_priceCents_idx" on "Dish" ("priceCents");
+create index "Dish_section_idx" on "Dish" (section);
+create table "Favorite" (
+  id uuid primary key default gen_random_uuid(),
+  "userId" uuid not null,
+  "restaurantId" uuid references "Restaurant"(id),
+  "dishId" uuid references "Dish"(id),
+  "createdAt" timestamp(3) not null default now()
+)
+"""
+
+# `rows` restaurants, 80% with a website; one or two menus per website of
+# which about half are already downloaded; dishes for two thirds of the menus.
+LOAD_SQL = [
+    """
+    insert into "Restaurant" (name, slug, city, "websiteUrl")
+    select 'Restaurant ' || g, 'restaurant-' || g, 'Stad ' || (g %% 400),
+           case when g %% 5 = 0 then null else 'https://r' || g || '.example.nl' end
+    from generate_series(1, %(rows)s) g
+    """,
+    """
+    insert into "Menu" ("restaurantId", "sourceType", "sourceUrl", checksum, "uploadedAt")
+    select r.id,
+           (array['URL','URL','PDF','IMAGE'])[1 + (abs(hashtext(r.slug || k)) %% 4)]::"SourceType",
+           r."websiteUrl" || '/menu-' || k,
+           case when abs(hashtext(r.slug || k)) %% 2 = 0 then md5(r.slug || k) end,
+           now() - (abs(hashtext(r.slug || k)) %% 100000) * interval '1 minute'
+    from "Restaurant" r, generate_series(1, 2) k
+    where r."websiteUrl" is not null and (k = 1 or abs(hashtext(r.slug)) %% 2 = 0)
+    """,
+    """
+    insert into "Dish" ("menuId", name, slug, "priceCents", section)
+    select m.id, 'Gerecht ' || i, 'gerecht-' || i, 500 + (i * 137) %% 3000, 'Hoofdgerechten'
+    from "Menu" m, generate_series(1, 12) i
+    where abs(hashtext(m.id::text)) %% 3 <> 0
+    """,
+]
+
+SELECTORS: Dict[str, Callable] = {
+    "restaurants_with_websites": lambda cur: select_restaurants_with_websites(cur, SELECT_LIMIT),
+    "restaurants_needing_crawl": lambda cur: select_restaurants_needing_crawl(cur, SELECT_LIMIT, update_mode=False),
+    "menus_needing_download": lambda cur: select_menus_needing_download(cur, SELECT_LIMIT),
+    "menus_without_dishes": lambda cur: select_menus_without_dishes(cur, SELECT_LIMIT),
+    "menu_for_source": lambda cur: cur.execute(
+        "select id from \"Menu\" where \"restaurantId\"=%s and \"sourceUrl\"=%s",
+        (_sample_menu(cur)),
+    ),
+    "dish_by_menu_slug": lambda cur: cur.execute(
+        "select id from \"Dish\" where \"menuId\"=%s and slug=%s",
+        (_sample_dish(cur)),
+    ),
+}
+
+
+def _sample_menu(cur):
+    cur.cursor.execute("select \"restaurantId\", \"sourceUrl\" from \"Menu\" order by \"uploadedAt\" desc limit 1")
+    return cur.cursor.fetchone()
+
+
+def _sample_dish(cur):
+    cur.cursor.execute("select \"menuId\", slug from \"Dish\" order by \"createdAt\" desc limit 1")
+    return cur.cursor.fetchone()
+
+
+class ExplainCursor:
+    """Cursor stand-in that runs the selector's SQL under EXPLAIN ANALYZE.
+
+    Lets the benchmark reuse the exact statements from src/db.py instead of
+    copying them here.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.plan = None
+
+    def execute(self, sql, params=None):
+        self.cursor.execute("explain (analyze, buffers, format json) " + sql, params)
+        self.plan = self.cursor.fetchone()[0][0]
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+
+def explain(cur, selector: Callable, repeats: int = 3) -> Dict:
+    """Run a selector `repeats` times and keep the fastest plan (warm cache)."""
+    best = None
+    for _ in range(repeats):
+        ec = ExplainCursor(cur)
+        selector(ec)
+        if best is None or ec.plan["Execution Time"] < best["Execution Time"]:
+            best = ec.plan
+    root = best["Plan"]
+    return {
+        "execution_ms": round(best["Execution Time"], 3),
+        "planning_ms": round(best["Planning Time"], 3),
+        "root_node": root["Node Type"],
+        "shared_hit": root.get("Shared Hit Blocks"),
+        "shared_read": root.get("Shared Read Blocks"),
+    }
+
+
+def run_size(conn, rows: int) -> Dict:
+    log = get_logger("bench")
+    schema = f"bench_{rows}"
+    result: Dict = {"rows": rows}
+    with conn.cursor() as cur:
+        cur.execute(f"drop schema if exists {schema} cascade")
+        cur.execute(f"create schema {schema}")
+        cur.execute(f"set search_path to {schema}, public")
+        for stmt in SCHEMA_DDL.split(";"):
+            cur.execute(stmt)
+        t0 = time.perf_counter()
+        for stmt in LOAD_SQL:
+            cur.execute(stmt, {"rows": rows})
+        cur.execute('analyze "Restaurant", "Menu", "Dish"')
+        result["load_seconds"] = round(time.perf_counter() - t0, 2)
+        log.info(f"[{rows}] loaded synthetic data in {result['load_seconds']}s")
+
+        result["before"] = {name: explain(cur, sel) for name, sel in SELECTORS.items()}
+        t0 = time.perf_counter()
+        apply_migration(cur, INDEX_MIGRATION)
+        cur.execute('analyze "Restaurant", "Menu", "Dish"')
+        result["migration_seconds"] = round(time.perf_counter() - t0, 2)
+        result["after"] = {name: explain(cur, sel) for name, sel in SELECTORS.items()}
+
+        for name in SELECTORS:
+            b, a = result["before"][name], result["after"][name]
+            log.info(
+                f"[{rows}] {name}: {b['execution_ms']}ms ({b['root_node']}) -> "
+                f"{a['execution_ms']}ms ({a['root_node']})"
+            )
+        cur.execute(f"drop schema {schema} cascade")
+        cur.execute("set search_path to default")
+    return result
+
+
+def main(sizes: List[int] = SIZES):
+    log = get_logger("bench")
+    dsn = bench_database_url()
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        results = [run_size(conn, n) for n in sizes]
+    out = OUTPUT_DIR / f"queries-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.write_text(json.dumps(results, indent=2))
+    log.info(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""Latency benchmark for dish search, raw tables vs. the scraper search index.
+
+Loads synthetic Dutch dishes (1M by default) into a scratch schema, builds
+"DishSearch" through src/search_index.py and times typical queries three ways:
+
+- `raw_ilike`: what the search endpoint does today (ILIKE per term across
+  Dish, Menu and Restaurant columns)
+- `index_trigram`: substring match on the accent-folded "searchText"
+- `index_tsvector`: word match on the `dutch` tsvector, ranked
+
+It then times the exact filtered queries of app/api/search/dishes and
+app/api/search/restaurants in production (approved menus, verified
+restaurants, plus city, price, section and tag filters) against the raw
+tables and against the same filters on the search tables.
+
+    BENCH_DATABASE_URL=postgresql://localhost/menuswap_bench python -m src.bench.search
+
+Like src/bench/queries.py it needs BENCH_DATABASE_URL on a local host.
+"""
+import json
+import os
+import statistics
+import time
+from typing import Dict, List
+
+import psycopg
+
+from ..log import get_logger
+from ..migrate import MIGRATIONS_DIR, apply_migration
+from ..search_index import rebuild
+from ..utils import normalize_text
+from .database import bench_database_url
+from .output import OUTPUT_DIR
+from .queries import SCHEMA_DDL
+
+DISHES = int(os.getenv("BENCH_SEARCH_DISHES", "1000000"))
+REPEATS = int(os.getenv("BENCH_SEARCH_REPEATS", "7"))
+DISHES_PER_MENU = 25
+RESULT_LIMIT = 100
+# What the routes fetch before ranking: dishes take max(limit, 100) capped at 300, restaurants 300
+DISH_ROUTE_TAKE = 100
+RESTAURANT_ROUTE_TAKE = 300
+
+QUERIES = [
+    "bitterballen",
+    "kipsate",
+    "kipsaté",
+    "saté",
+    "erwtensoep",
+    "tosti ham kaas",
+    "vegan burger",
+    "pannenkoek spek",
+    "creme brulee",
+    "biefstuk friet",
+    "kroket amsterdam",
+    "zalm",
+]
+
+BASES = [
+    "Bitterballen", "Kipsaté", "Erwtensoep", "Stamppot boerenkool", "Kaassoufflé",
+    "Frikandel speciaal", "Pannenkoek spek", "Poffertjes", "Uitsmijter ham kaas",
+    "Tosti ham kaas", "Broodje kroket", "Hollandse nieuwe", "Kibbeling", "Saté van de haas",
+    "Vegan burger", "Caesar salade", "Crème brûlée", "Appeltaart", "Biefstuk met friet",
+    "Spareribs", "Risotto paddenstoelen", "Carpaccio", "Tomatensoep", "Dame blanche",
+    "Lasagne", "Zalm met spinazie", "Mosselen", "Nasi goreng", "Bami goreng", "Kroketten",
+]
+MODIFIERS = ["", "", "", " van het huis", " met friet", " met salade", " huisgemaakt", " vegetarisch", " groot", " klein"]
+SECTIONS = ["Voorgerechten", "Hoofdgerechten", "Nagerechten", "Lunch", "Borrelhapjes", "Dranken"]
+CITIES = ["Amsterdam", "Rotterdam", "Utrecht", "Den Haag", "Eindhoven", "Groningen", "Tilburg", "Almere", "Breda", "Nijmegen"]
+TAGS = ["vegetarisch", "vegan", "glutenvrij", "pittig"]
+STREETS = ["Dorpsstraat", "Kerkstraat", "Stationsweg", "Marktplein", "Molenweg"]
+
+# Request bodies for the dish route: (query, city, maxPrice in euros, section, tags)
+DISH_FILTERS = [
+    ("bitterballen", "amsterdam", None, None, None),
+    ("kipsaté", None, 15, None, None),
+    ("burger", None, None, None, ["vegan"]),
+    ("soep", "utrecht", None, "Voorgerechten", None),
+    ("", "rotterdam", 10, None, None),
+    ("friet", "den haag", 20, "Hoofdgerechten", ["vegan", "glutenvrij"]),
+]
+# Request bodies for the restaurant route: (query, city)
+RESTAURANT_FILTERS = [
+    ("eetcafe", None),
+    ("eetcafe 12", "amsterdam"),
+    ("kerkstraat", "rotterdam"),
+    ("", "groningen"),
+]
+
+
+def _sql_array(values: List[str]) -> str:
+    return "array[" + ",".join("'" + v.replace("'", "''") + "'" for v in values) + "]"
+
+
+def load(cur, dishes: int) -> None:
+    menus = max(1, dishes // DISHES_PER_MENU)
+    cur.execute(
+        f"""
+        insert into "Restaurant" (name, slug, city, address, "websiteUrl", verified)
+        select 'Eetcafé ' || g, 'eetcafe-' || g, ({_sql_array(CITIES)})[1 + g % {len(CITIES)}],
+               ({_sql_array(STREETS)})[1 + g % {len(STREETS)}] || ' ' || g % 200,
+               'https://r' || g || '.example.nl', g % 4 <> 0
+        from generate_series(1, {menus}) g
+        """
+    )
+    cur.execute(
+        """
+        insert into "Menu" ("restaurantId", "sourceType", "sourceUrl", status)
+        select id, 'URL', "websiteUrl" || '/menukaart',
+               (case when hashtext(id::text) % 5 = 0 then 'PENDING' else 'APPROVED' end)::"MenuStatus"
+        from "Restaurant"
+        """
+    )
+    cur.execute(
+        f"""
+        insert into "Dish" ("menuId", name, slug, description, "priceCents", section, tags)
+        select m.id, n.name, lower(replace(n.name, ' ', '-')),
+               case when i % 3 = 0 then 'Met ' || lower(({_sql_array(BASES)})[1 + (i * 7) % {len(BASES)}]) end,
+               350 + (abs(hashtext(m.id::text || i)) % 3000),
+               ({_sql_array(SECTIONS)})[1 + i % {len(SECTIONS)}],
+               case when i % 3 <> 2 then array[({_sql_array(TAGS)})[1 + i % {len(TAGS)}]] else '{{}}'::text[] end
+        from "Menu" m
+        cross join generate_series(1, {DISHES_PER_MENU}) i
+        cross join lateral (
+          select ({_sql_array(BASES)})[1 + abs(hashtext(m.id::text || i)) % {len(BASES)}]
+              || ({_sql_array(MODIFIERS)})[1 + abs(hashtext(i || m.id::text)) % {len(MODIFIERS)}] as name
+        ) n
+        """
+    )
+    cur.execute('analyze "Restaurant", "Menu", "Dish"')
+
+
+def raw_ilike(cur, query: str) -> int:
+    terms = normalize_text(query).split() or [query]
+    clauses = []
+    params: List[str] = []
+    for t in terms:
+        clauses.append(
+            "(d.name ilike %s or d.description ilike %s or d.section ilike %s or r.name ilike %s or r.city ilike %s)"
+        )
+        params.extend([f"%{t}%"] * 5)
+    cur.execute(
+        f"""
+        select d.id from "Dish" d
+        join "Menu" m on m.id = d."menuId"
+        join "Restaurant" r on r.id = m."restaurantId"
+        where {" and ".join(clauses)}
+        limit 300
+        """,
+        params,
+    )
+    return len(cur.fetchall())
+
+
+def index_trigram(cur, query: str) -> int:
+    terms = normalize_text(query).split()
+    cur.execute(
+        f"""
+        select "dishId" from "DishSearch"
+        where {" and ".join(['"searchText" like %s'] * len(terms))}
+        limit 300
+        """,
+        [f"%{t}%" for t in terms],
+    )
+    return len(cur.fetchall())
+
+
+def index_tsvector(cur, query: str) -> int:
+    q = normalize_text(query)
+    cur.execute(
+        """
+        select "dishId" from "DishSearch"
+        where document @@ plainto_tsquery('dutch', %s)
+        order by ts_rank(document, plainto_tsquery('dutch', %s)) desc
+        limit %s
+        """,
+        (q, q, RESULT_LIMIT),
+    )
+    return len(cur.fetchall())
+
+
+VARIANTS = {"raw_ilike": raw_ilike, "index_trigram": index_trigram, "index_tsvector": index_tsvector}
+
+
+def raw_dishes_filtered(cur, body) -> int:
+    """The Prisma query of app/api/search/dishes in production (strict AND across terms)."""
+    query, city, max_price, section, tags = body
+    clauses = ["m.status = 'APPROVED'"]
+    params: List = []
+    if city:
+        clauses.append("r.city ilike %s")
+        params.append(f"%{city}%")
+    if max_price is not None:
+        clauses.append('d."priceCents" <= %s')
+        params.append(max_price * 100)
+    if section:
+        clauses.append("d.section = %s")
+        params.append(section)
+    if tags:
+        clauses.append("d.tags && %s::text[]")
+        params.append(tags)
+    for t in normalize_text(query).split():
+        clauses.append(
+            "(d.name ilike %s or d.description ilike %s or d.section ilike %s or %s = any(d.tags)"
+            " or r.name ilike %s or r.city ilike %s)"
+        )
+        params.extend([f"%{t}%"] * 3 + [t] + [f"%{t}%"] * 2)
+    cur.execute(
+        f"""
+        select d.id from "Dish" d
+        join "Menu" m on m.id = d."menuId"
+        join "Restaurant" r on r.id = m."restaurantId"
+        where {" and ".join(clauses)}
+        limit %s
+        """,
+        params + [DISH_ROUTE_TAKE],
+    )
+    return len(cur.fetchall())
+
+
+def index_dishes_filtered(cur, body) -> int:
+    """The same request against "DishSearch"."""
+    query, city, max_price, section, tags = body
+    clauses = ["status = 'APPROVED'"]
+    params: List = []
+    if city:
+        clauses.append('"cityNorm" like %s')
+        params.append(f"%{normalize_text(city)}%")
+    if max_price is not None:
+        clauses.append('"priceCents" <= %s')
+        params.append(max_price * 100)
+    if section:
+        clauses.append("section = %s")
+        params.append(section)
+    if tags:
+        clauses.append("tags && %s::text[]")
+        params.append(tags)
+    for t in normalize_text(query).split():
+        clauses.append('"searchText" like %s')
+        params.append(f"%{t}%")
+    cur.execute(
+        f"""select "dishId" from "DishSearch" where {" and ".join(clauses)} limit %s""",
+        params + [DISH_ROUTE_TAKE],
+    )
+    return len(cur.fetchall())
+
+
+def raw_restaurants_filtered(cur, body) -> int:
+    """The Prisma query of app/api/search/restaurants in production."""
+    query, city = body
+    clauses = ["verified"]
+    params: List = []
+    if city:
+        clauses.append("city ilike %s")
+        params.append(f"%{city}%")
+    for t in normalize_text(query).split():
+        clauses.append("(name ilike %s or city ilike %s or address ilike %s)")
+        params.extend([f"%{t}%"] * 3)
+    cur.execute(
+        f"""select id from "Restaurant" where {" and ".join(clauses)} limit %s""",
+        params + [RESTAURANT_ROUTE_TAKE],
+    )
+    return len(cur.fetchall())
+
+
+def index_restaurants_filtered(cur, body) -> int:
+    """The same request against "RestaurantSearch"."""
+    query, city = body
+    clauses = ["verified"]
+    params: List = []
+    if city:
+        clauses.append('"cityNorm" like %s')
+        params.append(f"%{normalize_text(city)}%")
+    for t in normalize_text(query).split():
+        clauses.append('"searchText" like %s')
+        params.append(f"%{t}%")
+    cur.execute(
+        f"""select "restaurantId" from "RestaurantSearch" where {" and ".join(clauses)} limit %s""",
+        params + [RESTAURANT_ROUTE_TAKE],
+    )
+    return len(cur.fetchall())
+
+
+FILTERED_VARIANTS = {
+    "dishes": (DISH_FILTERS, {"raw": raw_dishes_filtered, "index": index_dishes_filtered}),
+    "restaurants": (RESTAURANT_FILTERS, {"raw": raw_restaurants_filtered, "index": index_restaurants_filtered}),
+}
+
+
+def time_query(cur, fn, query, repeats: int) -> Dict:
+    hits = fn(cur, query)  # warm-up
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(cur, query)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "hits": hits,
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+    }
+
+
+def main(dishes: int = DISHES, repeats: int = REPEATS):
+    log = get_logger("bench")
+    schema = f"bench_search_{dishes}"
+    dsn = bench_database_url()
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    results: Dict = {"dishes": dishes, "queries": {}}
+    with psycopg.connect(dsn, autocommit=True) as conn, conn.cursor() as cur:
+        # Keep pg_trgm outside the scratch schema so dropping it leaves the extension intact
+        cur.execute("create extension if not exists pg_trgm schema public")
+        cur.execute(f"drop schema if exists {schema} cascade")
+        cur.execute(f"create schema {schema}")
+        cur.execute(f"set search_path to {schema}, public")
+        for stmt in SCHEMA_DDL.split(";"):
+            cur.execute(stmt)
+        t0 = time.perf_counter()
+        load(cur, dishes)
+        results["load_seconds"] = round(time.perf_counter() - t0, 1)
+        log.info(f"Loaded {dishes} dishes in {results['load_seconds']}s")
+
+        for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+            apply_migration(cur, path)
+        t0 = time.perf_counter()
+        rebuild(conn, batch_size=2000)
+        cur.execute('analyze "DishSearch"')
+        results["index_seconds"] = round(time.perf_counter() - t0, 1)
+        log.info(f"Built search index in {results['index_seconds']}s")
+
+        for q in QUERIES:
+            results["queries"][q] = {name: time_query(cur, fn, q, repeats) for name, fn in VARIANTS.items()}
+            r = results["queries"][q]
+            log.info(
+                f"{q!r}: raw {r['raw_ilike']['p50_ms']}ms ({r['raw_ilike']['hits']} hits), "
+                f"trigram {r['index_trigram']['p50_ms']}ms ({r['index_trigram']['hits']}), "
+                f"tsvector {r['index_tsvector']['p50_ms']}ms ({r['index_tsvector']['hits']})"
+            )
+        cur.execute('analyze "RestaurantSearch"')
+        for route, (bodies, variants) in FILTERED_VARIANTS.items():
+            results[route] = {}
+            for body in bodies:
+                label = json.dumps(body, ensure_ascii=False)
+                r = results[route][label] = {name: time_query(cur, fn, body, repeats) for name, fn in variants.items()}
+                log.info(
+                    f"{route} {label}: raw {r['raw']['p50_ms']}ms ({r['raw']['hits']} hits), "
+                    f"index {r['index']['p50_ms']}ms ({r['index']['hits']})"
+                )
+        cur.execute(f"drop schema {schema} cascade")
+
+    out = OUTPUT_DIR / f"search-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.write_text(json.dumps(results, indent=2))
+    log.info(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
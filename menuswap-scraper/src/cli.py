@@ -0,0 +1,246 @@
+"""`menuswap-scraper` command line.
+
+One entry point for every stage. A subcommand imports its stage module only
+when it runs, so `menuswap-scraper seed` never loads bs4 or lxml and only
+uploads load boto3. Options default to the environment variables the stages
+already read, so `python -m src.<module>` and the CLI behave the same.
+
+    menuswap-scraper pipeline --no-seed --crawl-concurrency 12
+    menuswap-scraper --timing extract --limit 500
+    menuswap-scraper bench extraction --update-baseline
+"""
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import os
+import sys
+from typing import Callable, List, Optional
+
+HEAVY_MODULES = ("boto3", "bs4", "lxml", "pydantic", "numpy", "rapidfuzz", "psycopg", "aiohttp")
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _run_stage(stage: str, coro):
+    import asyncio
+
+    from .metrics import run_stage
+
+    return asyncio.run(run_stage(stage, coro))
+
+
+def _profiled(stage: str, fn: Callable):
+    from .profiling import profile
+
+    with profile(stage):
+        return fn()
+
+
+# Each loader imports what its subcommand needs and returns the callable that does the work.
+
+def _load_seed(args):
+    from .seed_osm import main
+
+    return lambda: _run_stage("seed", main())
+
+
+def _load_crawl(args):
+    from .crawl_queue import main
+
+    return lambda: _run_stage("crawl", main(limit=args.limit, concurrency=args.concurrency))
+
+
+def _load_download(args):
+    from .downloader import main
+
+    return lambda: _run_stage("download", main(concurrency=args.concurrency, limit=args.limit))
+
+
+def _load_extract(args):
+    from .extractor import main
+
+    return lambda: _run_stage("extract", main(concurrency=args.concurrency, limit=args.limit))
+
+
+def _load_pipeline(args):
+    from .pipeline import pipeline
+
+    options = {
+        k: v for k, v in (
+            ("crawl_limit", args.crawl_limit),
+            ("extract_backlog_limit", args.extract_limit),
+            ("download_backlog_limit", args.download_limit),
+            ("crawl_concurrency", args.crawl_concurrency),
+            ("extract_concurrency", args.extract_concurrency),
+            ("download_concurrency", args.download_concurrency),
+            ("queue_size", args.queue_size),
+        ) if v is not None
+    }
+    return lambda: _run_stage("pipeline", pipeline(seed=args.seed, **options))
+
+
+def _load_reextract(args):
+    from .reextract import main
+
+    return lambda: main(
+        batch_size=args.batch_size, workers=args.workers, dry_run=args.dry_run, backfill_limit=args.backfill
+    )
+
+
+def _load_migrate(args):
+    from .migrate import main
+
+    return main
+
+
+def _load_catalog(args):
+    from .dish_catalog import main
+
+    return lambda: _profiled("catalog", lambda: main(batch_size=args.batch_size))
+
+
+def _load_aggregates(args):
+    from .aggregates import main
+
+    return lambda: _profiled("aggregates", lambda: main(pending=args.pending))
+
+
+def _load_search_index(args):
+    from .search_index import main
+
+    return lambda: _profiled("search", main)
+
+
+def _load_export(args):
+    from .export import main
+
+    return lambda: _profiled("export", lambda: main(args.args))
+
+
+def _load_bench(args):
+    rest = args.args
+    if args.suite == "extraction":
+        from .bench.extraction import main
+
+        return lambda: main(rest)
+    if args.suite == "farm":
+        from .bench.farm import main
+
+        return lambda: main(rest)
+    parser = argparse.ArgumentParser(prog=f"menuswap-scraper bench {args.suite}")
+    if args.suite == "queries":
+        from .bench.queries import SIZES, main
+
+        parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="comma-separated row counts")
+        opts = parser.parse_args(rest)
+        return lambda: main([int(s) for s in opts.sizes.split(",")])
+    from .bench.search import DISHES, REPEATS, main
+
+    parser.add_argument("--dishes", type=int, default=DISHES)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    opts = parser.parse_args(rest)
+    return lambda: main(dishes=opts.dishes, repeats=opts.repeats)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="menuswap-scraper", description="MenuSwap scraper stages.")
+    parser.add_argument("--timing", action="store_true", help="report import, startup and run time")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    p = sub.add_parser("seed", help="seed restaurants from OpenStreetMap")
+    p.set_defaults(load=_load_seed)
+
+    p = sub.add_parser("crawl", help="discover menu sources on restaurant websites")
+    p.add_argument("--limit", type=int, default=_env_int("CRAWL_LIMIT", 5000))
+    p.add_argument("--concurrency", type=int, default=_env_int("CRAWL_CONCURRENCY", 6))
+    p.set_defaults(load=_load_crawl)
+
+    p = sub.add_parser("download", help="download PDF/image menu sources")
+    p.add_argument("--limit", type=int, default=_env_int("DOWNLOAD_LIMIT", 2000))
+    p.add_argument("--concurrency", type=int, default=_env_int("CONCURRENCY", 10))
+    p.set_defaults(load=_load_download)
+
+    p = sub.add_parser("extract", help="extract dishes from HTML menus")
+    p.add_argument("--limit", type=int, default=_env_int("EXTRACT_LIMIT", 2000))
+    p.add_argument("--concurrency", type=int, default=_env_int("CONCURRENCY", 8))
+    p.set_defaults(load=_load_extract)
+
+    p = sub.add_parser("pipeline", help="seed, then crawl, extract and download as one streaming run")
+    p.add_argument("--no-seed", dest="seed", action="store_false", default=None, help="skip seeding")
+    for flag in ("crawl-limit", "extract-limit", "download-limit", "crawl-concurrency",
+                 "extract-concurrency", "download-concurrency", "queue-size"):
+        p.add_argument(f"--{flag}", type=int)
+    p.set_defaults(load=_load_pipeline)
+
+    p = sub.add_parser("reextract", help="re-run dish extraction over archived pages")
+    p.add_argument("--batch-size", type=int, default=_env_int("REEXTRACT_BATCH", 500))
+    p.add_argument("--workers", type=int, default=_env_int("REEXTRACT_WORKERS", os.cpu_count() or 2))
+    p.add_argument("--dry-run", action="store_true", default=os.getenv("REEXTRACT_DRY_RUN", "").lower() in ("1", "true", "yes", "on"))
+    p.add_argument("--backfill", type=int, default=_env_int("REEXTRACT_BACKFILL", 0), metavar="N",
+                   help="first archive pages of up to N menus whose page is not in the archive")
+    p.set_defaults(load=_load_reextract)
+
+    p = sub.add_parser("migrate", help="apply pending SQL migrations")
+    p.set_defaults(load=_load_migrate)
+
+    p = sub.add_parser("catalog", help="cluster new dishes into the canonical dish catalog")
+    p.add_argument("--batch-size", type=int, default=_env_int("DISH_CLUSTER_BATCH", 20000))
+    p.set_defaults(load=_load_catalog)
+
+    p = sub.add_parser("aggregates", help="rebuild city, dish and section aggregates")
+    p.add_argument("--pending", action="store_true", help="only apply queued approvals and verifications")
+    p.set_defaults(load=_load_aggregates)
+
+    p = sub.add_parser("search-index", help="rebuild the dish and restaurant search index")
+    p.set_defaults(load=_load_search_index)
+
+    p = sub.add_parser("export", help="write changed restaurants, menus and dishes as partitioned Parquet",
+                       add_help=False)
+    # Every argument, --help included, goes to src.export's own parser
+    p.set_defaults(load=_load_export, passthrough=True)
+
+    p = sub.add_parser("bench", help="run a benchmark (remaining arguments go to the benchmark)")
+    p.add_argument("suite", choices=("queries", "search", "extraction", "farm"))
+    p.add_argument("args", nargs=argparse.REMAINDER)
+    p.set_defaults(load=_load_bench)
+    return parser
+
+
+def _report_timing(command: str, parsed: float, loaded: float, finished: float) -> None:
+    import resource
+
+    from .log import get_logger
+
+    heavy = [m for m in HEAVY_MODULES if m in sys.modules]
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    get_logger("cli").info(
+        f"timing {command}: cli ready {(parsed - _STARTED) * 1000:.0f}ms, "
+        f"imports {(loaded - parsed) * 1000:.0f}ms, run {finished - loaded:.2f}s, "
+        f"{len(sys.modules)} modules ({', '.join(heavy) or 'no heavy deps'}), peak RSS {peak_mb:.0f}MB"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if getattr(args, "passthrough", False):
+        args.args = rest
+    elif rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    parsed = time.perf_counter()
+    run = args.load(args)
+    loaded = time.perf_counter()
+    try:
+        result = run()
+    finally:
+        if args.timing:
+            _report_timing(args.command, parsed, loaded, time.perf_counter())
+    return result if isinstance(result, int) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
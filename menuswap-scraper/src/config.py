@@ -14,6 +14,13 @@ MENU_HINT_WORDS = [
     "menukaart","menu","kaart","gerechten","dranken","wijn","lunch","diner","eten","spijskaart"
 ]
 
+# Menu discovery: how far to follow menu-hinted links, and how many requests (pages,
+# robots.txt and sitemap files together) to spend per site
+MENU_DISCOVERY_MAX_DEPTH = int(os.getenv("MENU_DISCOVERY_MAX_DEPTH", "2"))
+MENU_DISCOVERY_REQUEST_BUDGET = int(os.getenv("MENU_DISCOVERY_REQUEST_BUDGET", "4"))
+SITEMAP_MAX_FILES = int(os.getenv("SITEMAP_MAX_FILES", "4"))
+SITEMAP_MAX_BYTES = int(os.getenv("SITEMAP_MAX_BYTES", str(5 * 1024 * 1024)))
+
 # Cloudflare R2 / S3-compatible storage
 R2_ACCESS_KEY_ID = os.getenv("R2_ACCESS_KEY_ID")
 R2_SECRET_ACCESS_KEY = os.getenv("R2_SECRET_ACCESS_KEY")
@@ -1,4 +1,5 @@
 import asyncio
+import os
 import aiohttp
 from tqdm import tqdm
 from .db import (
@@ -8,26 +9,35 @@ from .db import (
     select_restaurants_needing_crawl,
 )
 from .menu_link_finder import find_menu_links
-from .config import USER_AGENT, UPDATE_MODE
+from .config import UPDATE_MODE
+from .sessions import client_session
 from .log import get_logger
+from .metrics import run_stage
 
 def fetch_target_restaurants(limit=5000):
     with get_conn() as conn, conn.cursor() as cur:
         return select_restaurants_needing_crawl(cur, limit, update_mode=UPDATE_MODE)
 
-async def process_restaurant(row, session: aiohttp.ClientSession):
+async def discover_menus(row, session: aiohttp.ClientSession):
+    """Find a restaurant's menu sources and store them.
+
+    Returns [(menu_id, url, source_type, is_new)].
+    """
     log = get_logger("crawl")
     rest_id, name, site = row
     log.debug(f"Fetching menu links for {name} ({rest_id}) {site}")
     links = await find_menu_links(site, session=session)
-    if not links: return 0
-    created = 0
+    if not links: return []
+    menus = []
     with get_pooled_conn() as conn, conn.cursor() as cur:
         for l in links:
-            _menu_id, is_new = ensure_menu_for_source(cur, rest_id, l["url"], l["source_type"])
-            if is_new:
-                created += 1
-    return created
+            menu_id, is_new = ensure_menu_for_source(cur, rest_id, l["url"], l["source_type"])
+            menus.append((menu_id, l["url"], l["source_type"], is_new))
+    return menus
+
+async def process_restaurant(row, session: aiohttp.ClientSession):
+    menus = await discover_menus(row, session=session)
+    return sum(1 for m in menus if m[3])
 
 async def main(limit=5000, concurrency=6):
     log = get_logger("crawl")
@@ -36,7 +46,7 @@ async def main(limit=5000, concurrency=6):
     sem = asyncio.Semaphore(concurrency)
     created_total = 0
 
-    async with aiohttp.ClientSession(headers={"User-Agent": USER_AGENT}) as session:
+    async with client_session("crawl") as session:
         async def worker(row):
             async with sem:
                 return await process_restaurant(row, session=session)
@@ -47,4 +57,6 @@ async def main(limit=5000, concurrency=6):
     log.info(f"Discovered {created_total} new menu sources.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    limit = int(os.getenv("CRAWL_LIMIT", "5000"))
+    concurrency = int(os.getenv("CRAWL_CONCURRENCY", "6"))
+    asyncio.run(run_stage("crawl", main(limit=limit, concurrency=concurrency)))
@@ -5,16 +5,27 @@ import queue
 from .config import DATABASE_URL
 from .utils import slugify
 from .log import get_logger
+from .metrics import counter, gauge, histogram, FAST_BUCKETS
 
-def get_conn():
-    """Open a new connection with retry/backoff."""
+POOL_ACQUIRE_SECONDS = histogram("db_pool_acquire_seconds", "Time waiting for a pooled DB connection", buckets=FAST_BUCKETS)
+POOL_WAITS = counter("db_pool_waits_total", "Acquires that blocked because the pool was exhausted")
+POOL_HOLD_SECONDS = histogram("db_pool_hold_seconds", "Time a pooled DB connection is held", buckets=FAST_BUCKETS)
+
+def get_conn(dsn: str = None):
+    """Open a new connection with retry/backoff (to DATABASE_URL unless `dsn` is given).
+
+    The session time zone is UTC, so now() stored in a timestamp column matches
+    the UTC values Prisma writes.
+    """
     log = get_logger("db")
     delay = 0.5
     attempts = 5
     last_err = None
     for i in range(attempts):
         try:
-            return psycopg.connect(DATABASE_URL, autocommit=True)
+            conn = psycopg.connect(dsn or DATABASE_URL, autocommit=True)
+            conn.execute("set timezone to 'UTC'")
+            return conn
         except Exception as e:
             last_err = e
             log.debug(f"connect attempt {i+1}/{attempts} failed; retrying in {delay:.1f}s…")
@@ -29,6 +40,9 @@ class _ConnectionPool:
         self._pool: "queue.LifoQueue[psycopg.Connection]" = queue.LifoQueue(maxsize)
         self._created = 0
         self._maxsize = maxsize
+        connections = gauge("db_pool_connections", "Pooled DB connections", ("state",))
+        connections.set_function(lambda: self._created, state="open")
+        connections.set_function(self._pool.qsize, state="idle")
 
     def _create_conn(self) -> psycopg.Connection:
         return get_conn()
@@ -43,6 +57,7 @@ class _ConnectionPool:
                 self._created += 1
                 return conn
             # Pool exhausted: block until one is returned
+            POOL_WAITS.inc()
             return self._pool.get()
 
     def release(self, conn: psycopg.Connection) -> None:
@@ -55,6 +70,19 @@ class _ConnectionPool:
             except Exception:
                 pass
 
+    def close_all(self) -> None:
+        """Close idle connections so the next acquire opens fresh ones."""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            self._created -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+
 
 _GLOBAL_POOL = _ConnectionPool(maxsize=6)
 
@@ -65,12 +93,21 @@ def get_pooled_conn():
 
     Limits the number of open DB connections and reduces pressure during high concurrency.
     """
+    t0 = time.perf_counter()
     conn = _GLOBAL_POOL.acquire()
+    acquired = time.perf_counter()
+    POOL_ACQUIRE_SECONDS.observe(acquired - t0)
     try:
         yield conn
     finally:
+        POOL_HOLD_SECONDS.observe(time.perf_counter() - acquired)
         _GLOBAL_POOL.release(conn)
 
+
+def close_pool() -> None:
+    """Drop idle pooled connections, e.g. after changing connection settings."""
+    _GLOBAL_POOL.close_all()
+
 def upsert_restaurant(cur, r):
     """Upsert into Prisma's "Restaurant" by unique slug.
 
@@ -110,26 +147,63 @@ def upsert_restaurant(cur, r):
 def ensure_menu_for_source(cur, restaurant_id: str, url: str, source_type: str):
     """Create a "Menu" row for a discovered source if not already present.
 
-    Deduplicate by (restaurantId, sourceUrl).
+    Deduplicate by (restaurantId, sourceUrl) using the unique index from
+    sql/migrations/001_selection_indexes.sql.
     source_type must be one of Prisma enum values: PDF, IMAGE, URL.
     """
     cur.execute(
-        "select id from \"Menu\" where \"restaurantId\"=%s and \"sourceUrl\"=%s",
-        (restaurant_id, url),
+        """
+        insert into "Menu" ("restaurantId", "sourceType", "sourceUrl")
+        values (%s, %s::"SourceType", %s)
+        on conflict ("restaurantId", "sourceUrl") do nothing
+        returning id
+        """,
+        (restaurant_id, source_type, url),
     )
-    existing = cur.fetchone()
-    if existing:
-        return existing[0], False
+    created = cur.fetchone()
+    if created:
+        return created[0], True
     cur.execute(
-        "insert into \"Menu\" (\"restaurantId\", \"sourceType\", \"sourceUrl\") values (%s, %s::\"SourceType\", %s) returning id",
-        (restaurant_id, source_type, url),
+        "select id from \"Menu\" where \"restaurantId\"=%s and \"sourceUrl\"=%s",
+        (restaurant_id, url),
     )
-    return cur.fetchone()[0], True
+    return cur.fetchone()[0], False
+
+_UPSERT_RESTAURANTS_SQL = """
+with input as (
+  select *
+  from unnest(%s::text[], %s::text[], %s::text[], %s::text[], %s::text[], %s::numeric[], %s::numeric[])
+    as t(name, slug, city, address, "websiteUrl", lat, lon)
+),
+previous as (
+  select r.slug, r.name, r.city from "Restaurant" r join input i on i.slug = r.slug
+),
+upserted as (
+  insert into "Restaurant" ("name", "slug", "city", "address", "websiteUrl", "lat", "lon", "updatedAt")
+  select name, slug, city, address, "websiteUrl", lat, lon, now() from input
+  on conflict ("slug") do update set
+    "name"=excluded."name",
+    "city"=excluded."city",
+    "address"=excluded."address",
+    "websiteUrl"=coalesce(excluded."websiteUrl", "Restaurant"."websiteUrl"),
+    "lat"=excluded."lat",
+    "lon"=excluded."lon",
+    "updatedAt"=now()
+  returning id, slug, name, city, verified
+)
+select u.id, u.city, p.city, p.slug is null or p.name is distinct from u.name or p.city is distinct from u.city, u.verified
+from upserted u
+left join previous p on p.slug = u.slug
+"""
 
 def upsert_restaurants_bulk(cur, records, batch_size: int = 1000):
-    """Bulk upsert restaurants by slug using batched executemany (psycopg3).
+    """Bulk upsert restaurants by slug, one statement per batch of `batch_size`.
 
     records: iterable of dicts with keys matching SeedRestaurant.model_dump()
+
+    Returns (id, city, previous_city, changed, verified) per restaurant, where
+    previous_city is None for new restaurants and changed is true when a
+    restaurant is new or its name or city changed.
     """
     log = get_logger("db")
 
@@ -154,47 +228,24 @@ def upsert_restaurants_bulk(cur, records, batch_size: int = 1000):
             r.get("lon"),
         )
 
+    def flush(buf):
+        # One statement cannot update a row twice, so the last record per slug wins
+        rows = list({row[1]: row for row in buf}.values())
+        cur.execute(_UPSERT_RESTAURANTS_SQL, [list(col) for col in zip(*rows)])
+        return cur.fetchall()
+
+    results = []
     buf = []
-    count = 0
     for rec in records:
         buf.append(to_row(rec))
         if len(buf) >= batch_size:
-            cur.executemany(
-                """
-                insert into "Restaurant" ("name", "slug", "city", "address", "websiteUrl", "lat", "lon", "updatedAt")
-                values (%s,%s,%s,%s,%s,%s,%s, now())
-                on conflict ("slug") do update set
-                  "name"=excluded."name",
-                  "city"=excluded."city",
-                  "address"=excluded."address",
-                  "websiteUrl"=coalesce(excluded."websiteUrl", "Restaurant"."websiteUrl"),
-                  "lat"=excluded."lat",
-                  "lon"=excluded."lon",
-                  "updatedAt"=now()
-                """,
-                buf,
-            )
-            count += batch_size
-            log.info(f"Upserted {count} restaurants so far…")
+            results += flush(buf)
+            log.info(f"Upserted {len(results)} restaurants so far…")
             buf.clear()
     if buf:
-        cur.executemany(
-            """
-            insert into "Restaurant" ("name", "slug", "city", "address", "websiteUrl", "lat", "lon", "updatedAt")
-            values (%s,%s,%s,%s,%s,%s,%s, now())
-            on conflict ("slug") do update set
-              "name"=excluded."name",
-              "city"=excluded."city",
-              "address"=excluded."address",
-              "websiteUrl"=coalesce(excluded."websiteUrl", "Restaurant"."websiteUrl"),
-              "lat"=excluded."lat",
-              "lon"=excluded."lon",
-              "updatedAt"=now()
-            """,
-            buf,
-        )
-        count += len(buf)
-        log.info(f"Upserted {count} restaurants in total.")
+        results += flush(buf)
+    log.info(f"Upserted {len(results)} restaurants in total.")
+    return results
 
 def select_restaurants_with_websites(cur, limit: int):
     cur.execute(
@@ -203,46 +254,65 @@ def select_restaurants_with_websites(cur, limit: int):
     )
     return cur.fetchall()
 
-def select_restaurants_needing_crawl(cur, limit: int, update_mode: bool):
+def select_restaurants_needing_crawl(cur, limit: int, update_mode: bool, after_id: str = None):
     """Return restaurants to crawl.
 
     - When update_mode is False: only restaurants with a website and no existing Menu rows
     - When update_mode is True: all restaurants with a website
+    - after_id: keyset cursor; only restaurants with id > after_id are returned
     """
+    after_clause = "and r.id > %s" if after_id else ""
+    params = (after_id, limit) if after_id else (limit,)
     if update_mode:
         cur.execute(
-            "select id, name, \"websiteUrl\" from \"Restaurant\" where \"websiteUrl\" is not null and \"websiteUrl\" <> '' order by id asc limit %s",
-            (limit,),
+            f"""
+            select r.id, r.name, r."websiteUrl"
+            from "Restaurant" r
+            where r."websiteUrl" is not null and r."websiteUrl" <> '' {after_clause}
+            order by r.id asc
+            limit %s
+            """,
+            params,
         )
     else:
         # Exclude restaurants that already have at least one Menu record
         cur.execute(
-            """
+            f"""
             select r.id, r.name, r."websiteUrl"
             from "Restaurant" r
             where r."websiteUrl" is not null
               and r."websiteUrl" <> ''
+              {after_clause}
               and not exists (
                 select 1 from "Menu" m where m."restaurantId" = r.id
               )
             order by r.id asc
             limit %s
             """,
-            (limit,),
+            params,
         )
     return cur.fetchall()
 
-def select_menus_needing_download(cur, limit: int):
-    """Pick menus that have a sourceUrl and no checksum yet (not downloaded)."""
-    cur.execute(
-        "select id, \"sourceUrl\" from \"Menu\" where \"sourceUrl\" is not null and (\"checksum\" is null or \"checksum\" = '') order by \"uploadedAt\" asc limit %s",
-        (limit,),
-    )
+def select_menus_needing_download(cur, limit: int, source_types=None):
+    """Pick menus that have a sourceUrl and no checksum yet (not downloaded).
+
+    source_types optionally restricts to Prisma SourceType values, e.g. ["PDF", "IMAGE"].
+    """
+    if source_types:
+        cur.execute(
+            "select id, \"sourceUrl\" from \"Menu\" where \"sourceUrl\" is not null and (\"checksum\" is null or \"checksum\" = '') and \"sourceType\" = any(%s::\"SourceType\"[]) order by \"uploadedAt\" asc limit %s",
+            (list(source_types), limit),
+        )
+    else:
+        cur.execute(
+            "select id, \"sourceUrl\" from \"Menu\" where \"sourceUrl\" is not null and (\"checksum\" is null or \"checksum\" = '') order by \"uploadedAt\" asc limit %s",
+            (limit,),
+        )
     return cur.fetchall()
 
 def record_menu_download(cur, menu_id: str, checksum: str):
     cur.execute(
-        "update \"Menu\" set \"checksum\"=%s where id=%s",
+        "update \"Menu\" set \"checksum\"=%s, \"updatedAt\"=now() where id=%s",
         (checksum, menu_id),
     )
 
@@ -252,7 +322,7 @@ def record_menu_downloads_bulk(cur, updates):
         return
     # Psycopg3 executemany
     cur.executemany(
-        "update \"Menu\" set \"checksum\"=%s where id=%s",
+        "update \"Menu\" set \"checksum\"=%s, \"updatedAt\"=now() where id=%s",
         updates,
     )
 
@@ -280,34 +350,250 @@ def select_menus_without_dishes(cur, limit: int):
 def upsert_dish(cur, menu_id: str, name: str, slug: str, section: str, price_cents, description=None, tags=None, image_url=None):
     """Upsert a Dish on (menuId, slug) to avoid duplicates.
 
+    Single round trip via ON CONFLICT; `xmax = 0` is true only for freshly
+    inserted rows.
+
     Returns (dish_id, is_new)
     """
     if tags is None:
         tags = []
-    # Check existing by (menuId, slug)
     cur.execute(
-        "select id from \"Dish\" where \"menuId\"=%s and slug=%s",
-        (menu_id, slug),
+        """
+        insert into "Dish" ("menuId", name, slug, description, "priceCents", section, tags, "imageUrl")
+        values (%s,%s,%s,%s,%s,%s,%s,%s)
+        on conflict ("menuId", slug) do update set
+          name=excluded.name,
+          description=excluded.description,
+          "priceCents"=excluded."priceCents",
+          section=excluded.section,
+          tags=excluded.tags,
+          "imageUrl"=excluded."imageUrl",
+          "updatedAt"=now()
+        returning id, (xmax = 0) as inserted
+        """,
+        (menu_id, name, slug, description, price_cents, section, tags, image_url),
     )
+    dish_id, inserted = cur.fetchone()
+    return dish_id, inserted
+
+def get_checkpoint(cur, stage: str):
+    cur.execute("select cursor from \"ScraperCheckpoint\" where stage=%s", (stage,))
     row = cur.fetchone()
-    if row:
-        # Update basic fields if changed
+    return row[0] if row else None
+
+def save_checkpoint(cur, stage: str, cursor) -> None:
+    """Store (or with cursor=None, clear) the resume point of a pipeline stage."""
+    if cursor is None:
+        cur.execute("delete from \"ScraperCheckpoint\" where stage=%s", (stage,))
+        return
+    cur.execute(
+        """
+        insert into "ScraperCheckpoint" (stage, cursor, "updatedAt") values (%s, %s, now())
+        on conflict (stage) do update set cursor=excluded.cursor, "updatedAt"=now()
+        """,
+        (stage, str(cursor)),
+    )
+
+def select_archived_menus(cur, after_id, limit: int):
+    """URL menus whose page is archived (checksum set), in id order after `after_id`: (id, checksum)."""
+    after_clause = "and id > %s" if after_id else ""
+    params = (after_id, limit) if after_id else (limit,)
+    cur.execute(
+        f"""
+        select id, checksum
+        from "Menu"
+        where "sourceType" = 'URL' and checksum is not null and checksum <> '' {after_clause}
+        order by id asc
+        limit %s
+        """,
+        params,
+    )
+    return cur.fetchall()
+
+def select_url_menus_for_archive(cur, after_id, limit: int):
+    """URL menus that have dishes, in id order after `after_id`: (id, sourceUrl, checksum).
+
+    The caller checks the page archive for each checksum; an empty one was never archived.
+    """
+    after_clause = "and m.id > %s" if after_id else ""
+    params = (after_id, limit) if after_id else (limit,)
+    cur.execute(
+        f"""
+        select m.id, m."sourceUrl", m.checksum
+        from "Menu" m
+        where m."sourceType" = 'URL'
+          and m."sourceUrl" is not null
+          and exists (select 1 from "Dish" d where d."menuId" = m.id) {after_clause}
+        order by m.id asc
+        limit %s
+        """,
+        params,
+    )
+    return cur.fetchall()
+
+def select_dishes_for_menus(cur, menu_ids):
+    """Current dishes of the given menus.
+
+    Returns rows (id, menuId, slug, name, priceCents, section, description, favorited).
+    """
+    cur.execute(
+        """
+        select d.id, d."menuId", d.slug, d.name, d."priceCents", d.section, d.description,
+               exists (select 1 from "Favorite" f where f."dishId" = d.id)
+        from "Dish" d
+        where d."menuId" = any(%s::uuid[])
+        """,
+        (list(menu_ids),),
+    )
+    return cur.fetchall()
+
+def apply_dish_changes(cur, inserts, updates, deletes) -> int:
+    """Write a batch of dish differences.
+
+    - inserts: [(menuId, name, slug, description, priceCents, section)]
+    - updates: [(name, description, priceCents, section, id)]
+    - deletes: [id]; dishes that are someone's favorite are never deleted
+
+    Renamed dishes lose their "DishCanonical" mapping until the dish catalog
+    clusters them again, and the "dishCount" of every canonical dish that lost
+    a member is recomputed.
+
+    Returns the number of rows deleted.
+    """
+    touched = set()
+    if inserts:
+        cur.executemany(
+            """
+            insert into "Dish" ("menuId", name, slug, description, "priceCents", section, tags)
+            values (%s,%s,%s,%s,%s,%s,'{}')
+            on conflict ("menuId", slug) do nothing
+            """,
+            inserts,
+        )
+    if updates:
         cur.execute(
             """
-            update "Dish"
-            set name=%s, description=%s, "priceCents"=%s, section=%s, tags=%s, "imageUrl"=%s
-            where id=%s
+            delete from "DishCanonical" dc
+            using unnest(%s::uuid[], %s::text[]) as u(id, name), "Dish" d
+            where dc."dishId" = u.id and d.id = u.id and d.name is distinct from u.name
+            returning dc."canonicalId"
             """,
-            (name, description, price_cents, section, tags, image_url, row[0]),
+            ([u[4] for u in updates], [u[0] for u in updates]),
         )
-        return row[0], False
-    else:
+        touched.update(r[0] for r in cur.fetchall())
+        cur.executemany(
+            "update \"Dish\" set name=%s, description=%s, \"priceCents\"=%s, section=%s, \"updatedAt\"=now() where id=%s",
+            updates,
+        )
+    deleted = 0
+    if deletes:
+        # The mappings go with the dishes (on delete cascade), so note their canonicals first
+        cur.execute(
+            "select \"canonicalId\" from \"DishCanonical\" where \"dishId\" = any(%s::uuid[])",
+            (list(deletes),),
+        )
+        touched.update(r[0] for r in cur.fetchall())
         cur.execute(
             """
-            insert into "Dish" ("menuId", name, slug, description, "priceCents", section, tags, "imageUrl")
-            values (%s,%s,%s,%s,%s,%s,%s,%s)
-            returning id
+            delete from "Dish" d
+            where d.id = any(%s::uuid[])
+              and not exists (select 1 from "Favorite" f where f."dishId" = d.id)
             """,
-            (menu_id, name, slug, description, price_cents, section, tags, image_url),
+            (list(deletes),),
         )
-        return cur.fetchone()[0], True
+        deleted = cur.rowcount
+    recount_canonical_dishes(cur, touched)
+    return deleted
+
+def select_dishes_for_clustering(cur, after, limit: int, settle_seconds: int = 60):
+    """Dishes added or changed after the `after` watermark, oldest first: (id, name, updatedAt).
+
+    `after` is the (updatedAt, id) of the last dish processed, or None to
+    start from the beginning. Dishes written in the last `settle_seconds` are
+    left for the next run, so a transaction that committed late cannot slip
+    behind the watermark.
+    """
+    after_clause = "and (d.\"updatedAt\", d.id) > (%s, %s)" if after else ""
+    params = (settle_seconds, *after, limit) if after else (settle_seconds, limit)
+    cur.execute(
+        f"""
+        select d.id, d.name, d."updatedAt"
+        from "Dish" d
+        where d."updatedAt" < localtimestamp - make_interval(secs => %s) {after_clause}
+        order by d."updatedAt", d.id
+        limit %s
+        """,
+        params,
+    )
+    return cur.fetchall()
+
+def select_canonical_dishes_for_blocks(cur, block_keys):
+    """Return existing canonical dishes for the given blocking keys: (id, normName, blockKey)."""
+    cur.execute(
+        "select id, \"normName\", \"blockKey\" from \"CanonicalDish\" where \"blockKey\" = any(%s) order by \"createdAt\", id",
+        (list(block_keys),),
+    )
+    return cur.fetchall()
+
+def insert_canonical_dishes(cur, rows):
+    """Insert canonical dishes; rows is List[Tuple[name, slug, normName, blockKey]].
+
+    Returns the ids in input order. A slug that already exists resolves to the
+    existing canonical dish.
+    """
+    if not rows:
+        return []
+    cur.executemany(
+        """
+        insert into "CanonicalDish" (name, slug, "normName", "blockKey")
+        values (%s,%s,%s,%s)
+        on conflict (slug) do update set "updatedAt"=now()
+        returning id
+        """,
+        rows,
+        returning=True,
+    )
+    ids = []
+    while True:
+        ids.append(cur.fetchone()[0])
+        if not cur.nextset():
+            break
+    return ids
+
+def recount_canonical_dishes(cur, canonical_ids) -> None:
+    """Recompute "CanonicalDish"."dishCount" of the given canonical dishes from their mappings."""
+    canonical_ids = list(canonical_ids)
+    if not canonical_ids:
+        return
+    cur.execute(
+        """
+        update "CanonicalDish" c
+        set "dishCount" = (select count(*) from "DishCanonical" dc where dc."canonicalId" = c.id),
+            "updatedAt" = now()
+        where c.id = any(%s::uuid[])
+        """,
+        (canonical_ids,),
+    )
+
+def record_dish_canonicals_bulk(cur, mappings):
+    """Store dish -> canonical mappings; mappings is List[Tuple[dish_id, canonical_id, score]].
+
+    A dish that is clustered again (its name changed) moves to its new
+    canonical, and both canonicals are recounted.
+    """
+    if not mappings:
+        return
+    cur.execute(
+        "select distinct \"canonicalId\" from \"DishCanonical\" where \"dishId\" = any(%s::uuid[])",
+        ([m[0] for m in mappings],),
+    )
+    touched = {r[0] for r in cur.fetchall()} | {m[1] for m in mappings}
+    cur.executemany(
+        """
+        insert into "DishCanonical" ("dishId", "canonicalId", score)
+        values (%s,%s,%s)
+        on conflict ("dishId") do update set "canonicalId"=excluded."canonicalId", score=excluded.score
+        """,
+        mappings,
+    )
+    recount_canonical_dishes(cur, touched)
@@ -0,0 +1,173 @@
+"""Cluster dish names across all menus into a canonical dish catalog.
+
+Dishes are processed in "updatedAt" order after a watermark kept in
+"ScraperCheckpoint", so repeated runs touch only dishes added or changed since
+the last run; a renamed dish is re-clustered and moves to its new canonical.
+Dishes are grouped by a cheap blocking key and compared with
+`rapidfuzz.process.cdist` inside their block only: against the block's
+existing canonical names first, then against each other for the leftovers.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from .db import (
+    get_checkpoint,
+    get_conn,
+    insert_canonical_dishes,
+    record_dish_canonicals_bulk,
+    save_checkpoint,
+    select_canonical_dishes_for_blocks,
+    select_dishes_for_clustering,
+)
+from .log import get_logger
+from .profiling import profile
+from .utils import dish_name_tokens, normalize_text, slugify
+
+CATALOG_STAGE = "catalog"
+BATCH_SIZE = int(os.getenv("DISH_CLUSTER_BATCH", "20000"))
+CHUNK_SIZE = int(os.getenv("DISH_CLUSTER_CHUNK", "1000"))
+THRESHOLD = float(os.getenv("DISH_CLUSTER_THRESHOLD", "88"))
+
+
+def normalized_dish_name(name: str) -> str:
+    """Sorted-token signature used both for matching and as the canonical key."""
+    tokens = dish_name_tokens(name)
+    if tokens:
+        return " ".join(sorted(tokens))
+    return normalize_text(name) or (name or "").strip().lower()
+
+
+def blocking_key(norm: str) -> str:
+    """First four characters of the longest token.
+
+    The longest token is usually the dish noun ("biefstuk", "biefstukje"), so
+    word order, filler words and diminutives land in the same block.
+    """
+    tokens = norm.split()
+    if not tokens:
+        return ""
+    return max(tokens, key=lambda t: (len(t), t))[:4]
+
+
+def cluster_block(
+    norms: Sequence[str],
+    canon_norms: Sequence[str],
+    threshold: float = THRESHOLD,
+    chunk_size: int = CHUNK_SIZE,
+) -> Tuple[List[Tuple[int, float]], List[int]]:
+    """Assign each name in `norms` to a canonical within one block.
+
+    Returns (assignments, created): assignments[i] is (canonical_index, score)
+    where indexes past len(canon_norms) point at new canonicals, and created
+    lists the positions in `norms` that became those new canonicals (in order).
+    Work is chunked so a large block never builds a dishes x dishes matrix.
+    """
+    canon = list(canon_norms)
+    assignments: List[Optional[Tuple[int, float]]] = [None] * len(norms)
+    created: List[int] = []
+
+    for start in range(0, len(norms), chunk_size):
+        chunk = list(norms[start:start + chunk_size])
+        if canon:
+            scores = process.cdist(
+                chunk, canon, scorer=fuzz.token_sort_ratio, score_cutoff=threshold, workers=-1
+            )
+            best = scores.argmax(axis=1)
+            for i, j in enumerate(best):
+                s = float(scores[i, j])
+                if s >= threshold:
+                    assignments[start + i] = (int(j), s)
+
+        pending = [i for i in range(len(chunk)) if assignments[start + i] is None]
+        if not pending:
+            continue
+        texts = [chunk[i] for i in pending]
+        self_scores = process.cdist(
+            texts, texts, scorer=fuzz.token_sort_ratio, score_cutoff=threshold, workers=-1
+        )
+        taken = np.zeros(len(pending), dtype=bool)
+        for a, i in enumerate(pending):
+            if taken[a]:
+                continue
+            # Greedy: the first unassigned name becomes the representative and
+            # absorbs every later unassigned name within the threshold.
+            canon.append(chunk[i])
+            cid = len(canon) - 1
+            created.append(start + i)
+            assignments[start + i] = (cid, 100.0)
+            taken[a] = True
+            row = self_scores[a]
+            for b in np.nonzero((row >= threshold) & ~taken)[0]:
+                taken[b] = True
+                assignments[start + pending[b]] = (cid, float(row[b]))
+
+    return assignments, created
+
+
+def cluster_batch(cur, dishes) -> Tuple[int, int]:
+    """Cluster one batch of (dish_id, name) rows. Returns (mapped, new_canonicals)."""
+    blocks: Dict[str, List[Tuple[str, str, str]]] = defaultdict(list)
+    for dish_id, name in dishes:
+        norm = normalized_dish_name(name)
+        blocks[blocking_key(norm)].append((dish_id, name, norm))
+
+    existing: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+    for cid, norm, key in select_canonical_dishes_for_blocks(cur, blocks.keys()):
+        existing[key].append((cid, norm))
+
+    mappings = []
+    created_total = 0
+    for key, members in blocks.items():
+        canon = existing.get(key, [])
+        assignments, created = cluster_block([m[2] for m in members], [c[1] for c in canon])
+        new_rows = []
+        for pos in created:
+            _dish_id, name, norm = members[pos]
+            new_rows.append((name, slugify(norm) or slugify(name) or norm, norm, key))
+        canon_ids = [c[0] for c in canon] + insert_canonical_dishes(cur, new_rows)
+        created_total += len(new_rows)
+        for (dish_id, _name, _norm), (idx, score) in zip(members, assignments):
+            mappings.append((dish_id, canon_ids[idx], score))
+
+    record_dish_canonicals_bulk(cur, mappings)
+    return len(mappings), created_total
+
+
+def parse_watermark(cursor: Optional[str]) -> Optional[Tuple[datetime, str]]:
+    """Checkpoint text "<updatedAt iso>|<dish id>" -> (updatedAt, id)."""
+    if not cursor:
+        return None
+    updated_at, dish_id = cursor.split("|", 1)
+    return datetime.fromisoformat(updated_at), dish_id
+
+
+def main(batch_size: int = BATCH_SIZE):
+    log = get_logger("catalog")
+    mapped_total = 0
+    created_total = 0
+    with get_conn() as conn, conn.cursor() as cur:
+        after = parse_watermark(get_checkpoint(cur, CATALOG_STAGE))
+        while True:
+            dishes = select_dishes_for_clustering(cur, after, batch_size)
+            if not dishes:
+                break
+            dish_id, _name, updated_at = dishes[-1]
+            after = (updated_at, dish_id)
+            # The watermark moves in the same transaction as the mappings it covers
+            with conn.transaction():
+                mapped, created = cluster_batch(cur, [(d[0], d[1]) for d in dishes])
+                save_checkpoint(cur, CATALOG_STAGE, f"{updated_at.isoformat()}|{dish_id}")
+            mapped_total += mapped
+            created_total += created
+            log.info(f"Mapped {mapped_total} dishes so far ({created_total} new canonical dishes)…")
+    log.info(f"Dish catalog up to date: mapped {mapped_total} dishes, {created_total} new canonical dishes.")
+
+
+if __name__ == "__main__":
+    with profile("catalog"):
+        main()
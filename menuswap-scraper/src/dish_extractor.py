@@ -1,11 +1,18 @@
 import asyncio
-from typing import List, Dict, Optional
+from collections import defaultdict
+from typing import List, Dict, Optional, Tuple
 import aiohttp
-from bs4 import BeautifulSoup
+from rapidfuzz import fuzz
 
-from .config import USER_AGENT, REQUEST_TIMEOUT_SECONDS
-from .utils import PRICE_RE, price_string_to_cents, slugify
+from .config import REQUEST_TIMEOUT_SECONDS
+from .utils import PRICE_RE, price_string_to_cents, slugify, dish_name_tokens
 from .log import get_logger
+from .metrics import counter, histogram, FAST_BUCKETS
+from .sessions import client_session
+
+PARSE_SECONDS = histogram("html_parse_seconds", "HTML parse time", ("component",), buckets=FAST_BUCKETS)
+DISHES_EXTRACTED = counter("dishes_extracted_total", "Dishes parsed from menu pages")
+DISHES_MERGED = counter("dishes_merged_total", "Near-duplicate dishes merged before upsert")
 
 
 async def fetch_html(session: aiohttp.ClientSession, url: str) -> Optional[str]:
@@ -28,6 +35,9 @@ def heuristically_extract_dishes_from_html(html: str) -> List[Dict]:
 
     Returns a list of dicts: { name, price_cents, section?, description? }
     """
+    # Imported here so stages that never parse dishes don't pay for bs4
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html, "lxml")
 
     # Try common menu structures: definition lists, tables, and lists
@@ -117,16 +127,103 @@ def heuristically_extract_dishes_from_html(html: str) -> List[Dict]:
     return unique
 
 
+def _prices_compatible(a: Optional[int], b: Optional[int]) -> bool:
+    return a is None or b is None or a == b
+
+
+def _numbers(tokens: List[str]) -> List[str]:
+    return sorted(t for t in tokens if any(c.isdigit() for c in t))
+
+
+def _is_near_duplicate(a_tokens: List[str], b_tokens: List[str], threshold: float) -> bool:
+    """Same dish written twice: near-identical names, or one name plus a glued-on description.
+
+    Names with different numbers are different dishes ("Lunchmenu 2 gangen" vs
+    "Lunchmenu 3 gangen", "Pizza 12" vs "Pizza 13"), however similar the rest.
+    """
+    if _numbers(a_tokens) != _numbers(b_tokens):
+        return False
+    if fuzz.ratio(" ".join(a_tokens), " ".join(b_tokens), score_cutoff=threshold) >= threshold:
+        return True
+    short, long_ = sorted((a_tokens, b_tokens), key=len)
+    # "Biefstuk met friet" vs "Biefstuk mals gebakken met friet en salade": the
+    # extra words are a description, unlike "Pizza" vs "Pizza salami".
+    return bool(short) and short[0] == long_[0] and set(short) <= set(long_) and len(long_) - len(short) >= 3
+
+
+def _name_tokens(name: str) -> List[str]:
+    return dish_name_tokens(PRICE_RE.sub(" ", name))
+
+
+def _merge_into(keep: Dict, other: Dict, keep_tokens: List[str], other_tokens: List[str]) -> None:
+    """Fold `other` into `keep`, keeping the cleanest name and the richest fields."""
+    if len(other_tokens) < len(keep_tokens):
+        keep["name"] = other["name"]
+    if keep.get("price_cents") is None:
+        keep["price_cents"] = other.get("price_cents")
+    if len(other.get("description") or "") > len(keep.get("description") or ""):
+        keep["description"] = other["description"]
+    if keep.get("section") in (None, "", "Overig") and other.get("section") not in (None, "", "Overig"):
+        keep["section"] = other["section"]
+
+
+def consolidate_dishes(dishes: List[Dict], threshold: float = 90) -> Tuple[List[Dict], int]:
+    """Merge near-duplicate dishes found by different heuristics on one menu.
+
+    Two entries are merged when their prices agree (or one is missing), their
+    names carry the same numbers, and their normalized names are
+    near-identical or one is the other with a description appended. The merged entry keeps the shortest name, the
+    longest description and a specific section over "Overig".
+
+    Returns (dishes, removed_count).
+    """
+    kept: List[Dict] = []
+    kept_tokens: List[List[str]] = []
+    # Candidates only need comparing within the same name prefix
+    blocks: Dict[str, List[int]] = defaultdict(list)
+    for d in dishes:
+        tokens = _name_tokens(d["name"])
+        key = tokens[0][:3] if tokens else ""
+        match = None
+        best = -1.0
+        for idx in blocks[key]:
+            if not _prices_compatible(kept[idx].get("price_cents"), d.get("price_cents")):
+                continue
+            if not _is_near_duplicate(kept_tokens[idx], tokens, threshold):
+                continue
+            score = fuzz.ratio(" ".join(kept_tokens[idx]), " ".join(tokens))
+            if score > best:
+                match, best = idx, score
+        if match is None:
+            blocks[key].append(len(kept))
+            kept.append(dict(d))
+            kept_tokens.append(tokens)
+        else:
+            _merge_into(kept[match], d, kept_tokens[match], tokens)
+            if len(tokens) < len(kept_tokens[match]):
+                kept_tokens[match] = tokens
+    DISHES_MERGED.inc(len(dishes) - len(kept))
+    return kept, len(dishes) - len(kept)
+
+
+def extract_dishes_from_html(html: str) -> List[Dict]:
+    """heuristically_extract_dishes_from_html with parse-time and dish metrics."""
+    with PARSE_SECONDS.time(component="extract"):
+        dishes = heuristically_extract_dishes_from_html(html)
+    DISHES_EXTRACTED.inc(len(dishes))
+    return dishes
+
+
 async def extract_dishes_from_url(url: str, session: Optional[aiohttp.ClientSession] = None) -> List[Dict]:
     owns = False
     if session is None:
-        session = aiohttp.ClientSession(headers={"User-Agent": USER_AGENT})
+        session = client_session("extract")
         owns = True
     try:
         html = await fetch_html(session, url)
         if not html:
             return []
-        return heuristically_extract_dishes_from_html(html)
+        return extract_dishes_from_html(html)
     finally:
         if owns:
             await session.close()
@@ -1,15 +1,16 @@
 import asyncio
 import os
-import aiohttp
 from typing import List, Optional, Tuple
 from .db import get_conn, get_pooled_conn, select_menus_needing_download, record_menu_downloads_bulk
 from .fetcher import download_menu_source
-from .config import USER_AGENT
+from .sessions import client_session
 from .log import get_logger
+from .metrics import run_stage
 
 def fetch_pending_sources(limit=2000):
+    # URL menus are archived as HTML pages by the extractor, keyed by their checksum
     with get_conn() as conn, conn.cursor() as cur:
-        return select_menus_needing_download(cur, limit)
+        return select_menus_needing_download(cur, limit, source_types=["PDF", "IMAGE"])
 
 async def main(concurrency=10, limit=2000):
     log = get_logger("downloader")
@@ -18,7 +19,7 @@ async def main(concurrency=10, limit=2000):
     sem = asyncio.Semaphore(concurrency)
     results: List[Tuple[str, str, str]] = []  # (menu_id, checksum, path)
 
-    async with aiohttp.ClientSession(headers={"User-Agent": USER_AGENT}) as session:
+    async with client_session("download") as session:
         async def worker(row):
             async with sem:
                 menu_id, url = row
@@ -50,4 +51,4 @@ async def main(concurrency=10, limit=2000):
 if __name__ == "__main__":
     concurrency = int(os.getenv("CONCURRENCY", "10"))
     limit = int(os.getenv("DOWNLOAD_LIMIT", "2000"))
-    asyncio.run(main(concurrency=concurrency, limit=limit))
+    asyncio.run(run_stage("download", main(concurrency=concurrency, limit=limit)))
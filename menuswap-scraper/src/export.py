@@ -0,0 +1,296 @@
+"""Incremental columnar snapshots of restaurants, menus and dishes.
+
+Writes `Restaurant`, `Menu` and `Dish` as Parquet (or Arrow IPC) datasets under
+EXPORT_DIR/<table>/city=<city>/scrape_date=<yyyy-mm-dd>/, where scrape_date is
+the day the row was last written by the scraper or the app ("updatedAt").
+Analyses, notebooks and benchmarks read these files with pyarrow, DuckDB or
+polars instead of scanning the OLTP database. Point EXPORT_DATABASE_URL at a
+replica to keep even the export's own reads off the primary.
+
+Rows stream from a server-side cursor in batches of EXPORT_BATCH_ROWS, so
+memory stays flat however large the tables are. Every table is read in one
+repeatable-read transaction, giving a consistent snapshot across the three.
+
+Each run exports the rows whose "updatedAt" lies between the table's previous
+watermark and the snapshot time minus EXPORT_SAFETY_SECONDS, which leaves room
+for transactions that were still in flight. The watermarks are kept in
+EXPORT_DIR/_state.json, next to the files they describe, so the export works
+against a read-only replica. Files are named after the run, and a row that
+changed again appears once per run, so readers keep the latest "updatedAt" per
+id. Deletions are not captured. `--full` rewrites a table from scratch.
+
+Timestamps are UTC throughout: Prisma writes "updatedAt" in UTC, the scraper's
+connections use a UTC session time zone (src/db.py), and the watermark is taken
+from the database clock in UTC.
+
+pyarrow is optional: `pip install 'menuswap-scraper[export]'`.
+"""
+import argparse
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .db import get_conn
+from .log import get_logger
+from .metrics import counter
+from .profiling import profile
+
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", "data/export"))
+EXPORT_DATABASE_URL = os.getenv("EXPORT_DATABASE_URL") or None
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+EXPORT_SAFETY_SECONDS = int(os.getenv("EXPORT_SAFETY_SECONDS", "60"))
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "parquet")
+EXPORT_MAX_OPEN_FILES = int(os.getenv("EXPORT_MAX_OPEN_FILES", "1024"))
+
+STATE_FILE = "_state.json"
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+EXPORT_ROWS = counter("export_rows_total", "Rows written to the columnar export", ("table",))
+
+
+@dataclass(frozen=True)
+class ExportTable:
+    name: str
+    # (column, arrow type name); every query ends with city and scrape_date
+    columns: Tuple[Tuple[str, str], ...]
+    # {where} takes the watermark range on the table aliased `t`
+    sql: str
+
+
+# Rows stream in "updatedAt" order, which the indexes from migration 006 serve
+# without a sort on the server, and pyarrow splits them into partitions. Only
+# the cities of the dates being streamed keep files open.
+TABLES: Dict[str, ExportTable] = {
+    t.name: t
+    for t in (
+        ExportTable(
+            "Restaurant",
+            (
+                ("id", "string"), ("name", "string"), ("slug", "string"), ("address", "string"),
+                ("websiteUrl", "string"), ("lat", "float64"), ("lon", "float64"), ("verified", "bool"),
+                ("createdAt", "timestamp"), ("updatedAt", "timestamp"),
+                ("city", "string"), ("scrape_date", "date"),
+            ),
+            """
+            select t.id::text, t.name, t.slug, t.address, t."websiteUrl", t.lat::float8, t.lon::float8, t.verified,
+                   t."createdAt", t."updatedAt", nullif(t.city, ''), t."updatedAt"::date
+            from "Restaurant" t
+            where {where}
+            order by t."updatedAt"
+            """,
+        ),
+        ExportTable(
+            "Menu",
+            (
+                ("id", "string"), ("restaurantId", "string"), ("sourceType", "string"), ("sourceUrl", "string"),
+                ("status", "string"), ("checksum", "string"), ("uploadedAt", "timestamp"), ("updatedAt", "timestamp"),
+                ("city", "string"), ("scrape_date", "date"),
+            ),
+            """
+            select t.id::text, t."restaurantId"::text, t."sourceType"::text, t."sourceUrl", t.status::text,
+                   t.checksum, t."uploadedAt", t."updatedAt", nullif(r.city, ''), t."updatedAt"::date
+            from "Menu" t
+            join "Restaurant" r on r.id = t."restaurantId"
+            where {where}
+            order by t."updatedAt"
+            """,
+        ),
+        ExportTable(
+            "Dish",
+            (
+                ("id", "string"), ("menuId", "string"), ("restaurantId", "string"), ("name", "string"),
+                ("slug", "string"), ("description", "string"), ("priceCents", "int32"), ("section", "string"),
+                ("tags", "list<string>"), ("imageUrl", "string"), ("createdAt", "timestamp"),
+                ("updatedAt", "timestamp"), ("city", "string"), ("scrape_date", "date"),
+            ),
+            """
+            select t.id::text, t."menuId"::text, m."restaurantId"::text, t.name, t.slug, t.description,
+                   t."priceCents", t.section, t.tags, t."imageUrl", t."createdAt", t."updatedAt",
+                   nullif(r.city, ''), t."updatedAt"::date
+            from "Dish" t
+            join "Menu" m on m.id = t."menuId"
+            join "Restaurant" r on r.id = m."restaurantId"
+            where {where}
+            order by t."updatedAt"
+            """,
+        ),
+    )
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError:
+        raise SystemExit("The export needs pyarrow: pip install 'menuswap-scraper[export]'") from None
+    return pyarrow
+
+
+def arrow_schema(pa, table: ExportTable):
+    types = {
+        "string": pa.string(),
+        "float64": pa.float64(),
+        "int32": pa.int32(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("ms"),
+        "date": pa.date32(),
+        "list<string>": pa.list_(pa.string()),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in table.columns])
+
+
+def load_state(out_dir: Path) -> dict:
+    try:
+        return json.loads((out_dir / STATE_FILE).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(out_dir: Path, state: dict) -> None:
+    path = out_dir / STATE_FILE
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def record_batches(pa, cur, schema, batch_rows: int, count: List[int]) -> Iterator:
+    """Turn the cursor's rows into RecordBatches of at most `batch_rows`, counting rows into count[0]."""
+    while True:
+        rows = cur.fetchmany(batch_rows)
+        if not rows:
+            return
+        count[0] += len(rows)
+        columns = zip(*rows)
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+        )
+
+
+def export_table(
+    conn,
+    table: ExportTable,
+    out_dir: Path,
+    since: Optional[datetime],
+    until: datetime,
+    run_id: str,
+    fmt: str = EXPORT_FORMAT,
+    batch_rows: int = EXPORT_BATCH_ROWS,
+) -> int:
+    """Write the rows of `table` changed in (since, until] into out_dir; returns the row count.
+
+    Must run inside a transaction, which the server-side cursor lives in.
+    """
+    pa = _pyarrow()
+    ds = pa.dataset
+    schema = arrow_schema(pa, table)
+    where, params = 't."updatedAt" <= %s', [until]
+    if since is not None:
+        where, params = 't."updatedAt" > %s and ' + where, [since, until]
+
+    count = [0]
+    with conn.cursor(name=f"export_{table.name.lower()}") as cur:
+        cur.execute(table.sql.format(where=where), params)
+        file_options = ds.ParquetFileFormat().make_write_options(compression="zstd") if fmt == "parquet" else None
+        ds.write_dataset(
+            record_batches(pa, cur, schema, batch_rows, count),
+            out_dir,
+            schema=schema,
+            format="ipc" if fmt == "arrow" else fmt,
+            file_options=file_options,
+            partitioning=ds.partitioning(
+                pa.schema([("city", pa.string()), ("scrape_date", pa.date32())]), flavor="hive"
+            ),
+            basename_template=f"{run_id}-{{i}}{FORMATS[fmt]}",
+            existing_data_behavior="overwrite_or_ignore",
+            max_open_files=EXPORT_MAX_OPEN_FILES,
+            max_rows_per_group=batch_rows,
+        )
+    EXPORT_ROWS.inc(count[0], table=table.name)
+    return count[0]
+
+
+def _replace_dir(new: Path, target: Path) -> None:
+    old = target.with_name(f"{target.name}.old")
+    shutil.rmtree(old, ignore_errors=True)
+    if target.exists():
+        target.rename(old)
+    if new.exists():
+        new.rename(target)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def export(
+    tables: Sequence[str] = tuple(TABLES),
+    out_dir: Path = EXPORT_DIR,
+    full: bool = False,
+    fmt: str = EXPORT_FORMAT,
+    batch_rows: int = EXPORT_BATCH_ROWS,
+    safety_seconds: int = EXPORT_SAFETY_SECONDS,
+    dsn: Optional[str] = EXPORT_DATABASE_URL,
+) -> Dict[str, int]:
+    """Export `tables` incrementally (or in full) and return rows written per table."""
+    log = get_logger("export")
+    if fmt not in FORMATS:
+        raise SystemExit(f"Unknown EXPORT_FORMAT {fmt!r}; expected one of {', '.join(FORMATS)}")
+    _pyarrow()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    state = load_state(out_dir)
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    written: Dict[str, int] = {}
+
+    with get_conn(dsn) as conn, conn.transaction():
+        with conn.cursor() as cur:
+            cur.execute("set transaction isolation level repeatable read, read only")
+            # "updatedAt" is a timestamp without time zone holding UTC
+            cur.execute("select (now() at time zone 'utc') - make_interval(secs => %s)", (safety_seconds,))
+            until = cur.fetchone()[0]
+        for name in tables:
+            table = TABLES[name]
+            previous = state.get(name, {})
+            since = None if full or not previous else datetime.fromisoformat(previous["watermark"])
+            if since is not None and previous.get("format", fmt) != fmt:
+                raise SystemExit(f"{name} was exported as {previous['format']}; rerun with --full to switch format")
+            if since is not None and since >= until:
+                written[name] = 0
+                continue
+            target = out_dir / name
+            dest = target.with_name(f"{name}.{run_id}.tmp") if since is None else target
+            rows = export_table(conn, table, dest, since, until, run_id, fmt, batch_rows)
+            if since is None:
+                _replace_dir(dest, target)
+            written[name] = rows
+            state[name] = {"watermark": until.isoformat(), "format": fmt, "lastRun": run_id, "rows": rows}
+            save_state(out_dir, state)
+            log.info(f"{name}: {rows} rows {'in full' if since is None else f'changed since {since:%Y-%m-%d %H:%M:%S}'}")
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, int]:
+    parser = argparse.ArgumentParser(prog="menuswap-scraper export", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tables", default=",".join(TABLES), help="comma-separated subset of " + ", ".join(TABLES))
+    parser.add_argument("--full", action="store_true", help="rewrite the tables instead of exporting changes")
+    parser.add_argument("--out", type=Path, default=EXPORT_DIR, help="output directory (EXPORT_DIR)")
+    parser.add_argument("--format", choices=tuple(FORMATS), default=EXPORT_FORMAT)
+    parser.add_argument("--batch-rows", type=int, default=EXPORT_BATCH_ROWS)
+    args = parser.parse_args(argv)
+
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+    unknown = [t for t in tables if t not in TABLES]
+    if unknown:
+        parser.error(f"unknown table(s): {', '.join(unknown)}")
+    written = export(tables, out_dir=args.out, full=args.full, fmt=args.format, batch_rows=args.batch_rows)
+    get_logger("export").info(
+        f"Exported {sum(written.values())} rows to {args.out} ("
+        + ", ".join(f"{name} {rows}" for name, rows in written.items()) + ")"
+    )
+    return written
+
+
+if __name__ == "__main__":
+    with profile("export"):
+        main()
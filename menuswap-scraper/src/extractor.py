@@ -8,12 +8,17 @@ from .db import (
     get_conn,
     get_pooled_conn,
     select_menus_without_dishes,
+    record_menu_download,
     upsert_dish,
 )
-from .dish_extractor import extract_dishes_from_url
-from .config import USER_AGENT
+from .aggregates import refresh_for_menus, refresh_pending
+from .search_index import index_menus
+from .dish_extractor import fetch_html, extract_dishes_from_html, consolidate_dishes
+from .page_store import store_page
+from .sessions import client_session
 from .utils import slugify
 from .log import get_logger
+from .metrics import run_stage
 
 
 def fetch_target_menus(limit=2000):
@@ -21,12 +26,26 @@ def fetch_target_menus(limit=2000):
         return select_menus_without_dishes(cur, limit)
 
 
-async def process_menu(row, session: aiohttp.ClientSession) -> int:
+async def process_menu(row, session: aiohttp.ClientSession) -> Tuple[int, int]:
+    """Extract and store dishes for one menu. Returns (created, duplicates_removed).
+
+    The fetched page is archived (src/page_store.py) and its checksum stored on
+    the menu, so src/reextract.py can later reprocess it without refetching.
+    """
     log = get_logger("extract")
     menu_id, restaurant_id, url = row
-    dishes = await extract_dishes_from_url(url, session=session)
+    html = await fetch_html(session, url)
+    if not html:
+        return 0, 0
+    checksum = await asyncio.to_thread(store_page, html)
+    dishes = extract_dishes_from_html(html)
     if not dishes:
-        return 0
+        with get_pooled_conn() as conn, conn.cursor() as cur:
+            record_menu_download(cur, menu_id, checksum)
+        return 0, 0
+    dishes, removed = consolidate_dishes(dishes)
+    if removed:
+        log.debug(f"Merged {removed} near-duplicate dishes on menu {menu_id}")
     created = 0
     with get_pooled_conn() as conn, conn.cursor() as cur:
         for d in dishes:
@@ -48,7 +67,18 @@ async def process_menu(row, session: aiohttp.ClientSession) -> int:
             )
             if is_new:
                 created += 1
-    return created
+        record_menu_download(cur, menu_id, checksum)
+        refresh_search_index(conn, menu_id)
+    return created, removed
+
+
+def refresh_search_index(conn, menu_id):
+    """Replace the search rows of one menu; a failure leaves its dishes in place."""
+    try:
+        with conn.transaction(), conn.cursor() as cur:
+            index_menus(cur, [menu_id])
+    except Exception as e:
+        get_logger("extract").warning(f"Search index refresh failed for menu {menu_id} (run `python -m src.migrate`?): {e}")
 
 
 async def main(concurrency=8, limit=2000):
@@ -57,24 +87,42 @@ async def main(concurrency=8, limit=2000):
     log.info(f"Extracting dishes for {len(rows)} menu pages with concurrency={concurrency}")
     sem = asyncio.Semaphore(concurrency)
     created_total = 0
+    removed_total = 0
+    touched = []
 
-    async with aiohttp.ClientSession(headers={"User-Agent": USER_AGENT}) as session:
+    async with client_session("extract") as session:
         async def worker(row):
             async with sem:
-                return await process_menu(row, session=session)
+                return row[0], await process_menu(row, session=session)
 
         tasks = [asyncio.create_task(worker(r)) for r in rows]
         for f in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
             try:
-                created_total += await f
+                menu_id, (created, removed) = await f
+                created_total += created
+                removed_total += removed
+                if created:
+                    touched.append(menu_id)
             except Exception as e:
                 log.debug(f"worker failed: {e}")
-    log.info(f"Created {created_total} dishes from HTML menus.")
+    log.info(f"Created {created_total} dishes from HTML menus ({removed_total} near-duplicates merged).")
+    refresh_aggregates(touched)
+
+
+def refresh_aggregates(menu_ids):
+    """Bring the aggregate tables up to date for the menus written in this run and queued approvals."""
+    log = get_logger("extract")
+    try:
+        with get_conn() as conn:
+            refresh_for_menus(conn, menu_ids)
+            refresh_pending(conn)
+    except Exception as e:
+        log.warning(f"Aggregate refresh failed (run `python -m src.migrate`?): {e}")
 
 
 if __name__ == "__main__":
     concurrency = int(os.getenv("CONCURRENCY", "8"))
     limit = int(os.getenv("EXTRACT_LIMIT", "2000"))
-    asyncio.run(main(concurrency=concurrency, limit=limit))
+    asyncio.run(run_stage("extract", main(concurrency=concurrency, limit=limit)))
 
 
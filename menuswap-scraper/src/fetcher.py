@@ -1,14 +1,19 @@
 import aiohttp, asyncio, hashlib, os
 from pathlib import Path
 from typing import Optional, Tuple
-from .config import USER_AGENT, REQUEST_TIMEOUT_SECONDS, R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY, R2_ENDPOINT_URL, R2_BUCKET, R2_PUBLIC_BASE_URL
+from .config import REQUEST_TIMEOUT_SECONDS, R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY, R2_ENDPOINT_URL, R2_BUCKET, R2_PUBLIC_BASE_URL
 from .log import get_logger
+from .metrics import counter, histogram
+from .sessions import client_session
 from mimetypes import guess_extension
-import boto3
-from botocore.config import Config as BotoConfig
 
 DOWNLOAD_DIR = Path("data/downloads")
 
+DOWNLOADS = counter("downloads_total", "Menu source downloads by result", ("result",))
+DOWNLOAD_BYTES = counter("download_bytes_total", "Bytes of menu sources downloaded")
+DOWNLOAD_RETRIES = counter("download_retries_total", "Download attempts retried after a failure")
+UPLOAD_SECONDS = histogram("upload_seconds", "Blocking R2 upload time")
+
 async def head(session, url):
     log = get_logger("fetch")
     try:
@@ -42,7 +47,7 @@ async def download_menu_source(menu_id: str, url: str, session: Optional[aiohttp
 
     owns_session = False
     if session is None:
-        session = aiohttp.ClientSession(headers={"User-Agent": USER_AGENT})
+        session = client_session("download")
         owns_session = True
 
     log = get_logger("fetch")
@@ -61,6 +66,7 @@ async def download_menu_source(menu_id: str, url: str, session: Optional[aiohttp
             else:
                 try:
                     if r.status >= 400:
+                        DOWNLOADS.inc(result=f"http_{r.status}")
                         return None
                     content = await r.read()
                     break
@@ -68,12 +74,15 @@ async def download_menu_source(menu_id: str, url: str, session: Optional[aiohttp
                     last_exc = e
             # backoff before next attempt
             if attempt < max_retries:
+                DOWNLOAD_RETRIES.inc()
                 sleep_seconds = backoff_base * (2 ** attempt) + (0.1 * attempt)
                 await asyncio.sleep(sleep_seconds)
 
         if content is None:
             log.debug(f"Failed to download after retries: {url} ({last_exc})")
+            DOWNLOADS.inc(result="failed")
             return None
+        DOWNLOAD_BYTES.inc(len(content))
 
         checksum = hashlib.sha256(content).hexdigest()
         ctype = (r.headers.get("content-type", "application/octet-stream") if r else "application/octet-stream").split(";")[0]
@@ -82,6 +91,9 @@ async def download_menu_source(menu_id: str, url: str, session: Optional[aiohttp
         if R2_ACCESS_KEY_ID and R2_SECRET_ACCESS_KEY and R2_ENDPOINT_URL and R2_BUCKET:
             # Upload to Cloudflare R2 (S3 compatible)
             log.debug(f"Uploading to R2: {fname}")
+            # Imported here: boto3 costs ~0.3s and tens of MB, and only uploads need it
+            import boto3
+            from botocore.config import Config as BotoConfig
             s3 = boto3.client(
                 "s3",
                 aws_access_key_id=R2_ACCESS_KEY_ID,
@@ -89,7 +101,8 @@ async def download_menu_source(menu_id: str, url: str, session: Optional[aiohttp
                 endpoint_url=R2_ENDPOINT_URL,
                 config=BotoConfig(signature_version="s3v4"),
             )
-            s3.put_object(Bucket=R2_BUCKET, Key=fname, Body=content, ContentType=ctype)
+            with UPLOAD_SECONDS.time():
+                s3.put_object(Bucket=R2_BUCKET, Key=fname, Body=content, ContentType=ctype)
             if R2_PUBLIC_BASE_URL:
                 fpath = f"{R2_PUBLIC_BASE_URL.rstrip('/')}/{fname}"
             else:
@@ -100,6 +113,7 @@ async def download_menu_source(menu_id: str, url: str, session: Optional[aiohttp
                 f.write(content)
             fpath = str(fpath)
 
+        DOWNLOADS.inc(result="ok")
         return (menu_id, checksum, str(fpath))
     finally:
         try:
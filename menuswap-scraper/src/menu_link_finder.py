@@ -1,15 +1,118 @@
+import zlib
 import aiohttp
-from typing import Optional
-from bs4 import BeautifulSoup
-from .config import USER_AGENT, REQUEST_TIMEOUT_SECONDS, MENU_HINT_WORDS
+from collections import deque
+from typing import List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+from lxml import etree
+from .config import (
+    REQUEST_TIMEOUT_SECONDS,
+    MENU_HINT_WORDS,
+    MENU_DISCOVERY_MAX_DEPTH,
+    MENU_DISCOVERY_REQUEST_BUDGET,
+    SITEMAP_MAX_FILES,
+    SITEMAP_MAX_BYTES,
+)
 from .utils import normalize_url, looks_like_menu_link, classify_source_type, PRICE_RE
 from .log import get_logger
+from .metrics import counter, histogram, FAST_BUCKETS
+from .sessions import client_session
+
+MAX_TEXT_CHARS = 50000
+SITEMAP_CHUNK_BYTES = 64 * 1024
+SITEMAP_MAX_LINKS = 50
+
+PARSE_SECONDS = histogram("html_parse_seconds", "HTML parse time", ("component",), buckets=FAST_BUCKETS)
+PAGES_FETCHED = counter("finder_pages_total", "Pages fetched during menu discovery", ("result",))
+SITEMAPS_FETCHED = counter("finder_sitemaps_total", "Sitemap files streamed")
+CANDIDATES_FOUND = counter("finder_candidates_total", "Menu candidates found", ("source",))
+
+
+class _LinkTextTarget:
+    """lxml parser target that keeps only anchors and visible text.
+
+    With a target the parser never builds a tree; it just streams these
+    callbacks, which is all link discovery needs.
+    """
+
+    SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "head"}
+
+    def __init__(self, max_text: int = MAX_TEXT_CHARS):
+        self.links: List[Tuple[str, str]] = []
+        self._max_text = max_text
+        self._text: List[str] = []
+        self._text_len = 0
+        self._skip = 0
+        self._href: Optional[str] = None
+        self._anchor: List[str] = []
+
+    def start(self, tag, attrib):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+        elif tag == "a":
+            self._href = attrib.get("href")
+            self._anchor = []
+
+    def end(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag == "a" and self._href is not None:
+            self.links.append((self._href, " ".join("".join(self._anchor).split())))
+            self._href = None
+
+    def data(self, data):
+        if self._skip:
+            return
+        if self._href is not None:
+            self._anchor.append(data)
+        if self._text_len < self._max_text:
+            self._text.append(data)
+            self._text_len += len(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self.links, " ".join(self._text)[: self._max_text]
+
+
+def parse_links_and_text(html: str) -> Tuple[List[Tuple[str, str]], str]:
+    """Return ([(href, anchor_text)], visible_text) without building a DOM."""
+    parser = etree.HTMLParser(target=_LinkTextTarget(), recover=True, no_network=True)
+    with PARSE_SECONDS.time(component="finder"):
+        try:
+            parser.feed(html)
+            return parser.close()
+        except etree.LxmlError:
+            return [], ""
+
+
+class RequestBudget:
+    """Requests left for one site, shared by page fetches and sitemap lookups."""
+
+    def __init__(self, requests: int = MENU_DISCOVERY_REQUEST_BUDGET):
+        self.left = requests
+
+    def take(self) -> bool:
+        if self.left <= 0:
+            return False
+        self.left -= 1
+        return True
+
+
+def _site_key(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _is_internal(url: str, site: str) -> bool:
+    return _site_key(url) == site
+
 
 async def fetch_html(session, url):
     log = get_logger("finder")
     try:
         async with session.get(url, timeout=REQUEST_TIMEOUT_SECONDS) as r:
-            if r.status >= 400: 
+            if r.status >= 400:
                 return None
             ctype = r.headers.get("content-type","")
             if "text/html" not in ctype:
@@ -19,31 +122,145 @@ async def fetch_html(session, url):
         log.debug(f"Failed fetching HTML: {url}")
         return None
 
+
+async def fetch_robots_sitemaps(session, base_url: str) -> List[str]:
+    """Sitemap URLs declared in robots.txt, falling back to /sitemap.xml."""
+    robots_url = normalize_url(base_url, "/robots.txt")
+    sitemaps: List[str] = []
+    try:
+        async with session.get(robots_url, timeout=REQUEST_TIMEOUT_SECONDS) as r:
+            if r.status < 400:
+                text = await r.text(errors="ignore")
+                for line in text[:100000].splitlines():
+                    key, _, value = line.partition(":")
+                    if key.strip().lower() == "sitemap" and value.strip():
+                        sitemaps.append(value.strip())
+    except Exception:
+        get_logger("finder").debug(f"Failed fetching robots.txt: {robots_url}")
+    return sitemaps or [normalize_url(base_url, "/sitemap.xml")]
+
+
+async def stream_sitemap(session, url: str, site: str):
+    """Stream one sitemap and return (menu-hinted page URLs, nested sitemap URLs).
+
+    The body is fed to an incremental XML parser chunk by chunk (gunzipped on
+    the fly for .gz sitemaps) and each entry is dropped once read, so memory
+    stays flat however large the sitemap is.
+    """
+    log = get_logger("finder")
+    pages: List[str] = []
+    nested: List[str] = []
+    parser = etree.XMLPullParser(
+        events=("end",), tag=("{*}url", "{*}sitemap"), recover=True, resolve_entities=False, no_network=True
+    )
+    gunzip = zlib.decompressobj(16 + zlib.MAX_WBITS) if urlsplit(url).path.endswith(".gz") else None
+    received = 0
+    try:
+        async with session.get(url, timeout=REQUEST_TIMEOUT_SECONDS) as r:
+            if r.status >= 400:
+                return pages, nested
+            async for chunk in r.content.iter_chunked(SITEMAP_CHUNK_BYTES):
+                received += len(chunk)
+                parser.feed(gunzip.decompress(chunk) if gunzip else chunk)
+                for _event, el in parser.read_events():
+                    loc = (el.findtext("{*}loc") or "").strip()
+                    if not loc:
+                        pass
+                    elif etree.QName(el).localname == "sitemap":
+                        nested.append(loc)
+                    elif _is_internal(loc, site) and looks_like_menu_link(loc, MENU_HINT_WORDS):
+                        pages.append(loc.split("#")[0])
+                    # Drop processed entries so the partial tree stays empty
+                    el.clear()
+                    while el.getprevious() is not None:
+                        del el.getparent()[0]
+                if received >= SITEMAP_MAX_BYTES:
+                    log.debug(f"Sitemap truncated at {received} bytes: {url}")
+                    break
+    except Exception:
+        log.debug(f"Failed streaming sitemap: {url}")
+    return pages, nested
+
+
+async def find_sitemap_menu_links(session, base_url: str, budget: RequestBudget) -> Set[str]:
+    """Menu-hinted page URLs from the site's sitemaps; robots.txt and every sitemap file cost one request."""
+    site = _site_key(base_url)
+    found: Set[str] = set()
+    if not budget.take():
+        return found
+    queue = deque(await fetch_robots_sitemaps(session, base_url))
+    fetched = 0
+    while queue and fetched < SITEMAP_MAX_FILES and len(found) < SITEMAP_MAX_LINKS and budget.take():
+        url = queue.popleft()
+        fetched += 1
+        SITEMAPS_FETCHED.inc()
+        pages, nested = await stream_sitemap(session, url, site)
+        found.update(pages[: SITEMAP_MAX_LINKS - len(found)])
+        # Prefer nested sitemaps that themselves look menu related
+        nested.sort(key=lambda u: not looks_like_menu_link(u, MENU_HINT_WORDS))
+        queue.extend(nested)
+    return found
+
+
 async def find_menu_links(base_url: str, session: Optional[aiohttp.ClientSession] = None):
+    """Discover menu sources for a site.
+
+    Walks menu-hinted internal links breadth-first up to MENU_DISCOVERY_MAX_DEPTH
+    clicks from the homepage. Only when that finds nothing are the site's
+    sitemaps searched for menu-hinted URLs. Pages, robots.txt and sitemap files
+    share one budget of MENU_DISCOVERY_REQUEST_BUDGET requests per site.
+    """
     owns_session = False
     if session is None:
-        session = aiohttp.ClientSession(headers={"User-Agent": USER_AGENT})
+        session = client_session("crawl")
         owns_session = True
     try:
         log = get_logger("finder")
-        html = await fetch_html(session, base_url)
-        if not html:
-            return []
-        soup = BeautifulSoup(html, "lxml")
+        site = _site_key(base_url)
         candidates = set()
-        # <a> links by text and href
-        for a in soup.find_all("a"):
-            text = (a.get_text() or "").strip()
-            href = a.get("href")
-            norm = normalize_url(base_url, href) if href else None
-            hay = " ".join([text, href or ""]) 
-            if norm and looks_like_menu_link(hay, MENU_HINT_WORDS):
+        visited = set()
+        frontier = deque([(base_url, 0)])
+        budget = RequestBudget()
+        pages_fetched = 0
+        while frontier and budget.left > 0:
+            url, depth = frontier.popleft()
+            if url in visited:
+                continue
+            visited.add(url)
+            budget.take()
+            html = await fetch_html(session, url)
+            pages_fetched += 1
+            PAGES_FETCHED.inc(result="ok" if html else "failed")
+            if not html:
+                if depth == 0:
+                    return []
+                continue
+            links, body_text = parse_links_and_text(html)
+            # <a> links by text and href
+            for href, text in links:
+                norm = normalize_url(url, href) if href else None
+                hay = " ".join([text, href or ""])
+                if not norm or not norm.startswith(("http://", "https://")):
+                    continue
+                if not looks_like_menu_link(hay, MENU_HINT_WORDS):
+                    continue
                 candidates.add(norm)
-        # Sometimes menus are embedded as images on the same page; if there are clear price patterns,
-        # also consider the base page itself a candidate "URL" menu.
-        body_text = soup.get_text(" ")[:50000]
-        if PRICE_RE.search(body_text):
-            candidates.add(base_url)
+                if depth < MENU_DISCOVERY_MAX_DEPTH and _is_internal(norm, site) \
+                        and classify_source_type(norm) == "URL" and norm not in visited:
+                    frontier.append((norm, depth + 1))
+            # Sometimes menus are embedded as images on the same page; if there are clear price patterns,
+            # also consider the page itself a candidate "URL" menu.
+            if PRICE_RE.search(body_text):
+                candidates.add(url)
+        CANDIDATES_FOUND.inc(len(candidates), source="links")
+        if not candidates:
+            # Sitemaps are the fallback for sites whose menu is not linked, not an extra cost for every site
+            candidates = await find_sitemap_menu_links(session, base_url, budget)
+            CANDIDATES_FOUND.inc(len(candidates), source="sitemap")
+        log.debug(
+            f"{base_url}: {len(candidates)} menu candidates from {pages_fetched} pages, "
+            f"{MENU_DISCOVERY_REQUEST_BUDGET - budget.left} requests"
+        )
         return [{"url": u, "source_type": classify_source_type(u)} for u in candidates]
     finally:
         if owns_session:
@@ -0,0 +1,315 @@
+"""Small in-process metrics registry with Prometheus text export.
+
+Counters, gauges and fixed-bucket histograms keyed by label values. Updating a
+metric is a dict lookup and an add, cheap enough for per-request hot paths.
+Output, all optional and controlled by the environment:
+
+- METRICS_PORT: serve /metrics over HTTP while a stage runs
+- METRICS_TEXTFILE: rewrite this file periodically (node_exporter textfile collector)
+- METRICS_SUMMARY_DIR: JSON summary written when a stage finishes (default data/metrics)
+"""
+import asyncio
+import bisect
+import contextlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from .log import get_logger
+from .profiling import profile
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")
+METRICS_SUMMARY_DIR = os.getenv("METRICS_SUMMARY_DIR", "data/metrics")
+TEXTFILE_INTERVAL_SECONDS = 15
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _fmt_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        for key, v in self.values.items():
+            yield f"{self.name}{self._fmt_labels(key)} {_num(v)}"
+
+    def summary(self):
+        return {",".join(k) or "total": v for k, v in self.values.items()}
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set_function(self, fn: Callable[[], float], **labels) -> None:
+        """Evaluate `fn` at export time, e.g. a queue's qsize."""
+        self.functions[self._key(labels)] = fn
+
+    def _collect(self):
+        out = dict(self.values)
+        for key, fn in self.functions.items():
+            try:
+                out[key] = fn()
+            except Exception:
+                pass
+        return out
+
+    def render(self):
+        for key, v in self._collect().items():
+            yield f"{self.name}{self._fmt_labels(key)} {_num(v)}"
+
+    def summary(self):
+        return {",".join(k) or "value": v for k, v in self._collect().items()}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (+Inf last), sum, count]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self):
+        for key, (counts, total, n) in self.values.items():
+            cumulative = 0
+            for le, c in zip(self.buckets, counts):
+                cumulative += c
+                le_label = 'le="%s"' % _num(le)
+                yield f"{self.name}_bucket{self._fmt_labels(key, le_label)} {cumulative}"
+            inf_label = 'le="+Inf"'
+            yield f"{self.name}_bucket{self._fmt_labels(key, inf_label)} {n}"
+            yield f"{self.name}_sum{self._fmt_labels(key)} {_num(total)}"
+            yield f"{self.name}_count{self._fmt_labels(key)} {n}"
+
+    def quantile(self, key: Tuple[str, ...], q: float) -> Optional[float]:
+        """Upper bucket bound containing quantile q (coarse, but free)."""
+        counts, _total, n = self.values[key]
+        if not n:
+            return None
+        target = q * n
+        cumulative = 0
+        for le, c in zip(self.buckets + (float("inf"),), counts):
+            cumulative += c
+            if cumulative >= target:
+                return le
+        return float("inf")
+
+    def summary(self):
+        out = {}
+        for key, (_counts, total, n) in self.values.items():
+            out[",".join(key) or "all"] = {
+                "count": n,
+                "mean": round(total / n, 6) if n else None,
+                "p50_le": self.quantile(key, 0.5),
+                "p95_le": self.quantile(key, 0.95),
+                "p99_le": self.quantile(key, 0.99),
+            }
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        for m in self.metrics.values():
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict:
+        return {name: m.summary() for name, m in self.metrics.items()}
+
+    def reset(self) -> None:
+        """Zero every metric, keeping registrations and gauge functions."""
+        for m in self.metrics.values():
+            m.values.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) and not float(v).is_integer() else str(int(v))
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def write_textfile(path: str) -> None:
+    """Atomically write the Prometheus exposition to `path`."""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(p.suffix + ".tmp")
+    tmp.write_text(REGISTRY.render())
+    os.replace(tmp, p)
+
+
+async def start_http_server(port: int):
+    """Serve /metrics on `port` from the running event loop. Returns the aiohttp runner."""
+    from aiohttp import web
+
+    async def handle(_request):
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    return runner
+
+
+@contextlib.asynccontextmanager
+async def export(stage: str):
+    """Expose metrics while a stage runs and write a JSON summary when it ends."""
+    log = get_logger("metrics")
+    runner = None
+    writer = None
+    started = time.time()
+    if METRICS_PORT:
+        runner = await start_http_server(METRICS_PORT)
+        log.info(f"Serving metrics on :{METRICS_PORT}/metrics")
+    if METRICS_TEXTFILE:
+        async def periodic():
+            while True:
+                await asyncio.sleep(TEXTFILE_INTERVAL_SECONDS)
+                write_textfile(METRICS_TEXTFILE)
+        writer = asyncio.create_task(periodic())
+    try:
+        yield REGISTRY
+    finally:
+        if writer:
+            writer.cancel()
+        if METRICS_TEXTFILE:
+            write_textfile(METRICS_TEXTFILE)
+        if runner:
+            await runner.cleanup()
+        if METRICS_SUMMARY_DIR:
+            out_dir = Path(METRICS_SUMMARY_DIR)
+            out_dir.mkdir(parents=True, exist_ok=True)
+            out = out_dir / f"{stage}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}.json"
+            out.write_text(json.dumps({
+                "stage": stage,
+                "started": started,
+                "duration_seconds": round(time.time() - started, 3),
+                "metrics": REGISTRY.summary(),
+            }, indent=2, default=str))
+            log.info(f"Metrics summary written to {out}")
+
+
+async def run_stage(stage: str, coro):
+    """Run a stage's main coroutine inside `export`, profiled when PROFILE=1."""
+    async with export(stage):
+        with profile(stage):
+            return await coro
+
+
+def http_trace_config(stage: str):
+    """aiohttp TraceConfig recording latency, status codes and bytes per stage."""
+    import aiohttp
+
+    requests = counter("http_requests_total", "HTTP requests by stage and status", ("stage", "status"))
+    latency = histogram("http_request_seconds", "HTTP request latency until response headers", ("stage",))
+    received = counter("http_response_bytes_total", "HTTP response body bytes received", ("stage",))
+
+    async def on_start(_session, ctx, _params):
+        ctx.t0 = time.perf_counter()
+
+    async def on_end(_session, ctx, params):
+        latency.observe(time.perf_counter() - ctx.t0, stage=stage)
+        requests.inc(stage=stage, status=params.response.status)
+
+    async def on_exception(_session, ctx, params):
+        latency.observe(time.perf_counter() - ctx.t0, stage=stage)
+        requests.inc(stage=stage, status=type(params.exception).__name__)
+
+    async def on_chunk(_session, _ctx, params):
+        received.inc(len(params.chunk), stage=stage)
+
+    tc = aiohttp.TraceConfig()
+    tc.on_request_start.append(on_start)
+    tc.on_request_end.append(on_end)
+    tc.on_request_exception.append(on_exception)
+    tc.on_response_chunk_received.append(on_chunk)
+    return tc
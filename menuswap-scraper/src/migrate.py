@@ -0,0 +1,89 @@
+import re
+from pathlib import Path
+from typing import List
+from .db import get_conn
+from .log import get_logger
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "sql" / "migrations"
+
+
+# $$ or $tag$, but not a `$` inside an identifier such as a$b
+_DOLLAR_TAG = re.compile(r"(?<![\w$])\$(?:[A-Za-z_]\w*)?\$")
+
+
+def split_statements(sql: str) -> List[str]:
+    """Split a migration file into individual statements.
+
+    Statements are separated by `;` outside string literals, quoted
+    identifiers, dollar-quoted bodies and comments; `--` and `/* */` comments
+    are dropped. Statements run one by one in autocommit mode, which CREATE
+    INDEX CONCURRENTLY requires.
+    """
+    statements: List[str] = []
+    current: List[str] = []
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if c == ";":
+            statements.append("".join(current))
+            current = []
+            i += 1
+            continue
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        if sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        if c in ("'", '"'):
+            # A doubled quote inside the literal escapes it and simply reopens the scan
+            end = sql.find(c, i + 1)
+            end = n if end == -1 else end + 1
+        elif c == "$" and (tag := _DOLLAR_TAG.match(sql, i)):
+            end = sql.find(tag.group(), tag.end())
+            end = n if end == -1 else end + len(tag.group())
+        else:
+            end = i + 1
+        current.append(sql[i:end])
+        i = end
+    statements.append("".join(current))
+    return [s.strip() for s in statements if s.strip()]
+
+
+def applied_migrations(cur) -> set:
+    cur.execute(
+        """
+        create table if not exists "_ScraperMigration" (
+          name text primary key,
+          "appliedAt" timestamptz not null default now()
+        )
+        """
+    )
+    cur.execute("select name from \"_ScraperMigration\"")
+    return {r[0] for r in cur.fetchall()}
+
+
+def apply_migration(cur, path: Path) -> None:
+    for stmt in split_statements(path.read_text(encoding="utf-8")):
+        cur.execute(stmt)
+
+
+def main(directory: Path = MIGRATIONS_DIR):
+    log = get_logger("migrate")
+    with get_conn() as conn, conn.cursor() as cur:
+        done = applied_migrations(cur)
+        pending = [p for p in sorted(directory.glob("*.sql")) if p.name not in done]
+        if not pending:
+            log.info("No pending migrations.")
+            return
+        for path in pending:
+            log.info(f"Applying {path.name}…")
+            apply_migration(cur, path)
+            cur.execute("insert into \"_ScraperMigration\" (name) values (%s)", (path.name,))
+    log.info(f"Applied {len(pending)} migration(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Content-addressed archive of fetched menu pages.
+
+Pages are stored gzip-compressed under PAGE_ARCHIVE_DIR/<aa>/<checksum>.html.gz,
+keyed by the sha256 of their UTF-8 body. That checksum goes into
+`Menu.checksum`, so identical pages are stored once and src/reextract.py can
+reprocess every menu offline.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+PAGE_ARCHIVE_DIR = Path(os.getenv("PAGE_ARCHIVE_DIR", "data/pages"))
+COMPRESS_LEVEL = 6
+
+
+def page_path(checksum: str) -> Path:
+    return PAGE_ARCHIVE_DIR / checksum[:2] / f"{checksum}.html.gz"
+
+
+def store_page(html: str) -> str:
+    """Archive `html` if it is not stored yet and return its checksum."""
+    body = html.encode("utf-8", errors="replace")
+    checksum = hashlib.sha256(body).hexdigest()
+    path = page_path(checksum)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        tmp.write_bytes(gzip.compress(body, COMPRESS_LEVEL))
+        os.replace(tmp, path)
+    return checksum
+
+
+def load_page(checksum: str) -> Optional[str]:
+    try:
+        return gzip.decompress(page_path(checksum).read_bytes()).decode("utf-8", errors="replace")
+    except (FileNotFoundError, OSError, EOFError):
+        return None
@@ -1,18 +1,280 @@
 import asyncio
-from src.seed_osm import main as seed_main
-from src.crawl_queue import main as crawl_main
-from src.extractor import main as extract_main
+import contextlib
+import os
+import time
+from collections import Counter, deque
+from typing import List, Optional, Tuple
+import aiohttp
+from src.crawl_queue import discover_menus
+from src.extractor import process_menu, refresh_aggregates
+from src.fetcher import download_menu_source
+from src.db import (
+    get_pooled_conn,
+    get_checkpoint,
+    save_checkpoint,
+    select_restaurants_needing_crawl,
+    select_menus_without_dishes,
+    select_menus_needing_download,
+    record_menu_downloads_bulk,
+)
+from src.config import UPDATE_MODE
+from src.sessions import client_session
 from src.log import get_logger
+from src.metrics import gauge, run_stage
 
-async def pipeline():
+CRAWL_STAGE = "pipeline.crawl"
+CRAWL_PAGE_SIZE = 500
+DOWNLOAD_FLUSH_SIZE = 100
+REPORT_INTERVAL_SECONDS = 30
+
+
+class _CrawlWatermark:
+    """Track which restaurant pages are fully crawled.
+
+    Restaurants finish out of order, so the resume cursor only moves past a
+    page once it and every page before it are done.
+    """
+
+    def __init__(self):
+        self._pages = deque()
+
+    def add_page(self, last_id, size: int) -> list:
+        page = [last_id, size]
+        self._pages.append(page)
+        return page
+
+    def done(self, page: list) -> Optional[str]:
+        """Mark one restaurant of `page` as done; return a new cursor if one is safe to save."""
+        page[1] -= 1
+        cursor = None
+        while self._pages and self._pages[0][1] == 0:
+            cursor = self._pages.popleft()[0]
+        return cursor
+
+
+class Pipeline:
+    """Streaming crawl -> extract / download pipeline.
+
+    Restaurants are paged from the DB into a bounded crawl queue. Every new menu
+    a crawl worker discovers goes straight to the extract queue (URL) or the
+    download queue (PDF/IMAGE), so dishes appear while the crawl is still
+    running. Each stage has its own workers, HTTP session and concurrency, and
+    bounded queues make a slow stage push back on the one before it.
+
+    Resuming after a crash: the crawl cursor is checkpointed in
+    "ScraperCheckpoint", and menus left unextracted or undownloaded by an
+    earlier run are queued again at startup.
+    """
+
+    def __init__(
+        self,
+        crawl_limit: int = 750000,
+        extract_backlog_limit: int = 100000,
+        download_backlog_limit: int = 100000,
+        crawl_concurrency: int = 6,
+        extract_concurrency: int = 8,
+        download_concurrency: int = 10,
+        queue_size: int = 1000,
+    ):
+        self.log = get_logger("pipeline")
+        self.crawl_limit = crawl_limit
+        self.extract_backlog_limit = extract_backlog_limit
+        self.download_backlog_limit = download_backlog_limit
+        self.crawl_concurrency = crawl_concurrency
+        self.extract_concurrency = extract_concurrency
+        self.download_concurrency = download_concurrency
+        self.crawl_q: asyncio.Queue = asyncio.Queue(queue_size)
+        self.extract_q: asyncio.Queue = asyncio.Queue(queue_size)
+        self.download_q: asyncio.Queue = asyncio.Queue(queue_size)
+        depth = gauge("pipeline_queue_depth", "Items waiting in each pipeline queue", ("queue",))
+        depth.set_function(self.crawl_q.qsize, queue="crawl")
+        depth.set_function(self.extract_q.qsize, queue="extract")
+        depth.set_function(self.download_q.qsize, queue="download")
+        self.watermark = _CrawlWatermark()
+        self.crawl_exhausted = False
+        self.counts: Counter = Counter()
+        self.touched: List[str] = []
+        self.pending_checksums: List[Tuple[str, str]] = []
+        self.started = time.monotonic()
+        self.first_dishes_after: Optional[float] = None
+
+    # -- producers ---------------------------------------------------------
+
+    async def produce_restaurants(self):
+        with get_pooled_conn() as conn, conn.cursor() as cur:
+            after = get_checkpoint(cur, CRAWL_STAGE)
+        if after:
+            self.log.info(f"Resuming crawl after restaurant {after}")
+        remaining = self.crawl_limit
+        while remaining > 0:
+            with get_pooled_conn() as conn, conn.cursor() as cur:
+                rows = select_restaurants_needing_crawl(
+                    cur, min(CRAWL_PAGE_SIZE, remaining), update_mode=UPDATE_MODE, after_id=after
+                )
+            if not rows:
+                self.crawl_exhausted = True
+                break
+            page = self.watermark.add_page(rows[-1][0], len(rows))
+            for row in rows:
+                await self.crawl_q.put((row, page))
+            after = rows[-1][0]
+            remaining -= len(rows)
+
+    async def feed(self, queue: asyncio.Queue, rows):
+        for row in rows:
+            await queue.put(tuple(row))
+
+    # -- workers -----------------------------------------------------------
+
+    async def crawl_worker(self, session: aiohttp.ClientSession):
+        while True:
+            row, page = await self.crawl_q.get()
+            try:
+                menus = await discover_menus(row, session=session)
+                self.counts["restaurants"] += 1
+                for menu_id, url, source_type, is_new in menus:
+                    if not is_new:
+                        continue
+                    self.counts["menus"] += 1
+                    if source_type == "URL":
+                        await self.extract_q.put((menu_id, row[0], url))
+                    else:
+                        await self.download_q.put((menu_id, url))
+            except Exception as e:
+                self.log.debug(f"crawl failed for {row[2]}: {e}")
+            finally:
+                cursor = self.watermark.done(page)
+                if cursor is not None:
+                    with get_pooled_conn() as conn, conn.cursor() as cur:
+                        save_checkpoint(cur, CRAWL_STAGE, cursor)
+                self.crawl_q.task_done()
+
+    async def extract_worker(self, session: aiohttp.ClientSession):
+        while True:
+            row = await self.extract_q.get()
+            try:
+                created, removed = await process_menu(row, session=session)
+                self.counts["extracted"] += 1
+                self.counts["dishes"] += created
+                self.counts["duplicates_merged"] += removed
+                if created:
+                    self.touched.append(row[0])
+                    if self.first_dishes_after is None:
+                        self.first_dishes_after = time.monotonic() - self.started
+                        self.log.info(f"First dishes stored {self.first_dishes_after:.1f}s after start")
+            except Exception as e:
+                self.log.debug(f"extract failed for menu {row[0]}: {e}")
+            finally:
+                self.extract_q.task_done()
+
+    async def download_worker(self, session: aiohttp.ClientSession):
+        while True:
+            menu_id, url = await self.download_q.get()
+            try:
+                res = await download_menu_source(menu_id, url, session=session)
+                if res is not None:
+                    self.counts["downloaded"] += 1
+                    self.pending_checksums.append((res[1], menu_id))
+                    if len(self.pending_checksums) >= DOWNLOAD_FLUSH_SIZE:
+                        self.flush_checksums()
+            except Exception as e:
+                self.log.debug(f"download failed for menu {menu_id} {url}: {e}")
+            finally:
+                self.download_q.task_done()
+
+    def flush_checksums(self):
+        updates, self.pending_checksums = self.pending_checksums, []
+        if updates:
+            with get_pooled_conn() as conn, conn.cursor() as cur:
+                record_menu_downloads_bulk(cur, updates)
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL_SECONDS)
+            c = self.counts
+            self.log.info(
+                f"restaurants={c['restaurants']} menus={c['menus']} extracted={c['extracted']} "
+                f"dishes={c['dishes']} downloaded={c['downloaded']} | queues crawl={self.crawl_q.qsize()} "
+                f"extract={self.extract_q.qsize()} download={self.download_q.qsize()}"
+            )
+
+    # -- orchestration -----------------------------------------------------
+
+    async def run(self):
+        # Snapshot leftovers from earlier runs before the crawl adds new menus,
+        # so nothing is queued twice.
+        with get_pooled_conn() as conn, conn.cursor() as cur:
+            extract_backlog = select_menus_without_dishes(cur, self.extract_backlog_limit)
+            download_backlog = select_menus_needing_download(
+                cur, self.download_backlog_limit, source_types=["PDF", "IMAGE"]
+            )
+        self.log.info(
+            f"Backlog: {len(extract_backlog)} menus to extract, {len(download_backlog)} to download"
+        )
+
+        workers: List[asyncio.Task] = []
+        async with contextlib.AsyncExitStack() as stack:
+            crawl_session = await stack.enter_async_context(client_session("crawl"))
+            extract_session = await stack.enter_async_context(client_session("extract"))
+            download_session = await stack.enter_async_context(client_session("download"))
+            workers += [asyncio.create_task(self.crawl_worker(crawl_session)) for _ in range(self.crawl_concurrency)]
+            workers += [asyncio.create_task(self.extract_worker(extract_session)) for _ in range(self.extract_concurrency)]
+            workers += [asyncio.create_task(self.download_worker(download_session)) for _ in range(self.download_concurrency)]
+            workers.append(asyncio.create_task(self.report()))
+            try:
+                await asyncio.gather(
+                    self.produce_restaurants(),
+                    self.feed(self.extract_q, extract_backlog),
+                    self.feed(self.download_q, download_backlog),
+                )
+                await self.crawl_q.join()
+                if self.crawl_exhausted:
+                    # Full pass done: the next run starts from the beginning again
+                    with get_pooled_conn() as conn, conn.cursor() as cur:
+                        save_checkpoint(cur, CRAWL_STAGE, None)
+                await self.extract_q.join()
+                await self.download_q.join()
+            finally:
+                for w in workers:
+                    w.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                self.flush_checksums()
+
+        refresh_aggregates(self.touched)
+        c = self.counts
+        self.log.info(
+            f"Pipeline done in {time.monotonic() - self.started:.0f}s: {c['restaurants']} restaurants crawled, "
+            f"{c['menus']} new menus, {c['dishes']} dishes from {c['extracted']} pages, {c['downloaded']} downloads."
+        )
+
+
+async def pipeline(seed: Optional[bool] = None, **options):
+    """Seed, then run the streaming pipeline.
+
+    Settings default to the environment; keyword arguments (Pipeline's
+    parameters) override them.
+    """
     log = get_logger("pipeline")
-    log.info("Seeding from OSM…")
-    await seed_main()
-    log.info("Discovering menu links…")
-    await crawl_main(limit=750000, concurrency=6)
-    log.info("Extracting dishes from HTML menus…")
-    await extract_main(concurrency=8, limit=1000000)
+    if seed is None:
+        seed = os.getenv("PIPELINE_SEED", "true").lower() in ("1", "true", "yes", "on")
+    if seed:
+        from src.seed_osm import main as seed_main
+
+        log.info("Seeding from OSM…")
+        await seed_main()
+    settings = dict(
+        crawl_limit=int(os.getenv("CRAWL_LIMIT", "750000")),
+        extract_backlog_limit=int(os.getenv("EXTRACT_LIMIT", "100000")),
+        download_backlog_limit=int(os.getenv("DOWNLOAD_LIMIT", "100000")),
+        crawl_concurrency=int(os.getenv("CRAWL_CONCURRENCY", "6")),
+        extract_concurrency=int(os.getenv("EXTRACT_CONCURRENCY", "8")),
+        download_concurrency=int(os.getenv("DOWNLOAD_CONCURRENCY", "10")),
+        queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", "1000")),
+    )
+    settings.update(options)
+    log.info("Running crawl, extraction and downloads…")
+    await Pipeline(**settings).run()
     log.info("Done.")
 
 if __name__ == "__main__":
-    asyncio.run(pipeline())
+    asyncio.run(run_stage("pipeline", pipeline()))
@@ -0,0 +1,223 @@
+"""Opt-in profiling for a stage run (PROFILE=1).
+
+Wraps a stage with:
+
+- cProfile for the thread running the stage (`.pstats` plus a text top list)
+- tracemalloc, sampled while the stage runs; the largest sample and the final
+  state are reported as top allocators
+- an event-loop lag monitor: a heartbeat task on the loop and a watchdog thread.
+  When the heartbeat stalls longer than PROFILE_LAG_MS, the watchdog logs the
+  loop thread's stack, i.e. the callback holding the loop. The watchdog also
+  samples that stack every PROFILE_SAMPLE_MS into collapsed stacks, which can
+  go straight into flamegraph.pl or speedscope.
+
+Reports go to PROFILE_DIR/<stage>-<timestamp>.*. When PROFILE is off,
+`profile` does nothing.
+"""
+import asyncio
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .log import get_logger
+
+PROFILE = os.getenv("PROFILE", "").lower() in ("1", "true", "yes", "on")
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "data/profiles"))
+PROFILE_LAG_MS = float(os.getenv("PROFILE_LAG_MS", "100"))
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "10"))
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1"))
+MEMORY_SAMPLE_SECONDS = 30
+HEARTBEAT_SECONDS = 0.02
+TOP_ALLOCATORS = 25
+TOP_FUNCTIONS = 50
+MAX_STALLS_REPORTED = 100
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{Path(code.co_filename).name}:{code.co_name}"
+
+
+def _collapsed(frame) -> str:
+    """Semicolon separated stack, root first (Brendan Gregg's collapsed format)."""
+    labels: List[str] = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class LoopLagMonitor:
+    """Detect and attribute event-loop stalls."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold_ms: float = PROFILE_LAG_MS, sample_ms: float = PROFILE_SAMPLE_MS):
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.threshold = threshold_ms / 1000
+        self.sample_interval = sample_ms / 1000
+        self.samples: Counter = Counter()
+        self.stalls: List[Dict] = []
+        self.stall_count = 0
+        self.max_lag = 0.0
+        self._last_beat = time.monotonic()
+        self._reported_beat: Optional[float] = None
+        self._stop = threading.Event()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._thread = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self.log = get_logger("profile")
+
+    def start(self) -> None:
+        self._heartbeat = self.loop.create_task(self._beat())
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        self._thread.join(timeout=1)
+
+    async def _beat(self):
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            # Anything past the requested sleep is time some callback held the loop
+            self.max_lag = max(self.max_lag, time.monotonic() - self._last_beat - HEARTBEAT_SECONDS)
+
+    def _watch(self):
+        while not self._stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                continue
+            self.samples[_collapsed(frame)] += 1
+            beat = self._last_beat
+            lag = time.monotonic() - beat
+            if lag >= self.threshold and beat != self._reported_beat:
+                # Report each stall once, with the stack as first seen
+                self._reported_beat = beat
+                self.stall_count += 1
+                stack = _collapsed(frame).split(";")
+                if len(self.stalls) < MAX_STALLS_REPORTED:
+                    self.stalls.append({"at": time.time(), "lag_ms_when_seen": round(lag * 1000, 1), "stack": stack})
+                self.log.warning(
+                    f"Event loop blocked for {lag * 1000:.0f}ms+ in {' <- '.join(reversed(stack[-6:]))}"
+                )
+
+    def report(self) -> Dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stall_count,
+            "stall_stacks": self.stalls,
+        }
+
+
+class _MemorySampler:
+    """Keep the tracemalloc snapshot taken at the highest traced memory seen."""
+
+    def __init__(self):
+        self.peak_traced = 0
+        self.peak_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tracemalloc-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self.sample()
+
+    def sample(self) -> None:
+        current, _peak = tracemalloc.get_traced_memory()
+        if current > self.peak_traced:
+            self.peak_traced = current
+            self.peak_snapshot = tracemalloc.take_snapshot()
+
+    def _run(self):
+        while not self._stop.wait(MEMORY_SAMPLE_SECONDS):
+            self.sample()
+
+
+def _top_allocators(snapshot: tracemalloc.Snapshot, limit: int = TOP_ALLOCATORS) -> List[str]:
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    return [str(stat) for stat in snapshot.statistics("lineno")[:limit]]
+
+
+def _write_reports(prefix: Path, prof: cProfile.Profile, sampler: _MemorySampler, monitor: Optional[LoopLagMonitor], duration: float) -> None:
+    prof.dump_stats(f"{prefix}.pstats")
+    text = io.StringIO()
+    pstats.Stats(prof, stream=text).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    Path(f"{prefix}-cpu.txt").write_text(text.getvalue())
+
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"traced current={current / 1e6:.1f}MB peak={peak / 1e6:.1f}MB", ""]
+    if sampler.peak_snapshot is not None:
+        lines += [f"Top allocators at largest sample ({sampler.peak_traced / 1e6:.1f}MB):"]
+        lines += _top_allocators(sampler.peak_snapshot) + [""]
+    lines += ["Top allocators at end:"] + _top_allocators(tracemalloc.take_snapshot())
+    Path(f"{prefix}-memory.txt").write_text("\n".join(lines) + "\n")
+
+    summary = {"duration_seconds": round(duration, 3), "traced_peak_bytes": peak}
+    if monitor is not None:
+        Path(f"{prefix}.collapsed").write_text(
+            "".join(f"{stack} {n}\n" for stack, n in monitor.samples.most_common())
+        )
+        summary["event_loop"] = monitor.report()
+    Path(f"{prefix}-summary.json").write_text(json.dumps(summary, indent=2))
+
+
+@contextlib.contextmanager
+def profile(stage: str, enabled: bool = PROFILE):
+    """Profile the enclosed block when enabled.
+
+    Enter it from inside the running event loop for async stages so the lag
+    monitor attaches to that loop; sync stages get CPU and memory reports only.
+    """
+    if not enabled:
+        yield
+        return
+    log = get_logger("profile")
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    prefix = PROFILE_DIR / f"{stage}-{time.strftime('%Y%m%d-%H%M%S')}"
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    sampler = _MemorySampler()
+    sampler.start()
+    monitor = LoopLagMonitor(loop) if loop is not None else None
+    if monitor:
+        monitor.start()
+    prof = cProfile.Profile()
+    t0 = time.perf_counter()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        duration = time.perf_counter() - t0
+        if monitor:
+            monitor.stop()
+        sampler.stop()
+        _write_reports(prefix, prof, sampler, monitor, duration)
+        if started_tracemalloc:
+            tracemalloc.stop()
+        log.info(f"Profile for {stage} written to {prefix}.*")
@@ -0,0 +1,207 @@
+"""Re-run dish extraction over archived menu pages.
+
+After the heuristics in src/dish_extractor.py change, this reprocesses every
+URL menu from its archived page (src/page_store.py) without touching the live
+sites. Pages are parsed in a process pool at CPU speed while the previous
+batch's differences are written. Per menu:
+
+- dishes with a new slug are inserted
+- dishes whose name, price, section or description changed are updated
+- dishes no longer found are deleted, unless someone has favorited them
+
+A menu for which the new heuristics find nothing keeps its dishes, since that
+is more likely a parser regression than an empty menu. Progress is
+checkpointed, so an interrupted run resumes, and the search index and
+aggregates are brought up to date.
+
+Menus extracted before pages were archived have no checksum yet, or one whose
+page is no longer in the archive. REEXTRACT_BACKFILL=<n> fetches and archives
+up to n of them first.
+"""
+import asyncio
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .aggregates import refresh_all
+from .db import (
+    apply_dish_changes,
+    get_checkpoint,
+    get_conn,
+    get_pooled_conn,
+    record_menu_downloads_bulk,
+    save_checkpoint,
+    select_archived_menus,
+    select_dishes_for_menus,
+    select_url_menus_for_archive,
+)
+from .dish_extractor import consolidate_dishes, fetch_html, heuristically_extract_dishes_from_html
+from .log import get_logger
+from .metrics import run_stage
+from .page_store import load_page, page_path, store_page
+from .profiling import profile
+from .search_index import index_menus
+from .sessions import client_session
+from .utils import slugify
+
+REEXTRACT_STAGE = "reextract"
+BATCH_SIZE = int(os.getenv("REEXTRACT_BATCH", "500"))
+WORKERS = int(os.getenv("REEXTRACT_WORKERS", str(os.cpu_count() or 2)))
+DRY_RUN = os.getenv("REEXTRACT_DRY_RUN", "false").lower() in ("1", "true", "yes", "on")
+BACKFILL_LIMIT = int(os.getenv("REEXTRACT_BACKFILL", "0"))
+BACKFILL_CONCURRENCY = int(os.getenv("CONCURRENCY", "8"))
+
+# slug -> (name, priceCents, section, description)
+DishRows = Dict[str, Tuple[str, Optional[int], str, Optional[str]]]
+
+
+def extract_archived(job: Tuple[str, str]) -> Tuple[str, Optional[DishRows]]:
+    """Process-pool worker: (menu_id, checksum) -> (menu_id, dishes by slug), None if the page is missing."""
+    menu_id, checksum = job
+    html = load_page(checksum)
+    if html is None:
+        return menu_id, None
+    dishes, _removed = consolidate_dishes(heuristically_extract_dishes_from_html(html))
+    rows: DishRows = {}
+    for d in dishes:
+        # Same slug twice: the later one wins, as with upsert_dish in the extractor
+        rows[slugify(d["name"])] = (d["name"], d.get("price_cents"), d.get("section") or "Overig", d.get("description"))
+    return menu_id, rows
+
+
+def diff_menu(menu_id: str, existing: Dict[str, tuple], new: DishRows, counts: Counter):
+    """Differences for one menu as (inserts, updates, deletes) for apply_dish_changes."""
+    inserts, updates, deletes = [], [], []
+    for slug, (name, price, section, description) in new.items():
+        old = existing.get(slug)
+        if old is None:
+            inserts.append((menu_id, name, slug, description, price, section))
+        elif (old[1], old[2], old[3], old[4]) != (name, price, section, description):
+            updates.append((name, description, price, section, old[0]))
+    for slug, old in existing.items():
+        if slug not in new:
+            if old[5]:
+                counts["kept_favorites"] += 1
+            else:
+                deletes.append(old[0])
+    return inserts, updates, deletes
+
+
+def write_batch(conn, results: List[Tuple[str, Optional[DishRows]]], counts: Counter, dry_run: bool) -> List[str]:
+    """Diff and write one batch of extraction results; returns the changed menu ids."""
+    with conn.cursor() as cur:
+        found = {menu_id: rows for menu_id, rows in results if rows is not None}
+        counts["missing_pages"] += len(results) - len(found)
+        existing: Dict[str, Dict[str, tuple]] = {menu_id: {} for menu_id in found}
+        for dish_id, menu_id, slug, name, price, section, description, favorited in select_dishes_for_menus(cur, found):
+            existing[menu_id][slug] = (dish_id, name, price, section, description, favorited)
+
+        inserts, updates, deletes, changed = [], [], [], []
+        for menu_id, rows in found.items():
+            counts["menus"] += 1
+            if not rows:
+                counts["emptied_skipped" if existing[menu_id] else "empty"] += 1
+                continue
+            ins, upd, dels = diff_menu(menu_id, existing[menu_id], rows, counts)
+            if ins or upd or dels:
+                changed.append(menu_id)
+                inserts += ins
+                updates += upd
+                deletes += dels
+            else:
+                counts["unchanged"] += 1
+        counts["inserted"] += len(inserts)
+        counts["updated"] += len(updates)
+        if dry_run or not changed:
+            counts["deleted"] += len(deletes)
+            return changed
+        with conn.transaction():
+            counts["deleted"] += apply_dish_changes(cur, inserts, updates, deletes)
+            index_menus(cur, changed)
+    return changed
+
+
+def reextract(conn, pool: ProcessPoolExecutor, batch_size: int = BATCH_SIZE, dry_run: bool = DRY_RUN) -> Counter:
+    log = get_logger("reextract")
+    counts: Counter = Counter()
+    with conn.cursor() as cur:
+        after = None if dry_run else get_checkpoint(cur, REEXTRACT_STAGE)
+        if after:
+            log.info(f"Resuming re-extraction after menu {after}")
+        jobs = select_archived_menus(cur, after, batch_size)
+        pending = [pool.submit(extract_archived, j) for j in jobs]
+        while jobs:
+            # Queue the next batch so workers parse while this one is written
+            next_jobs = select_archived_menus(cur, jobs[-1][0], batch_size)
+            next_pending = [pool.submit(extract_archived, j) for j in next_jobs]
+            changed = write_batch(conn, [f.result() for f in pending], counts, dry_run)
+            counts["changed_menus"] += len(changed)
+            if not dry_run:
+                save_checkpoint(cur, REEXTRACT_STAGE, jobs[-1][0])
+            log.info(
+                f"{counts['menus']} menus: +{counts['inserted']} ~{counts['updated']} -{counts['deleted']} dishes"
+            )
+            jobs, pending = next_jobs, next_pending
+        if not dry_run:
+            save_checkpoint(cur, REEXTRACT_STAGE, None)
+    return counts
+
+
+async def backfill(limit: int, concurrency: int = BACKFILL_CONCURRENCY) -> int:
+    """Fetch and archive pages of URL menus whose page is not in the archive."""
+    log = get_logger("reextract")
+    rows: List[Tuple[str, str]] = []
+    after = None
+    with get_conn() as conn, conn.cursor() as cur:
+        while len(rows) < limit:
+            page = select_url_menus_for_archive(cur, after, BATCH_SIZE)
+            if not page:
+                break
+            for menu_id, url, checksum in page:
+                if not checksum or not page_path(checksum).exists():
+                    rows.append((menu_id, url))
+            after = page[-1][0]
+    rows = rows[:limit]
+    log.info(f"Archiving {len(rows)} menu pages with concurrency={concurrency}")
+    sem = asyncio.Semaphore(concurrency)
+    updates: List[Tuple[str, str]] = []
+
+    async with client_session("reextract") as session:
+        async def worker(row):
+            menu_id, url = row
+            async with sem:
+                html = await fetch_html(session, url)
+            if html:
+                updates.append((await asyncio.to_thread(store_page, html), menu_id))
+
+        await asyncio.gather(*(worker(r) for r in rows))
+    with get_pooled_conn() as conn, conn.cursor() as cur:
+        record_menu_downloads_bulk(cur, updates)
+    log.info(f"Archived {len(updates)} pages.")
+    return len(updates)
+
+
+def main(batch_size: int = BATCH_SIZE, workers: int = WORKERS, dry_run: bool = DRY_RUN, backfill_limit: int = BACKFILL_LIMIT):
+    log = get_logger("reextract")
+    if backfill_limit:
+        asyncio.run(run_stage("reextract-backfill", backfill(backfill_limit)))
+    # Spawned workers don't inherit the open DB connection
+    ctx = multiprocessing.get_context("spawn")
+    with profile("reextract"), ProcessPoolExecutor(workers, mp_context=ctx) as pool, get_conn() as conn:
+        counts = reextract(conn, pool, batch_size=batch_size, dry_run=dry_run)
+        if counts["changed_menus"] and not dry_run:
+            # Deleted dishes can drop slugs from the popularity tables, so rebuild rather than patch
+            refresh_all(conn)
+    log.info(
+        f"{'Dry run: ' if dry_run else ''}re-extracted {counts['menus']} menus, {counts['changed_menus']} changed, "
+        f"{counts['unchanged']} unchanged; dishes +{counts['inserted']} ~{counts['updated']} -{counts['deleted']}, "
+        f"{counts['kept_favorites']} favorited kept, {counts['emptied_skipped']} menus left alone (nothing extracted), "
+        f"{counts['missing_pages']} pages missing from the archive."
+    )
+    return counts
+
+
+if __name__ == "__main__":
+    main()
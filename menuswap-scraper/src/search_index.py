@@ -0,0 +1,188 @@
+"""Maintain the denormalized "DishSearch" / "RestaurantSearch" tables.
+
+The extractor calls `index_menus` for every menu it writes and seeding
+re-indexes restaurants that are new, renamed or moved, so the index is
+refreshed incrementally. Menu approval and restaurant verification happen in
+the app; triggers copy them into the index
+(sql/migrations/009_search_filters.sql). Running this module directly
+rebuilds it from scratch.
+"""
+from typing import Iterable, List, Optional
+
+from .db import get_conn
+from .log import get_logger
+from .profiling import profile
+from .utils import normalize_text
+
+MAX_DESCRIPTION_CHARS = 500
+
+_DISH_COLUMNS = (
+    '"dishId", "menuId", "restaurantId", name, slug, section, "priceCents", '
+    'city, "cityNorm", "restaurantName", "nameNorm", "searchText", tokens, '
+    'status, tags, "restaurantVerified"'
+)
+
+
+def dish_search_row(
+    dish_id, menu_id, restaurant_id, name, slug, section, price_cents, description, tags,
+    status, restaurant_name, city, verified,
+):
+    """Build one "DishSearch" row with accent-folded name, search text and tokens."""
+    name_norm = normalize_text(name)
+    tags = tags or []
+    search_text = normalize_text(" ".join([
+        name or "",
+        section or "",
+        (description or "")[:MAX_DESCRIPTION_CHARS],
+        " ".join(tags),
+        restaurant_name or "",
+        city or "",
+    ]))
+    tokens = sorted(set(search_text.split()))
+    return (
+        dish_id, menu_id, restaurant_id, name, slug, section, price_cents,
+        city, normalize_text(city), restaurant_name, name_norm, search_text, tokens,
+        status, tags, verified,
+    )
+
+
+def index_menus(cur, menu_ids: Iterable[str]) -> int:
+    """Replace the "DishSearch" rows of the given menus. Returns rows written.
+
+    Callers should run this inside a transaction so searches never see a
+    menu half re-indexed.
+    """
+    menu_ids = list(menu_ids)
+    if not menu_ids:
+        return 0
+    cur.execute("delete from \"DishSearch\" where \"menuId\" = any(%s::uuid[])", (menu_ids,))
+    cur.execute(
+        """
+        select d.id, d."menuId", r.id, d.name, d.slug, d.section, d."priceCents", d.description, d.tags,
+               m.status, r.name, r.city, r.verified
+        from "Dish" d
+        join "Menu" m on m.id = d."menuId"
+        join "Restaurant" r on r.id = m."restaurantId"
+        where d."menuId" = any(%s::uuid[])
+        """,
+        (menu_ids,),
+    )
+    rows = cur.fetchall()
+    with cur.copy(f"copy \"DishSearch\" ({_DISH_COLUMNS}) from stdin") as copy:
+        for r in rows:
+            copy.write_row(dish_search_row(*r))
+    index_restaurants(cur, {r[2] for r in rows})
+    return len(rows)
+
+
+def index_restaurants(cur, restaurant_ids: Optional[Iterable[str]] = None) -> None:
+    """Upsert "RestaurantSearch" rows, for all restaurants when restaurant_ids is None."""
+    where = ""
+    params = ()
+    if restaurant_ids is not None:
+        restaurant_ids = list(restaurant_ids)
+        if not restaurant_ids:
+            return
+        where = "where r.id = any(%s::uuid[])"
+        params = (restaurant_ids,)
+    cur.execute(
+        f"""
+        select r.id, r.name, r.slug, r.city, r.address, r.verified,
+               (select count(*) from "Dish" d join "Menu" m on m.id = d."menuId" where m."restaurantId" = r.id)
+        from "Restaurant" r
+        {where}
+        """,
+        params,
+    )
+    rows = [
+        (
+            rid, name, slug, city, normalize_text(city), normalize_text(name),
+            normalize_text(" ".join([name or "", city or "", address or ""])), verified, dish_count,
+        )
+        for rid, name, slug, city, address, verified, dish_count in cur.fetchall()
+    ]
+    if not rows:
+        return
+    cur.executemany(
+        """
+        insert into "RestaurantSearch" ("restaurantId", name, slug, city, "cityNorm", "nameNorm", "searchText", verified, "dishCount", "updatedAt")
+        values (%s,%s,%s,%s,%s,%s,%s,%s,%s, now())
+        on conflict ("restaurantId") do update set
+          name=excluded.name,
+          slug=excluded.slug,
+          city=excluded.city,
+          "cityNorm"=excluded."cityNorm",
+          "nameNorm"=excluded."nameNorm",
+          "searchText"=excluded."searchText",
+          verified=excluded.verified,
+          "dishCount"=excluded."dishCount",
+          "updatedAt"=now()
+        """,
+        rows,
+    )
+
+
+def reindex_restaurants(cur, restaurant_ids: Iterable[str]) -> int:
+    """Re-index restaurants together with their dishes, which carry the
+    restaurant's name and city. Returns dish rows written."""
+    restaurant_ids = list(restaurant_ids)
+    if not restaurant_ids:
+        return 0
+    cur.execute(
+        """
+        select distinct d."menuId"
+        from "Dish" d
+        join "Menu" m on m.id = d."menuId"
+        where m."restaurantId" = any(%s::uuid[])
+        """,
+        (restaurant_ids,),
+    )
+    total = index_menus(cur, [r[0] for r in cur.fetchall()])
+    index_restaurants(cur, restaurant_ids)
+    return total
+
+
+def select_indexed_menu_batch(cur, after_id: Optional[str], limit: int) -> List[str]:
+    """Next batch of menu ids that have dishes, in id order after `after_id`."""
+    if after_id is None:
+        cur.execute(
+            "select distinct \"menuId\" from \"Dish\" order by \"menuId\" limit %s",
+            (limit,),
+        )
+    else:
+        cur.execute(
+            "select distinct \"menuId\" from \"Dish\" where \"menuId\" > %s order by \"menuId\" limit %s",
+            (after_id, limit),
+        )
+    return [r[0] for r in cur.fetchall()]
+
+
+def rebuild(conn, batch_size: int = 500) -> int:
+    log = get_logger("search")
+    total = 0
+    after = None
+    with conn.cursor() as cur:
+        # Rows are replaced menu by menu (deleted dishes cascade), so search
+        # keeps working while the rebuild runs.
+        while True:
+            menu_ids = select_indexed_menu_batch(cur, after, batch_size)
+            if not menu_ids:
+                break
+            with conn.transaction():
+                total += index_menus(cur, menu_ids)
+            after = menu_ids[-1]
+            log.info(f"Indexed {total} dishes so far…")
+        index_restaurants(cur)
+    return total
+
+
+def main():
+    log = get_logger("search")
+    with get_conn() as conn:
+        total = rebuild(conn)
+    log.info(f"Search index rebuilt with {total} dishes.")
+
+
+if __name__ == "__main__":
+    with profile("search"):
+        main()
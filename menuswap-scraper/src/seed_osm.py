@@ -1,8 +1,12 @@
-import aiohttp, asyncio, json
+import asyncio, json
 from .log import get_logger
-from .config import OVERPASS_URL, USER_AGENT
+from .metrics import run_stage
+from .config import OVERPASS_URL
+from .sessions import client_session
 from .db import get_conn, upsert_restaurant, upsert_restaurants_bulk
 from .models import SeedRestaurant
+from .search_index import index_restaurants, reindex_restaurants
+from .aggregates import refresh_for_restaurants
 
 # Overpass: NL restaurants/cafes with website if present
 QUERY = """
@@ -17,7 +21,7 @@ out center tags;
 """
 
 async def fetch_overpass():
-    async with aiohttp.ClientSession(headers={"User-Agent": USER_AGENT}) as s:
+    async with client_session("seed") as s:
         async with s.post(OVERPASS_URL, data={"data": QUERY}) as r:
             r.raise_for_status()
             return await r.json()
@@ -50,8 +54,34 @@ async def main():
     log.info(f"Found {len(items)} venues")
     with get_conn() as conn, conn.cursor() as cur:
         log.info("Upserting restaurants in bulk…")
-        upsert_restaurants_bulk(cur, items, batch_size=1000)
+        upserted = upsert_restaurants_bulk(cur, items, batch_size=1000)
+    refresh_search_index(upserted)
+    refresh_aggregates(upserted)
     log.info("Seed complete.")
 
+def refresh_search_index(upserted):
+    """Index new restaurants, and re-index renamed or moved ones with their dishes."""
+    log = get_logger("seed")
+    new = [rid for rid, _city, previous_city, changed, _verified in upserted if changed and previous_city is None]
+    moved = [rid for rid, _city, previous_city, changed, _verified in upserted if changed and previous_city is not None]
+    if not new and not moved:
+        return
+    log.info(f"Indexing {len(new)} new and {len(moved)} renamed or moved restaurants for search…")
+    try:
+        with get_conn() as conn, conn.transaction(), conn.cursor() as cur:
+            index_restaurants(cur, new)
+            reindex_restaurants(cur, moved)
+    except Exception as e:
+        log.warning(f"Search index refresh failed (run `python -m src.migrate`?): {e}")
+
+def refresh_aggregates(upserted):
+    """Bring "CityStats" up to date with new cities and moved restaurants."""
+    log = get_logger("seed")
+    try:
+        with get_conn() as conn:
+            refresh_for_restaurants(conn, upserted)
+    except Exception as e:
+        log.warning(f"Aggregate refresh failed (run `python -m src.migrate`?): {e}")
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(run_stage("seed", main()))
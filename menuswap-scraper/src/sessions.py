@@ -0,0 +1,35 @@
+from typing import Callable, Optional
+
+import aiohttp
+from .config import USER_AGENT
+from .metrics import http_trace_config
+
+# Test harnesses (src/bench/farm.py) redirect every stage's traffic by
+# installing a connector factory, e.g. one with a resolver that maps
+# synthetic hostnames to a local server.
+_connector_factory: Optional[Callable[[], aiohttp.BaseConnector]] = None
+_trace_config_factory: Optional[Callable[[str], aiohttp.TraceConfig]] = None
+
+
+def configure_sessions(
+    connector_factory: Optional[Callable[[], aiohttp.BaseConnector]] = None,
+    trace_config_factory: Optional[Callable[[str], aiohttp.TraceConfig]] = None,
+) -> None:
+    """Override how client_session connects and add a per-stage TraceConfig.
+
+    Call with no arguments to reset.
+    """
+    global _connector_factory, _trace_config_factory
+    _connector_factory = connector_factory
+    _trace_config_factory = trace_config_factory
+
+
+def client_session(stage: str, **kwargs) -> aiohttp.ClientSession:
+    """ClientSession with the bot User-Agent and per-stage HTTP metrics."""
+    headers = {"User-Agent": USER_AGENT, **kwargs.pop("headers", {})}
+    if _connector_factory is not None and "connector" not in kwargs:
+        kwargs["connector"] = _connector_factory()
+    trace_configs = [http_trace_config(stage), *kwargs.pop("trace_configs", [])]
+    if _trace_config_factory is not None:
+        trace_configs.append(_trace_config_factory(stage))
+    return aiohttp.ClientSession(headers=headers, trace_configs=trace_configs, **kwargs)
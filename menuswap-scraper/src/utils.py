@@ -1,10 +1,17 @@
 import re
+import unicodedata
 from urllib.parse import urljoin
 
 PRICE_RE = re.compile(r"(€\s?\d{1,3}([.,]\d{2})?)")
 PDF_RE = re.compile(r"\.pdf($|\?)", re.I)
 IMAGE_RE = re.compile(r"\.(png|jpe?g|webp)($|\?)", re.I)
 SLUG_BAD_CHARS_RE = re.compile(r"[^a-z0-9-]+")
+NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+# Filler words that don't distinguish one dish from another
+DISH_STOPWORDS = frozenset([
+    "met","en","of","de","het","een","van","op","in","uit","la","le","a","al","aux","with","and",
+])
 
 def normalize_url(base, href):
     try:
@@ -43,6 +50,21 @@ def slugify(value: str) -> str:
     s = re.sub(r"-+", "-", s).strip("-")
     return s
 
+def normalize_text(value: str) -> str:
+    """Lowercase, strip accents and collapse everything but letters/digits to single spaces.
+
+    "Crème brûlée + Koffie" -> "creme brulee koffie"
+    """
+    if not value:
+        return ""
+    s = unicodedata.normalize("NFKD", value.lower())
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    return NON_ALNUM_RE.sub(" ", s).strip()
+
+def dish_name_tokens(value: str) -> list:
+    """Normalized tokens of a dish name without filler words."""
+    return [t for t in normalize_text(value).split() if t not in DISH_STOPWORDS]
+
 def price_string_to_cents(price_str: str) -> int:
     """Convert a euro price string (e.g. "€ 9,50" or "9.50") to integer cents.
 
@@ -0,0 +1,18 @@
+import numpy as np
+
+from src.aggregates import histogram_percentiles
+
+
+def test_matches_percentile_cont_over_the_expanded_prices():
+    histogram = [(250, 1), (350, 3), (500, 2), (1250, 1)]
+    prices = [price for price, n in histogram for _ in range(n)]
+    expected = [round(float(np.percentile(prices, f * 100))) for f in (0.25, 0.5, 0.75, 0.9)]
+    assert histogram_percentiles(histogram) == expected
+
+
+def test_interpolates_between_neighbouring_prices():
+    assert histogram_percentiles([(250, 1), (350, 1)]) == [275, 300, 325, 340]
+
+
+def test_single_price():
+    assert histogram_percentiles([(900, 4)], (0.0, 0.5, 1.0)) == [900, 900, 900]
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from src.dish_catalog import blocking_key, cluster_block, normalized_dish_name, parse_watermark
+
+
+def test_spelling_variants_share_a_signature_and_block():
+    norms = [normalized_dish_name(n) for n in ("Biefstuk met friet", "BIEFSTUK friet", "Biefstukje + friet")]
+    assert norms[0] == norms[1] == "biefstuk friet"
+    assert {blocking_key(n) for n in norms} == {"bief"}
+    assert blocking_key("") == ""
+
+
+def test_new_names_cluster_around_the_first_of_each_group():
+    assignments, created = cluster_block(["biefstuk friet", "tomatensoep", "biefstukje friet"], [])
+    assert created == [0, 1]
+    assert [a[0] for a in assignments] == [0, 1, 0]
+    assert assignments[0][1] == 100.0
+    assert 88 <= assignments[2][1] < 100
+
+
+def test_existing_canonicals_are_matched_first():
+    assignments, created = cluster_block(["biefstukje friet", "stoofvlees"], ["biefstuk friet"])
+    assert assignments[0][0] == 0
+    # New canonicals are numbered after the existing ones
+    assert assignments[1] == (1, 100.0)
+    assert created == [1]
+
+
+def test_names_below_the_threshold_stay_apart():
+    assignments, created = cluster_block(["saté kip", "saté varken"], [], threshold=95)
+    assert created == [0, 1]
+    assert [a[0] for a in assignments] == [0, 1]
+
+
+def test_later_chunks_reuse_canonicals_created_by_earlier_chunks():
+    assignments, created = cluster_block(["patat", "kroket", "patat"], [], chunk_size=1)
+    assert created == [0, 1]
+    assert [a[0] for a in assignments] == [0, 1, 0]
+
+
+def test_parse_watermark():
+    assert parse_watermark(None) is None
+    assert parse_watermark("2026-01-02T03:04:05.678000|abc") == (datetime(2026, 1, 2, 3, 4, 5, 678000), "abc")
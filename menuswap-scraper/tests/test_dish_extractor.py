@@ -0,0 +1,53 @@
+from src.dish_extractor import consolidate_dishes
+
+
+def test_merges_spelling_variants_and_keeps_the_known_price():
+    dishes, removed = consolidate_dishes([
+        {"name": "Kipsaté", "price_cents": None},
+        {"name": "kipsate", "price_cents": 1450},
+    ])
+    assert removed == 1
+    assert dishes == [{"name": "Kipsaté", "price_cents": 1450}]
+
+
+def test_folds_a_glued_on_description_into_the_short_name():
+    dishes, removed = consolidate_dishes([
+        {"name": "Biefstuk met friet", "price_cents": 1850, "section": "Overig"},
+        {
+            "name": "Biefstuk mals gebakken met friet en salade",
+            "price_cents": None,
+            "section": "Hoofdgerechten",
+            "description": "mals gebakken",
+        },
+    ])
+    assert removed == 1
+    assert dishes == [{
+        "name": "Biefstuk met friet",
+        "price_cents": 1850,
+        "section": "Hoofdgerechten",
+        "description": "mals gebakken",
+    }]
+
+
+def test_keeps_a_more_specific_dish_apart():
+    dishes, removed = consolidate_dishes([
+        {"name": "Pizza", "price_cents": None},
+        {"name": "Pizza salami", "price_cents": None},
+    ])
+    assert removed == 0
+    assert len(dishes) == 2
+
+
+def test_keeps_different_prices_apart():
+    _dishes, removed = consolidate_dishes([
+        {"name": "Tomatensoep", "price_cents": 650},
+        {"name": "Tomatensoep", "price_cents": 750},
+    ])
+    assert removed == 0
+
+
+def test_keeps_names_that_differ_only_in_a_number_apart():
+    for a, b in (("Lunchmenu 2 gangen", "Lunchmenu 3 gangen"), ("Pizza 12", "Pizza 13"), ("Menu 1", "Menu 2")):
+        dishes, removed = consolidate_dishes([{"name": a, "price_cents": None}, {"name": b, "price_cents": None}])
+        assert removed == 0, (a, b)
+        assert [d["name"] for d in dishes] == [a, b]
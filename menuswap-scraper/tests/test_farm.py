@@ -0,0 +1,37 @@
+import random
+import statistics
+
+import pytest
+
+from src.bench.farm import latency_sampler
+
+
+def _samples(spec, n=2000):
+    sample = latency_sampler(spec)
+    rng = random.Random(1)
+    return [sample(rng) for _ in range(n)]
+
+
+def test_fixed_and_uniform_are_in_seconds():
+    assert set(_samples("fixed:40", 10)) == {0.04}
+    samples = _samples("uniform:20:80")
+    assert 0.02 <= min(samples) and max(samples) <= 0.08
+
+
+def test_lognormal_median():
+    assert statistics.median(_samples("lognormal:50:0.6")) == pytest.approx(0.05, rel=0.1)
+
+
+def test_pareto_has_a_floor_and_a_tail():
+    samples = _samples("pareto:20:1.5")
+    assert min(samples) >= 0.02
+    assert max(samples) > 10 * statistics.median(samples)
+
+
+def test_same_seed_same_samples():
+    assert _samples("lognormal:50:0.6", 50) == _samples("lognormal:50:0.6", 50)
+
+
+def test_unknown_distribution():
+    with pytest.raises(ValueError, match="Unknown latency distribution"):
+        latency_sampler("gamma:1:2")
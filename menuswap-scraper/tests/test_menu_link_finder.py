@@ -0,0 +1,31 @@
+from src.menu_link_finder import MAX_TEXT_CHARS, parse_links_and_text
+
+
+def test_collects_anchors_and_visible_text():
+    html = """
+    <html><head><title>Eetcafé</title><style>a { color: red }</style></head>
+    <body>
+      <nav><a href="/menukaart">Onze <b>menu</b>kaart</a> <a href="/contact">Contact</a></nav>
+      <script>var menu = "/geheim";</script>
+      <p>Welkom bij ons café</p>
+      <a>zonder href</a>
+    </body></html>
+    """
+    links, text = parse_links_and_text(html)
+    assert links == [("/menukaart", "Onze menukaart"), ("/contact", "Contact")]
+    assert "Welkom bij ons café" in text
+    assert "Onze" in text and "zonder href" in text
+    for hidden in ("Eetcafé", "color", "geheim"):
+        assert hidden not in text
+
+
+def test_text_is_capped():
+    _links, text = parse_links_and_text("<p>" + "menu " * MAX_TEXT_CHARS + "</p>")
+    assert len(text) == MAX_TEXT_CHARS
+
+
+def test_recovers_from_broken_markup():
+    links, text = parse_links_and_text("<div><a href='/kaart'>Kaart<p>Lunch</div>")
+    assert links and links[0][0] == "/kaart"
+    assert "Lunch" in text
+    assert parse_links_and_text("") == ([], "")
@@ -0,0 +1,53 @@
+from src import metrics
+from src.metrics import Registry, write_textfile
+
+
+def test_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.counter("http_requests_total", "HTTP requests", ("stage", "status"))
+    requests.inc(stage="fetch", status=200)
+    requests.inc(2, stage="fetch", status=200)
+    queue = registry.gauge("queue_size", "Items queued")
+    queue.set_function(lambda: 7)
+    latency = registry.histogram("latency_seconds", "Latency", ("stage",), buckets=(0.1, 1.0))
+    latency.observe(0.05, stage="fetch")
+    latency.observe(0.5, stage="fetch")
+    latency.observe(2.5, stage="fetch")
+
+    assert registry.render().splitlines() == [
+        "# HELP http_requests_total HTTP requests",
+        "# TYPE http_requests_total counter",
+        'http_requests_total{stage="fetch",status="200"} 3',
+        "# HELP queue_size Items queued",
+        "# TYPE queue_size gauge",
+        "queue_size 7",
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="fetch",le="0.1"} 1',
+        'latency_seconds_bucket{stage="fetch",le="1"} 2',
+        'latency_seconds_bucket{stage="fetch",le="+Inf"} 3',
+        'latency_seconds_sum{stage="fetch"} 3.05',
+        'latency_seconds_count{stage="fetch"} 3',
+    ]
+
+
+def test_escapes_label_values():
+    registry = Registry()
+    registry.counter("errors_total", "Errors", ("error",)).inc(error='bad "quote"\\n')
+    assert 'errors_total{error="bad \\"quote\\"\\\\n"} 1' in registry.render()
+
+
+def test_failing_gauge_function_is_skipped():
+    registry = Registry()
+    registry.gauge("broken", "Raises").set_function(lambda: 1 / 0)
+    assert registry.render() == "# HELP broken Raises\n# TYPE broken gauge\n"
+
+
+def test_write_textfile(tmp_path, monkeypatch):
+    registry = Registry()
+    registry.counter("pages_total", "Pages").inc()
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    path = tmp_path / "metrics" / "scraper.prom"
+    write_textfile(str(path))
+    assert path.read_text() == registry.render()
+    assert not path.with_suffix(".prom.tmp").exists()
@@ -0,0 +1,39 @@
+from src.migrate import MIGRATIONS_DIR, split_statements
+
+
+def test_splits_on_semicolons_and_drops_comments():
+    sql = """
+    -- leading comment; with a semicolon
+    create table a (id int);
+    /* block; comment */
+    create index concurrently if not exists a_idx on a (id); -- trailing
+    """
+    assert split_statements(sql) == [
+        "create table a (id int)",
+        "create index concurrently if not exists a_idx on a (id)",
+    ]
+
+
+def test_keeps_semicolons_inside_quotes():
+    sql = """insert into t values ('a;b', 'it''s; fine'); select "odd;name" from t;"""
+    assert split_statements(sql) == [
+        "insert into t values ('a;b', 'it''s; fine')",
+        'select "odd;name" from t',
+    ]
+
+
+def test_keeps_dollar_quoted_bodies_whole():
+    body = "create function f() returns trigger as $fn$ begin new.x := 1; return new; end $fn$ language plpgsql"
+    sql = f"{body};\ndo $$ begin perform 1; end $$;"
+    assert split_statements(sql) == [body, "do $$ begin perform 1; end $$"]
+
+
+def test_dollar_inside_identifier_is_not_a_quote():
+    assert split_statements("select a$b$c from t; select 1") == ["select a$b$c from t", "select 1"]
+
+
+def test_every_migration_splits_into_statements():
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        statements = split_statements(path.read_text(encoding="utf-8"))
+        assert statements, path.name
+        assert all(not s.startswith("--") for s in statements), path.name
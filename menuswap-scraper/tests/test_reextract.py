@@ -0,0 +1,32 @@
+from collections import Counter
+
+from src.reextract import diff_menu
+
+MENU = "m1"
+# slug -> (dishId, name, priceCents, section, description, favorited)
+EXISTING = {
+    "kroket": ("d1", "Kroket", 450, "Snacks", None, False),
+    "patat": ("d2", "Patat", 350, "Snacks", None, False),
+    "tosti": ("d3", "Tosti", 550, "Lunch", None, False),
+    "soep": ("d4", "Soep", 650, "Voorgerechten", None, True),
+}
+
+
+def test_inserts_updates_and_deletes():
+    counts = Counter()
+    new = {
+        "kroket": ("Kroket", 450, "Snacks", None),
+        "patat": ("Patat", 375, "Snacks", "met mayonaise"),
+        "bitterballen": ("Bitterballen", 795, "Borrel", None),
+    }
+    inserts, updates, deletes = diff_menu(MENU, EXISTING, new, counts)
+    assert inserts == [(MENU, "Bitterballen", "bitterballen", None, 795, "Borrel")]
+    assert updates == [("Patat", "met mayonaise", 375, "Snacks", "d2")]
+    # The favorited soup is kept even though it is gone from the page
+    assert deletes == ["d3"]
+    assert counts == Counter(kept_favorites=1)
+
+
+def test_unchanged_menu_has_no_changes():
+    new = {slug: row[1:5] for slug, row in EXISTING.items()}
+    assert diff_menu(MENU, EXISTING, new, Counter()) == ([], [], [])